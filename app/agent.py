@@ -1,48 +1,147 @@
+import asyncio
+import logging
 import os
+import time
+from dataclasses import dataclass
+from typing import Callable
 import chess
-from dotenv import load_dotenv
-from app.llm import LLMManager
+from app import events
+from app.cache import MoveCache, ResponseT
+from app.chess_helper import normalize_move
+from app.llm import LLMManager, LLMUsage
+from app.llm_resilience import LLMError
 from app.llm_resource import (
     AnalysisLLMChessMove,
     Decision,
     DecisionOptions,
     BaseLLMChessMove,
+    MoveSelection,
+    for_side,
 )
+from app.metrics import (
+    AGENT_MOVE_ITERATIONS,
+    AGENT_MOVE_REPAIRS,
+    AGENT_TURN_FALLBACKS,
+    StageTimings,
+    timed_stage,
+)
+from app.move_schema import MoveSchemaFactory
+from app.ponder import Ponderer
+from app.prompt_builder import BuiltPrompt, PromptBuilder
 from app.prompts import (
-    BASE_MOVE_PROMPT,
-    SYSTEM_PROMPT,
     ORCHESTRATION_USER_PROMPT,
     CONSIDER_NEW_MOVE_USER_PROMPT,
     DECIDE_ON_MOVE_USER_PROMPT,
+    FAN_OUT_CANDIDATE_USER_PROMPT,
+    REPAIR_MOVE_USER_PROMPT,
+    SELECT_MOVE_USER_PROMPT,
+    TACTICS_PROMPT,
 )
-from langfuse import observe, get_client
+from app.resource import AgentEventType, AgentStrategy
+from app.tactics import TacticalAnalyser, rank_moves
+from app.tracing import MemorySnapshot, tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TURN_BUDGET = 90.0
+
+
+class AgentMoveError(RuntimeError):
+    """The agent could not come up with a move, e.g. because its turn budget ran out before any analysis."""
 
-load_dotenv("secrets.env")
 
-langfuse = get_client()
+@dataclass
+class AgentStats:
+    """Counters describing how often the LLM's moves needed fixing."""
+    moves_validated: int = 0
+    local_repairs: int = 0
+    reasks: int = 0
+    unrecoverable_moves: int = 0
+    # single-call candidates left out for being illegal
+    dropped_candidates: int = 0
 
 
 class ChessAgent():
-    def __init__(self, model: str = "gpt-4o"):
-        self.llm_manager = LLMManager()
+    def __init__(
+        self,
+        model: str = "gpt-4o",
+        llm_manager: LLMManager | None = None,
+        strategy: AgentStrategy = AgentStrategy.SEQUENTIAL,
+        move_cache: MoveCache | None = None,
+        prompt_builder: PromptBuilder | None = None,
+        turn_budget: float | None = None,
+        tactics: TacticalAnalyser | None = None,
+        move_schema: MoveSchemaFactory | None = None,
+        color: chess.Color = chess.BLACK,
+    ):
+        self.llm_manager = llm_manager if llm_manager is not None else LLMManager()
+        self.move_cache = move_cache
+        self.prompt_builder = prompt_builder if prompt_builder is not None else PromptBuilder()
+        # facts of the local tactical analysis added to the position, if any
+        self.tactics = tactics
+        # restricts the moves of responses to legal ones in the schema itself, if any
+        self.move_schema = move_schema
+        self.usage = LLMUsage()
         self.game_memory: list[str] = []
-        self.analysis_memory: list[str] = []
+        self.analysis_memory: list[AnalysisLLMChessMove] = []
         self.model = model
+        self.strategy = strategy
+        # the side the agent plays, which its prompts and response schemas are written for
+        self.color = color
+        # upper bound of the sequential loop, and the number of parallel candidates in fan-out mode
         self.max_moves_to_consider = 3
+        # distinct legal candidates a single-call selection needs to be played without a second call
+        self.min_candidates = 2
+        self.max_reasks = 2
+        # seconds per move after which the agent commits to its best candidate so far, 0 for no limit
+        self.turn_budget = (
+            turn_budget if turn_budget is not None
+            else float(os.getenv("AGENT_TURN_BUDGET_SECONDS", DEFAULT_TURN_BUDGET))
+        )
+        self.stats = AgentStats()
+        self.stage_timings = StageTimings()
+        self._memory_snapshot = MemorySnapshot()
+        self._turn_deadline: float | None = None
+        # called with every analysis added to the analysis memory, e.g. to persist it
+        self.on_analysis: Callable[[AnalysisLLMChessMove], None] | None = None
+        # analyses of the positions after White's likeliest replies, when pondering
+        self.ponderer: Ponderer | None = None
+        # the opponent's counter moves the agent analysed for the move it played last
+        self.expected_replies: list[str] = []
+
+    def _build_prompt(self, stage_prompt: str, position: str, **stage_fields) -> BuiltPrompt:
+        prompt = self.prompt_builder.build(
+            stage_prompt=stage_prompt,
+            position=position,
+            game_memory=self.game_memory,
+            analysis_memory=self.analysis_memory,
+            color=self.color,
+            **stage_fields,
+        )
+        tracer.update_span(
+            user_prompt=prompt.user_prompt,
+            system_prompt=prompt.system_prompt,
+            estimated_tokens=prompt.estimated_tokens,
+            trimmed=prompt.trimmed,
+        )
+        return prompt
+
+    def _trace_memory(self, **metadata) -> None:
+        """Attach `metadata` and the memory entries added since the last traced snapshot to the span."""
+        if tracer.is_recording():
+            tracer.update_span(
+                **metadata,
+                **self._memory_snapshot.delta(game_memory=self.game_memory, analysis_memory=self.analysis_memory),
+            )
 
-    def _get_previous_moves(self) -> str:
-        if not self.game_memory:
-            return "No moves have been made yet."
-        # only inject the last 3 game moves
-        return "\n".join(self.game_memory[-3:])
-
-    def _get_considered_moves(self) -> str:
-        if not self.analysis_memory:
-            return "No moves have been considered yet."
-        return "\n".join(self.analysis_memory)
+    def _get_considered_moves_key(self) -> str:
+        # order-insensitive so that the same set of considered moves hits the same cache entry
+        return ",".join(sorted(move.move for move in self.analysis_memory))
 
     def _update_analysis_memory(self, move: AnalysisLLMChessMove) -> None:
-        self.analysis_memory.append(f"{move.move}: {move.reasoning}")
+        self.analysis_memory.append(move)
+        if self.on_analysis is not None:
+            self.on_analysis(move)
 
     def _clear_analysis_memory(self) -> None:
         self.analysis_memory = []
@@ -50,155 +149,506 @@ class ChessAgent():
     def _update_game_memory(self, move: BaseLLMChessMove) -> None:
         self.game_memory.append(f"{move.move}: {move.reasoning}")
 
-    @observe()
-    def make_valid_move(self, board: chess.Board, position: str) -> tuple[chess.Move, str]:
+    def remember_move(self, san: str, reasoning: str) -> None:
+        """Record a move that was chosen without the LLM, e.g. by an engine, in the game memory."""
+        self._update_game_memory(BaseLLMChessMove(move=san, reasoning=reasoning))
+
+    @staticmethod
+    def _emit_candidate(move: AnalysisLLMChessMove) -> None:
+        events.emit(
+            AgentEventType.CANDIDATE,
+            move=move.move,
+            reasoning=move.reasoning,
+            counter_moves=[counter_move.model_dump() for counter_move in move.counter_moves],
+        )
+
+    async def _request_move(
+        self,
+        stage: str,
+        board: chess.Board,
+        variant: str,
+        prompt: BuiltPrompt,
+        response_format: type[ResponseT],
+        validate: bool = True,
+        allowed: list[str] | None = None,
+    ) -> ResponseT:
+        """Ask the LLM for a move and return it validated against the legal moves, unless `validate` is off.
+
+        A response already cached for this stage and position is returned without a call. With
+        a `move_schema`, the response format only admits the legal moves, or the `allowed` ones.
+        """
+        response_format = for_side(response_format, self.color)
+        key = MoveCache.make_key(stage=stage, board=board, model=self.model, variant=variant)
+        if self.move_cache is not None:
+            cached_response = self.move_cache.get(key, response_format)
+            if cached_response is not None:
+                tracer.update_span(cache="hit", cache_key=key)
+                return cached_response
+
+        if self.move_schema is not None:
+            response_format = self.move_schema.restrict(response_format, board, allowed=allowed)
+        response = await self.llm_manager.call_llm(
+            model=self.model,
+            system_prompt=prompt.system_prompt,
+            user_prompt=prompt.user_prompt,
+            response_format=response_format,
+            usage=self.usage,
+            stage=stage,
+        )
+        if validate:
+            response = await self._validate_move(board=board, response=response, prompt=prompt)
+
+        if self.move_cache is not None:
+            self.move_cache.set(key, response)
+        return response
+
+    async def _validate_move(self, board: chess.Board, response: ResponseT, prompt: BuiltPrompt) -> ResponseT:
+        """Rewrite the response's move to canonical SAN, re-asking only if it can't be repaired locally."""
+        self.stats.moves_validated += 1
+        reasks = 0
+
+        while True:
+            move_object = normalize_move(board, response.move)
+            if move_object is not None:
+                san = board.san(move_object)
+                if san != response.move:
+                    logger.debug("Repaired LLM move %r to %s", response.move, san)
+                    if reasks == 0:
+                        self.stats.local_repairs += 1
+                        AGENT_MOVE_REPAIRS.inc(kind="local_repair")
+                    response.move = san
+                return response
+
+            if reasks >= self.max_reasks:
+                self.stats.unrecoverable_moves += 1
+                AGENT_MOVE_REPAIRS.inc(kind="unrecoverable")
+                raise chess.IllegalMoveError(f"LLM kept choosing illegal moves, last one was {response.move!r}")
+
+            reasks += 1
+            self.stats.reasks += 1
+            AGENT_MOVE_REPAIRS.inc(kind="reask")
+            logger.info("LLM chose illegal move %r, re-asking with the legal moves (%d)", response.move, reasks)
+            response = await self.llm_manager.call_llm(
+                model=self.model,
+                system_prompt=prompt.system_prompt,
+                user_prompt=REPAIR_MOVE_USER_PROMPT.format(
+                    user_prompt=prompt.user_prompt,
+                    invalid_move=response.move,
+                    legal_moves=", ".join(board.san(move) for move in board.legal_moves),
+                ),
+                response_format=type(response),
+                usage=self.usage,
+                stage="repair_move",
+            )
+
+    def _has_time_for(self, *stages: str) -> bool:
+        """Whether the turn budget likely fits the given stages, judged by their mean duration so far."""
+        if self._turn_deadline is None:
+            return True
+        expected = sum(
+            timing.total_seconds / timing.calls
+            for stage in stages
+            if (timing := self.stage_timings.stages.get(stage)) is not None
+        )
+        return time.monotonic() + expected < self._turn_deadline
+
+    @tracer.observe()
+    async def make_valid_move(
+        self, board: chess.Board, position: str, budget: float | None = None
+    ) -> tuple[chess.Move, str]:
+        """Choose a move within `budget` seconds, by default the agent's turn budget.
+
+        A pondered analysis of the position is the first candidate of the turn. The
+        sequential strategy stops considering new moves once the rest of the budget is
+        unlikely to fit another one. When the budget runs out or the LLM stays unavailable,
+        the agent plays the candidate analysed this turn that `rank_moves` ranks first;
+        without any candidate it raises `AgentMoveError`.
+        """
+        position = self.annotate_position(board=board, position=position)
+        if budget is None:
+            budget = self.turn_budget or None
+        self._turn_deadline = time.monotonic() + budget if budget is not None else None
+        tracer.update_span(budget=budget)
+        try:
+            async with asyncio.timeout(budget):
+                await self._take_pondered_analysis(board)
+                if self.strategy == AgentStrategy.FAN_OUT:
+                    return await self.make_fan_out_move(board=board, position=position)
+                if self.strategy == AgentStrategy.SINGLE_CALL:
+                    return await self.make_single_call_move(board=board, position=position)
+                return await self.make_sequential_move(board=board, position=position)
+        except (TimeoutError, LLMError) as e:
+            # LLMTimeoutError is both: a stage deadline, not the turn budget
+            reason = "llm_unavailable" if isinstance(e, LLMError) else "turn_budget"
+            return self._commit_to_top_ranked_candidate(board=board, reason=reason, error=e)
+        except asyncio.CancelledError:
+            # the client went away mid-turn, don't leak this turn's analysis into the next one
+            self._clear_analysis_memory()
+            raise
+
+    @timed_stage("tactics")
+    def annotate_position(self, board: chess.Board, position: str) -> str:
+        """The position with the summary of the local tactical analysis, if enabled."""
+        if self.tactics is None:
+            return position
+        summary = self.tactics.summarize(board).render()
+        tracer.update_span(tactics=summary)
+        return TACTICS_PROMPT.format(position=position, tactics=summary)
+
+    async def _take_pondered_analysis(self, board: chess.Board) -> None:
+        if self.ponderer is None:
+            return
+        analysis = await self.ponderer.take(board)
+        # a turn resumed from stored analyses has its candidates already
+        if analysis is not None and not self.analysis_memory:
+            tracer.update_span(pondered=analysis.move)
+            self._update_analysis_memory(analysis)
+            self._emit_candidate(analysis)
+
+    def _commit_to_top_ranked_candidate(
+        self, board: chess.Board, reason: str, error: Exception | None = None
+    ) -> tuple[chess.Move, str]:
+        """Play the candidate analysed this turn that the local tactical ranking puts first.
+
+        Among equally ranked candidates the first analysed wins, which in fan-out mode is
+        the one the LLM ranked highest.
+        """
+        if not self.analysis_memory:
+            self._clear_analysis_memory()
+            AGENT_TURN_FALLBACKS.inc(reason=reason, outcome="no_candidate")
+            raise AgentMoveError(f"No candidate move analysed before {reason.replace('_', ' ')}") from error
+
+        candidates = {board.parse_san(candidate.move): candidate for candidate in self.analysis_memory}
+        candidate = candidates[rank_moves(board, list(candidates))[0]]
+        # the LLM errors themselves are logged by the LLMManager
+        logger.warning("Agent committing to candidate %s: %s", candidate.move, reason.replace("_", " "))
+        AGENT_TURN_FALLBACKS.inc(reason=reason, outcome="best_candidate")
+        self._trace_memory(fallback=reason)
+        return self.post_process_move(
+            board=board, move=BaseLLMChessMove(move=candidate.move, reasoning=candidate.reasoning)
+        )
+
+    async def make_sequential_move(self, board: chess.Board, position: str) -> tuple[chess.Move, str]:
         iterations = 0
         
         while True:
-            decision = self.decide_on_action(position=position)
-            move = self.execute_decision(position=position, decision=decision, iterations=iterations)
+            if iterations > 0 and not self._has_time_for("decide_on_action", "consider_new_move", "decide_on_move"):
+                if self.analysis_memory and not self._has_time_for("decide_on_move"):
+                    return self._commit_to_top_ranked_candidate(board=board, reason="turn_budget")
+                self._trace_memory(decision="Agent decided to choose a move because its time budget is nearly spent.")
+                move = await self.decide_on_move(board=board, position=position)
+                AGENT_MOVE_ITERATIONS.observe(iterations, strategy=self.strategy.value)
+                return self.post_process_move(board=board, move=move)
+
+            decision = await self.decide_on_action(board=board, position=position)
+            move = await self.execute_decision(
+                board=board, position=position, decision=decision, iterations=iterations
+            )
             iterations += 1
 
             if move is not None:
+                AGENT_MOVE_ITERATIONS.observe(iterations, strategy=self.strategy.value)
                 return self.post_process_move(board=board, move=move)
             
             # safety check to prevent infinite loop
             if iterations > 5:
-                raise Exception("Unable to make a move.")
-
-        raise Exception("Unable to make a move.")
-
-    @observe()
-    def decide_on_action(self, position: str) -> Decision:
-
-        previous_moves = self._get_previous_moves()
-        considered_moves = self._get_considered_moves()
-
-        formatted_user_prompt = ORCHESTRATION_USER_PROMPT.format(
+                raise AgentMoveError("Unable to make a move.")
+
+    @tracer.observe()
+    async def make_fan_out_move(self, board: chess.Board, position: str) -> tuple[chess.Move, str]:
+        """Analyse several candidates concurrently, then decide with a single call.
+
+        This costs two LLM round trips per move regardless of how many candidates are explored.
+        """
+        await self.explore_candidates(board=board, position=position)
+        AGENT_MOVE_ITERATIONS.observe(len(self.analysis_memory), strategy=self.strategy.value)
+        move = await self.decide_on_move(
+            board=board,
             position=position,
-            previous_moves=previous_moves,
-            considered_moves=considered_moves,
+            decision_reasoning=f"You analysed {len(self.analysis_memory)} candidate moves in parallel.",
+        )
+        return self.post_process_move(board=board, move=move)
+
+    @tracer.observe()
+    async def make_single_call_move(self, board: chess.Board, position: str) -> tuple[chess.Move, str]:
+        """Analyse candidates and choose among them in one call, deciding locally whether a second call is needed.
+
+        The selected move is played right away when it is one of at least `min_candidates`
+        distinct legal candidates (or of all legal moves, when there are fewer). With
+        enough candidates but an unusable selection, decide_on_move chooses among them;
+        with too few, a second selection sees the candidates kept so far and its move is
+        played if legal, else the best candidate.
+        """
+        selection = await self.select_move(board=board, position=position)
+        move = self._settled_move(board=board, selection=selection)
+        if move is None:
+            if self._has_enough_candidates(board):
+                self._trace_memory(decision="Agent chose a move that isn't one of its candidates, deciding again.")
+                move = await self.decide_on_move(
+                    board=board, position=position, decision_reasoning=selection.reasoning
+                )
+            else:
+                self._trace_memory(decision="Agent analysed too few legal candidates, selecting again.")
+                selection = await self.select_move(board=board, position=position)
+                move = self._settled_move(board=board, selection=selection, require_candidates=False)
+                if move is None:
+                    return self._commit_to_top_ranked_candidate(board=board, reason="illegal_selection")
+            AGENT_MOVE_ITERATIONS.observe(2, strategy=self.strategy.value)
+        else:
+            AGENT_MOVE_ITERATIONS.observe(1, strategy=self.strategy.value)
+        return self.post_process_move(board=board, move=move)
+
+    def _has_enough_candidates(self, board: chess.Board) -> bool:
+        return len(self.analysis_memory) >= min(self.min_candidates, board.legal_moves.count())
+
+    def _settled_move(
+        self, board: chess.Board, selection: MoveSelection, require_candidates: bool = True
+    ) -> BaseLLMChessMove | None:
+        """The selected move in canonical SAN if the local rule accepts it without another call, else None."""
+        move_object = normalize_move(board, selection.move)
+        if move_object is None:
+            return None
+        san = board.san(move_object)
+        if require_candidates and not (
+            self._has_enough_candidates(board) and san in {candidate.move for candidate in self.analysis_memory}
+        ):
+            return None
+        return BaseLLMChessMove(move=san, reasoning=selection.reasoning)
+
+    @tracer.observe()
+    @timed_stage("select_move")
+    async def select_move(self, board: chess.Board, position: str) -> MoveSelection:
+        """One call for candidates with their counter moves and the final choice; the legal candidates are kept."""
+
+        prompt = self._build_prompt(SELECT_MOVE_USER_PROMPT, position=position, min_candidates=self.min_candidates)
+
+        # the local rule in make_single_call_move decides what an illegal selection costs, not a re-ask
+        response = await self._request_move(
+            stage="select_move",
+            board=board,
+            variant=self._get_considered_moves_key(),
+            prompt=prompt,
+            response_format=MoveSelection,
+            validate=False,
         )
 
-        llm_response = self.llm_manager.call_llm(
+        candidates = self._keep_candidates(self._legal_candidates(board=board, candidates=response.candidates))
+        self._trace_memory(candidates_selected=len(response.candidates), candidates_kept=len(candidates))
+
+        return response
+
+    def _legal_candidates(
+        self, board: chess.Board, candidates: list[AnalysisLLMChessMove]
+    ) -> list[AnalysisLLMChessMove]:
+        """Candidates rewritten to canonical SAN, dropping those that can't be repaired locally."""
+        legal = []
+        for candidate in candidates:
+            self.stats.moves_validated += 1
+            move_object = normalize_move(board, candidate.move)
+            if move_object is None:
+                self.stats.dropped_candidates += 1
+                AGENT_MOVE_REPAIRS.inc(kind="dropped_candidate")
+                continue
+            san = board.san(move_object)
+            if san != candidate.move:
+                self.stats.local_repairs += 1
+                AGENT_MOVE_REPAIRS.inc(kind="local_repair")
+            legal.append(candidate.model_copy(update={"move": san}))
+        return legal
+
+    @tracer.observe()
+    @timed_stage("explore_candidates")
+    async def explore_candidates(self, board: chess.Board, position: str) -> list[AnalysisLLMChessMove]:
+        num_candidates = self.max_moves_to_consider
+        # a pondered analysis stands in for the most promising candidate
+        tasks = [
+            asyncio.ensure_future(self.analyse_candidate(
+                board=board, position=position, candidate_rank=rank, num_candidates=num_candidates
+            ))
+            for rank in range(len(self.analysis_memory) + 1, num_candidates + 1)
+        ]
+        try:
+            await asyncio.wait(tasks)
+        except asyncio.CancelledError:
+            # the turn budget ran out: keep what was analysed in time to commit to
+            for task in tasks:
+                task.cancel()
+            self._keep_candidates([
+                task.result() for task in tasks if task.done() and not task.cancelled() and task.exception() is None
+            ])
+            raise
+
+        errors = [task.exception() for task in tasks]
+        for error in errors:
+            # candidates that couldn't be repaired are dropped
+            if error is not None and not isinstance(error, chess.IllegalMoveError):
+                raise error
+        candidates = self._keep_candidates([task.result() for task, error in zip(tasks, errors) if error is None])
+
+        self._trace_memory(candidates_requested=num_candidates, candidates_kept=len(candidates))
+
+        return candidates
+
+    def _keep_candidates(self, responses: list[AnalysisLLMChessMove]) -> list[AnalysisLLMChessMove]:
+        """Add the first analysis of every distinct move to the analysis memory, in rank order."""
+        candidates: dict[str, AnalysisLLMChessMove] = {}
+        known = {candidate.move for candidate in self.analysis_memory}
+        for response in responses:
+            if response.move in known:
+                continue
+            candidates.setdefault(response.move, response)
+
+        for candidate in candidates.values():
+            self._update_analysis_memory(candidate)
+            self._emit_candidate(candidate)
+        return list(candidates.values())
+
+    @tracer.observe()
+    @timed_stage("decide_on_action")
+    async def decide_on_action(self, board: chess.Board, position: str) -> Decision:
+
+        # whether to analyse more is judged from the candidates, so the call only gets the FEN of the position
+        prompt = self._build_prompt(ORCHESTRATION_USER_PROMPT, position=position, fen=board.fen())
+
+        llm_response = await self.llm_manager.call_llm(
             model=self.model,
-            system_prompt=SYSTEM_PROMPT,
-            user_prompt=formatted_user_prompt,
+            system_prompt=prompt.system_prompt,
+            user_prompt=prompt.user_prompt,
             response_format=Decision,
+            usage=self.usage,
+            stage="decide_on_action",
         )
 
-        langfuse.update_current_span(metadata={"user_prompt": formatted_user_prompt, "system_prompt": SYSTEM_PROMPT})
+        events.emit(
+            AgentEventType.DECISION,
+            decision=llm_response.decision.value,
+            reasoning=llm_response.reasoning,
+        )
 
         return llm_response
 
-    @observe()
-    def execute_decision(self, position: str, decision: Decision, iterations: int) -> BaseLLMChessMove | None:
+    @tracer.observe()
+    async def execute_decision(
+        self, board: chess.Board, position: str, decision: Decision, iterations: int
+    ) -> BaseLLMChessMove | None:
 
         if decision.decision == DecisionOptions.DECIDE_ON_MOVE:
             decision_reasoning = decision.reasoning
-            langfuse.update_current_span(
-                metadata={
-                    "decision": "Agent decided to choose a move based on their analysis.",
-                    "game_memory": self.game_memory,
-                    "analysis_memory": self.analysis_memory,
-                }
+            self._trace_memory(decision="Agent decided to choose a move based on their analysis.")
+            response = await self.decide_on_move(
+                board=board, position=position, decision_reasoning=decision_reasoning
             )
-            response = self.decide_on_move(position=position, decision_reasoning=decision_reasoning)
             return response
     
         if iterations > self.max_moves_to_consider:
-            langfuse.update_current_span(
-                metadata={
-                    "decision": f"Agent decided to choose a move because they have already considered {self.max_moves_to_consider} moves.",
-                    "game_memory": self.game_memory,
-                    "analysis_memory": self.analysis_memory,
-                }
+            self._trace_memory(
+                decision=(
+                    "Agent decided to choose a move because they have already considered "
+                    f"{self.max_moves_to_consider} moves."
+                )
             )
-            response = self.decide_on_move(position=position)
+            response = await self.decide_on_move(board=board, position=position)
             return response
         
         if decision.decision == DecisionOptions.CONSIDER_NEW_MOVE:
-            langfuse.update_current_span(
-                metadata={
-                    "decision": "Agent decided to consider a new move.",
-                    "game_memory": self.game_memory,
-                    "analysis_memory": self.analysis_memory,
-                }
-            )
-            self.consider_new_move(position=position)
+            self._trace_memory(decision="Agent decided to consider a new move.")
+            await self.consider_new_move(board=board, position=position)
             #TODO: returning None here is weird
             return None
         
-        raise Exception(f"Invalid decision from LLM: {decision.decision}")
+        raise AgentMoveError(f"Invalid decision from LLM: {decision.decision}")
 
-    @observe()
+    @tracer.observe()
+    @timed_stage("post_process_move")
     def post_process_move(self, board: chess.Board, move: BaseLLMChessMove) -> tuple[chess.Move, str]:
         move_object: chess.Move = board.parse_san(move.move)
 
-        langfuse.update_current_span(
-            metadata={
-                "game_memory": self.game_memory,
-                "analysis_memory": self.analysis_memory,
-            }
+        self._trace_memory(stats=self.stats, usage=self.usage)
+        self.expected_replies = next(
+            (
+                [counter_move.counter_move for counter_move in candidate.counter_moves]
+                for candidate in self.analysis_memory
+                if candidate.move == move.move
+            ),
+            [],
         )
         self._update_game_memory(move)
         self._clear_analysis_memory()
 
-        return move_object, move.reasoning
+        events.emit(AgentEventType.MOVE, move=move.move, uci=move_object.uci(), reasoning=move.reasoning)
 
-    @observe()
-    def decide_on_move(self, position: str, decision_reasoning: str | None = None) -> BaseLLMChessMove:
+        return move_object, move.reasoning
 
-        previous_moves = self._get_previous_moves()
-        considered_moves = self._get_considered_moves()
+    @tracer.observe()
+    @timed_stage("decide_on_move")
+    async def decide_on_move(
+        self, board: chess.Board, position: str, decision_reasoning: str | None = None
+    ) -> BaseLLMChessMove:
 
-        base_move_prompt = BASE_MOVE_PROMPT.format(
-            position=position,
-            previous_moves=previous_moves,
-        )
-        formatted_user_prompt = DECIDE_ON_MOVE_USER_PROMPT.format(
-            base_move_prompt=base_move_prompt,
-            considered_moves=considered_moves,
-            decision_reasoning=decision_reasoning,
+        prompt = self._build_prompt(
+            DECIDE_ON_MOVE_USER_PROMPT, position=position, decision_reasoning=decision_reasoning
         )
 
-        response = self.llm_manager.call_llm(
-            model=self.model,
-            system_prompt=SYSTEM_PROMPT,
-            user_prompt=formatted_user_prompt,
+        response = await self._request_move(
+            stage="decide_on_move",
+            board=board,
+            variant=self._get_considered_moves_key(),
+            prompt=prompt,
             response_format=BaseLLMChessMove,
+            # the prompt says to only choose from the candidates, the schema makes sure of it
+            allowed=[candidate.move for candidate in self.analysis_memory] or None,
         )
 
-        langfuse.update_current_span(metadata={"user_prompt": formatted_user_prompt, "system_prompt": SYSTEM_PROMPT})
+        return response
+
+    @tracer.observe()
+    @timed_stage("consider_new_move")
+    async def consider_new_move(self, board: chess.Board, position: str) -> AnalysisLLMChessMove:
+
+        response = await self.analyse_position(board=board, position=position)
+
+        self._update_analysis_memory(response)
+        self._emit_candidate(response)
 
         return response
 
-    @observe()
-    def consider_new_move(self, position: str) -> AnalysisLLMChessMove:
+    async def ponder_position(self, board: chess.Board, position: str) -> AnalysisLLMChessMove:
+        """analyse_position of a position the agent may face next, annotated as its turn would be."""
+        return await self.analyse_position(board=board, position=self.annotate_position(board=board, position=position))
 
-        previous_moves = self._get_previous_moves()
-        considered_moves = self._get_considered_moves()
+    @tracer.observe()
+    async def analyse_position(self, board: chess.Board, position: str) -> AnalysisLLMChessMove:
+        """consider_new_move's analysis without adding it to the analysis memory, e.g. of a pondered position."""
 
-        base_move_prompt = BASE_MOVE_PROMPT.format(
-            position=position,
-            previous_moves=previous_moves,
-        )
-        formatted_user_prompt = CONSIDER_NEW_MOVE_USER_PROMPT.format(
-            base_move_prompt=base_move_prompt,
-            considered_moves=considered_moves,
-        )
-      
-        response = self.llm_manager.call_llm(
-            model=self.model,
-            system_prompt=SYSTEM_PROMPT,
-            user_prompt=formatted_user_prompt,
+        prompt = self._build_prompt(CONSIDER_NEW_MOVE_USER_PROMPT, position=position)
+
+        return await self._request_move(
+            stage="consider_new_move",
+            board=board,
+            variant=self._get_considered_moves_key(),
+            prompt=prompt,
             response_format=AnalysisLLMChessMove,
         )
 
-        self._update_analysis_memory(response)
-
-        langfuse.update_current_span(metadata={"user_prompt": formatted_user_prompt, "system_prompt": SYSTEM_PROMPT})
+    @tracer.observe()
+    @timed_stage("analyse_candidate")
+    async def analyse_candidate(
+        self, board: chess.Board, position: str, candidate_rank: int, num_candidates: int
+    ) -> AnalysisLLMChessMove:
 
-        return response
+        prompt = self._build_prompt(
+            FAN_OUT_CANDIDATE_USER_PROMPT,
+            position=position,
+            candidate_rank=candidate_rank,
+            num_candidates=num_candidates,
+        )
 
+        response = await self._request_move(
+            stage="analyse_candidate",
+            board=board,
+            variant=f"{candidate_rank}/{num_candidates}",
+            prompt=prompt,
+            response_format=AnalysisLLMChessMove,
+        )
 
+        return response
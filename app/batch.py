@@ -0,0 +1,311 @@
+"""Headless batch runner: plays many games without the web UI and reports how the agent did.
+
+The agent plays Black, as in the app, against a random mover, the engine from
+`create_engine_from_env` or a second agent playing White. Games are spread over a process
+pool, and every finished game is appended to the PGN and JSONL outputs as soon as it completes.
+
+    python -m app.batch --games 100 --workers 8 --opponent random --llm synthetic --jsonl out.jsonl
+
+With `--llm synthetic` (the default) no network access or API key is needed, which makes
+the runner a throughput benchmark of everything around the LLM. `--llm openai` plays real
+games, and `--llm record` / `--llm replay` record them once and replay them for free.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+
+import chess
+import chess.pgn
+from dotenv import load_dotenv
+
+from app.agent import AgentMoveError, ChessAgent
+from app.engine import create_engine_from_env
+from app.llm import LLMManager
+from app.llm_backend import LatencyDistribution, LLMBackendType, SyntheticBackend, create_backend
+from app.move_provider import EngineMoveProvider, LLMMoveProvider, MoveProvider
+from app.move_schema import MoveSchemaFactory
+from app.position_encoder import PositionEncoder
+from app.prompt_builder import PromptBuilder
+from app.resource import AgentStrategy
+from app.tactics import TacticalAnalyser
+from app.tracing import configure_tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PLIES = 200
+
+
+class Opponent(str, Enum):
+    RANDOM = "random"
+    ENGINE = "engine"
+    AGENT = "agent"
+
+
+@dataclass
+class BatchConfig:
+    opponent: Opponent = Opponent.RANDOM
+    llm: LLMBackendType = LLMBackendType.SYNTHETIC
+    strategy: AgentStrategy = AgentStrategy.SEQUENTIAL
+    model: str = "gpt-4o"
+    max_plies: int = DEFAULT_MAX_PLIES
+    synthetic_latency: str = "0"
+    synthetic_illegal_move_rate: float = 0.0
+    seed: int = 0
+    # thinking time per agent move, None for the agent's default turn budget
+    move_time: float | None = None
+
+
+@dataclass
+class GameRecord:
+    """One game's result, from Black's point of view, and the cost of every agent move in it."""
+    game: int
+    white: str
+    black: str
+    result: str
+    termination: str
+    plies: int
+    agent_moves: int = 0
+    agent_seconds: float = 0.0
+    llm_calls: int = 0
+    cost_usd: float = 0.0
+    moves_validated: int = 0
+    local_repairs: int = 0
+    reasks: int = 0
+    unrecoverable_moves: int = 0
+    pgn: str = field(default="", repr=False)
+
+
+class RandomMoveProvider(MoveProvider):
+    name = "random"
+
+    def __init__(self, seed: int | None = None):
+        self.random = random.Random(seed)
+
+    async def choose_move(
+        self, board: chess.Board, position: str, budget: float | None = None
+    ) -> tuple[chess.Move, str]:
+        return self.random.choice(list(board.legal_moves)), "Random move."
+
+
+def _create_llm_manager(config: BatchConfig, seed: int) -> LLMManager:
+    if config.llm == LLMBackendType.SYNTHETIC:
+        backend = SyntheticBackend(
+            latency=LatencyDistribution(config.synthetic_latency),
+            illegal_move_rate=config.synthetic_illegal_move_rate,
+            seed=seed,
+        )
+    else:
+        backend = create_backend(config.llm)
+    return LLMManager(backend=backend)
+
+
+def _create_agent(config: BatchConfig, llm_manager: LLMManager, color: chess.Color = chess.BLACK) -> ChessAgent:
+    return ChessAgent(
+        model=config.model,
+        llm_manager=llm_manager,
+        strategy=config.strategy,
+        prompt_builder=PromptBuilder.from_env(),
+        tactics=TacticalAnalyser.from_env(),
+        move_schema=MoveSchemaFactory.from_env(),
+        color=color,
+    )
+
+
+async def play_game(game: int, config: BatchConfig) -> GameRecord:
+    seed = config.seed + game
+    llm_manager = _create_llm_manager(config, seed)
+    engine = None
+    agents = [_create_agent(config, llm_manager)]
+
+    if config.opponent == Opponent.RANDOM:
+        white: MoveProvider = RandomMoveProvider(seed)
+    elif config.opponent == Opponent.ENGINE:
+        engine = create_engine_from_env()
+        white = EngineMoveProvider(engine)
+    else:
+        agents.append(_create_agent(config, llm_manager, color=chess.WHITE))
+        white = LLMMoveProvider(agents[1])
+    black = LLMMoveProvider(agents[0])
+
+    board = chess.Board()
+    encoder = PositionEncoder.from_env()
+    record = GameRecord(
+        game=game, white=white.name, black=f"agent ({config.strategy.value})", result="*", termination="", plies=0
+    )
+
+    try:
+        while not board.is_game_over(claim_draw=True) and len(board.move_stack) < config.max_plies:
+            provider = white if board.turn == chess.WHITE else black
+            start = time.perf_counter()
+            try:
+                move, _ = await provider.choose_move(
+                    board=board, position=encoder.encode(board), budget=config.move_time
+                )
+            except (chess.IllegalMoveError, AgentMoveError) as e:
+                # the agent could not produce a legal move in time, which forfeits the game
+                record.result = "1-0" if board.turn == chess.BLACK else "0-1"
+                record.termination = "illegal_move" if isinstance(e, chess.IllegalMoveError) else "no_move"
+                break
+            if isinstance(provider, LLMMoveProvider):
+                record.agent_moves += 1
+                record.agent_seconds += time.perf_counter() - start
+            encoder.push(board, move)
+            board.push(move)
+        else:
+            outcome = board.outcome(claim_draw=True)
+            if outcome is not None:
+                record.result = outcome.result()
+                record.termination = outcome.termination.name.lower()
+            else:
+                record.termination = "max_plies"
+    finally:
+        await llm_manager.close()
+        if engine is not None:
+            await engine.close()
+
+    record.plies = len(board.move_stack)
+    for agent in agents:
+        record.llm_calls += agent.usage.calls
+        record.cost_usd += agent.usage.cost_usd
+        record.moves_validated += agent.stats.moves_validated
+        record.local_repairs += agent.stats.local_repairs
+        record.reasks += agent.stats.reasks
+        record.unrecoverable_moves += agent.stats.unrecoverable_moves
+
+    pgn_game = chess.pgn.Game.from_board(board)
+    pgn_game.headers["Event"] = "Batch evaluation"
+    pgn_game.headers["Round"] = str(game)
+    pgn_game.headers["White"] = record.white
+    pgn_game.headers["Black"] = record.black
+    pgn_game.headers["Result"] = record.result
+    pgn_game.headers["Termination"] = record.termination
+    record.pgn = str(pgn_game)
+    return record
+
+
+def run_game(game: int, config: BatchConfig) -> GameRecord:
+    """Process pool entry point: one game in a fresh event loop."""
+    return asyncio.run(play_game(game, config))
+
+
+@dataclass
+class BatchSummary:
+    games: int = 0
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+    unfinished: int = 0
+    agent_moves: int = 0
+    agent_seconds: float = 0.0
+    llm_calls: int = 0
+    cost_usd: float = 0.0
+    moves_validated: int = 0
+    illegal_moves: int = 0
+
+    def add(self, record: GameRecord) -> None:
+        self.games += 1
+        if record.result == "0-1":
+            self.wins += 1
+        elif record.result == "1-0":
+            self.losses += 1
+        elif record.result == "1/2-1/2":
+            self.draws += 1
+        else:
+            self.unfinished += 1
+        self.agent_moves += record.agent_moves
+        self.agent_seconds += record.agent_seconds
+        self.llm_calls += record.llm_calls
+        self.cost_usd += record.cost_usd
+        # every re-ask answers an illegal move, and an unrecoverable move is one more illegal answer
+        self.moves_validated += record.moves_validated + record.reasks
+        self.illegal_moves += record.reasks + record.unrecoverable_moves
+
+    def report(self, wall_seconds: float) -> str:
+        moves = max(self.agent_moves, 1)
+        games = max(self.games, 1)
+        return "\n".join([
+            f"games            {self.games} ({self.wins} won, {self.draws} drawn, "
+            f"{self.losses} lost, {self.unfinished} unfinished)",
+            f"win rate         {self.wins / games:.1%}",
+            f"illegal moves    {self.illegal_moves / max(self.moves_validated, 1):.1%} "
+            f"of {self.moves_validated} LLM moves",
+            f"LLM calls/move   {self.llm_calls / moves:.2f}",
+            f"seconds/move     {self.agent_seconds / moves:.3f}",
+            f"cost             ${self.cost_usd:.4f} (${self.cost_usd / moves:.5f}/move)",
+            f"wall clock       {wall_seconds:.1f}s ({self.agent_moves / max(wall_seconds, 1e-9):.1f} agent moves/s)",
+        ])
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=10, help="number of games to play")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--opponent", choices=[opponent.value for opponent in Opponent], default=Opponent.RANDOM.value)
+    parser.add_argument("--llm", choices=[backend.value for backend in LLMBackendType],
+                        default=LLMBackendType.SYNTHETIC.value)
+    parser.add_argument("--strategy", choices=[strategy.value for strategy in AgentStrategy],
+                        default=AgentStrategy.SEQUENTIAL.value)
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES,
+                        help="stop games that are still running after this many plies")
+    parser.add_argument("--synthetic-latency", default="0",
+                        help="latency distribution of synthetic calls, e.g. 0.5 or lognormal:0.8:0.5")
+    parser.add_argument("--synthetic-illegal-move-rate", type=float, default=0.0,
+                        help="share of synthetic answers that are illegal moves")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--move-time", type=float, default=None,
+                        help="thinking time per agent move in seconds (default: AGENT_TURN_BUDGET_SECONDS)")
+    parser.add_argument("--pgn", help="append the finished games to this PGN file")
+    parser.add_argument("--jsonl", help="append one JSON record per finished game to this file")
+    args = parser.parse_args(argv)
+    load_dotenv("secrets.env")
+
+    config = BatchConfig(
+        opponent=Opponent(args.opponent),
+        llm=LLMBackendType(args.llm),
+        strategy=AgentStrategy(args.strategy),
+        model=args.model,
+        max_plies=args.max_plies,
+        synthetic_latency=args.synthetic_latency,
+        synthetic_illegal_move_rate=args.synthetic_illegal_move_rate,
+        seed=args.seed,
+        move_time=args.move_time,
+    )
+    pgn_file = open(args.pgn, "a", encoding="utf-8") if args.pgn else None
+    jsonl_file = open(args.jsonl, "a", encoding="utf-8") if args.jsonl else None
+    summary = BatchSummary()
+    start = time.perf_counter()
+
+    try:
+        # every worker process traces its own games
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=configure_tracing) as executor:
+            futures = [executor.submit(run_game, game, config) for game in range(args.games)]
+            for future in as_completed(futures):
+                record = future.result()
+                summary.add(record)
+                print(f"game {record.game}: {record.result} ({record.termination}, {record.plies} plies)",
+                      file=sys.stderr)
+                if pgn_file is not None:
+                    pgn_file.write(record.pgn + "\n\n")
+                    pgn_file.flush()
+                if jsonl_file is not None:
+                    line = {key: value for key, value in asdict(record).items() if key != "pgn"}
+                    jsonl_file.write(json.dumps(line) + "\n")
+                    jsonl_file.flush()
+    finally:
+        for output in (pgn_file, jsonl_file):
+            if output is not None:
+                output.close()
+
+    print(summary.report(time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import TypeVar
+
+import chess
+import chess.polyglot
+from pydantic import BaseModel
+
+from app.prompts import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+ResponseT = TypeVar("ResponseT", bound=BaseModel)
+
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def position_key(board: chess.Board) -> str:
+    """Key of the position itself, independent of the move order that reached it.
+
+    The Zobrist hash covers piece placement, side to move, castling rights and en passant,
+    so transpositions map to the same key while the clocks and move history don't matter.
+    """
+    return f"{chess.polyglot.zobrist_hash(board):016x}"
+
+
+class CacheTier(ABC):
+    name: str
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        ...
+
+
+class MemoryCacheTier(CacheTier):
+    """In-process LRU cache with a per-entry time to live."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SqliteCacheTier(CacheTier):
+    """Persistent cache in a SQLite file, evicting by TTL and least recent access."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        row = self._connection.execute(
+            "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, created_at = row
+        if created_at + self.ttl < now:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+
+        self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, now, now),
+        )
+        self._connection.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class MoveCache:
+    """Cache of parsed agent responses keyed by position, model and prompt version.
+
+    Lookups go through the tiers in order and a hit in a slower tier is copied into the
+    faster ones. Hits and misses are counted per tier.
+    """
+
+    def __init__(self, tiers: list[CacheTier]):
+        self.tiers = tiers
+        self.hits = {tier.name: 0 for tier in tiers}
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "MoveCache":
+        max_entries = int(os.getenv("MOVE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        ttl = float(os.getenv("MOVE_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+
+        tiers: list[CacheTier] = [MemoryCacheTier(max_entries=max_entries, ttl=ttl)]
+        sqlite_path = os.getenv("MOVE_CACHE_PATH")
+        if sqlite_path:
+            tiers.append(SqliteCacheTier(sqlite_path, max_entries=max_entries, ttl=ttl))
+        return cls(tiers)
+
+    @staticmethod
+    def make_key(stage: str, board: chess.Board, model: str, variant: str = "") -> str:
+        return f"{stage}:{model}:{PROMPT_VERSION}:{position_key(board)}:{variant}"
+
+    def get(self, key: str, response_format: type[ResponseT]) -> ResponseT | None:
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is None:
+                continue
+
+            self.hits[tier.name] += 1
+            for faster_tier in self.tiers[:index]:
+                faster_tier.set(key, value)
+            return response_format.model_validate_json(value)
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, response: BaseModel) -> None:
+        value = response.model_dump_json()
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def stats(self) -> dict[str, int | dict[str, int]]:
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "total_hits": sum(self.hits.values()),
+        }
+
+    def close(self) -> None:
+        for tier in self.tiers:
+            if isinstance(tier, SqliteCacheTier):
+                tier.close()
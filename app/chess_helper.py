@@ -1,11 +1,17 @@
+import re
 import chess
 import chess.pgn
 from typing import cast
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# "2. e5", "2... e5", "2...e5"
+MOVE_NUMBER_PREFIX = re.compile(r"^\d+\s*\.+\s*")
+# "Qh4#", "e5!?", "Nf3+"
+ANNOTATION_SUFFIX = re.compile(r"[+#!?]+$")
+UCI_MOVE = re.compile(r"^[a-h][1-8][a-h][1-8][qrbn]?$")
+
 
 def convert_board_to_pgn(board: chess.Board) -> str:
     logger.debug("Converting this board to PGN:\n%s", board)
@@ -39,5 +45,36 @@ Board Position:
 Game Moves:
 {moves_only}"""
     
-    logger.debug("PGN string constructed for the LLM: \n" + board_state)
-    return board_state
\ No newline at end of file
+    logger.debug("PGN string constructed for the LLM (%d characters)", len(board_state))
+    return board_state
+
+
+def normalize_move(board: chess.Board, raw_move: str) -> chess.Move | None:
+    """Map a move written by the LLM to a legal move, or None if it can't be repaired.
+
+    Handles the usual malformations: move-number prefixes, trailing text, check/mate and
+    annotation suffixes, zeros in castling, UCI instead of SAN and lowercase piece letters.
+    """
+    candidate = MOVE_NUMBER_PREFIX.sub("", raw_move.strip())
+    candidate = candidate.split()[0] if candidate else candidate
+    candidate = ANNOTATION_SUFFIX.sub("", candidate.strip(".,;:'\""))
+    candidate = candidate.replace("0-0-0", "O-O-O").replace("0-0", "O-O")
+    if not candidate:
+        return None
+
+    spellings = [candidate]
+    if candidate[0] in "nbrqk" and len(candidate) > 2:
+        spellings.append(candidate[0].upper() + candidate[1:])
+
+    for spelling in spellings:
+        try:
+            return board.parse_san(spelling)
+        except ValueError:
+            pass
+
+    if UCI_MOVE.match(candidate.lower()):
+        move = chess.Move.from_uci(candidate.lower())
+        if board.is_legal(move):
+            return move
+
+    return None
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import chess
+import chess.engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_TIME_LIMIT = 0.05
+DEFAULT_SEARCH_DEPTH = 2
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 320,
+    chess.BISHOP: 330,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0,
+}
+MATE_SCORE = 100_000
+
+
+@dataclass
+class EngineLine:
+    """One principal variation's first move and its score from the side to move's point of view."""
+    move: chess.Move
+    score: int
+    mate: int | None = None
+
+
+class Engine(ABC):
+    name: str
+
+    @abstractmethod
+    async def analyse(self, board: chess.Board, multipv: int = 1) -> list[EngineLine]:
+        """Return up to `multipv` lines, best first."""
+
+    async def warm_up(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class UciEnginePool(Engine):
+    """Long-lived pool of UCI engine processes (e.g. Stockfish) shared by every game.
+
+    Processes are started on first use, or when the server warms up, and each analysis checks
+    one out of the pool, so at most `size` positions are analysed at the same time.
+    """
+
+    name = "uci"
+
+    def __init__(self, path: str, size: int = DEFAULT_POOL_SIZE, time_limit: float = DEFAULT_TIME_LIMIT):
+        self.path = path
+        self.size = size
+        self.limit = chess.engine.Limit(time=time_limit)
+        self._idle: asyncio.Queue[chess.engine.Protocol] = asyncio.Queue()
+        self._engines: list[chess.engine.Protocol] = []
+        self._start_lock = asyncio.Lock()
+
+    async def _start(self) -> None:
+        async with self._start_lock:
+            while len(self._engines) < self.size:
+                _, engine = await chess.engine.popen_uci(self.path)
+                self._engines.append(engine)
+                self._idle.put_nowait(engine)
+            logger.info("Started %d UCI engine processes from %s", self.size, self.path)
+
+    async def warm_up(self) -> None:
+        if not self._engines:
+            await self._start()
+
+    async def analyse(self, board: chess.Board, multipv: int = 1) -> list[EngineLine]:
+        if not self._engines:
+            await self._start()
+
+        engine = await self._idle.get()
+        try:
+            infos = await engine.analyse(board, self.limit, multipv=multipv)
+        finally:
+            self._idle.put_nowait(engine)
+
+        lines = []
+        for info in infos:
+            if "pv" not in info:
+                continue
+            score = info["score"].relative
+            lines.append(EngineLine(move=info["pv"][0], score=score.score(mate_score=MATE_SCORE), mate=score.mate()))
+        return lines
+
+    async def close(self) -> None:
+        for engine in self._engines:
+            try:
+                await engine.quit()
+            except chess.engine.EngineError:
+                logger.warning("UCI engine did not quit cleanly")
+        self._engines = []
+
+
+class MaterialSearchEngine(Engine):
+    """Pure-Python fallback: a shallow negamax search over material, for tests and machines without Stockfish.
+
+    It only sees material and mates, so it is enough to spot forced and clearly tactical
+    positions but not to judge quiet ones.
+    """
+
+    name = "material"
+
+    def __init__(self, depth: int = DEFAULT_SEARCH_DEPTH):
+        self.depth = depth
+
+    async def analyse(self, board: chess.Board, multipv: int = 1) -> list[EngineLine]:
+        return await asyncio.to_thread(self._analyse, board.copy(), multipv)
+
+    def _analyse(self, board: chess.Board, multipv: int) -> list[EngineLine]:
+        lines = []
+        for move in _ordered_moves(board):
+            board.push(move)
+            score = -self._negamax(board, self.depth - 1, -MATE_SCORE - 1, MATE_SCORE + 1)
+            board.pop()
+            mate = None
+            if abs(score) > MATE_SCORE - 100:
+                plies = MATE_SCORE - abs(score)
+                mate = (plies + 1) // 2 if score > 0 else -((plies + 1) // 2)
+            lines.append(EngineLine(move=move, score=score, mate=mate))
+
+        lines.sort(key=lambda line: line.score, reverse=True)
+        return lines[:multipv]
+
+    def _negamax(self, board: chess.Board, depth: int, alpha: int, beta: int, ply: int = 1) -> int:
+        if board.is_checkmate():
+            return -(MATE_SCORE - ply)
+        if board.is_game_over():
+            return 0
+        if depth <= 0:
+            return _material_balance(board)
+
+        best = -MATE_SCORE - 1
+        for move in _ordered_moves(board):
+            board.push(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+            best = max(best, score)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        return best
+
+
+def _material_balance(board: chess.Board) -> int:
+    score = 0
+    for piece_type, value in PIECE_VALUES.items():
+        score += value * (
+            len(board.pieces(piece_type, board.turn)) - len(board.pieces(piece_type, not board.turn))
+        )
+    return score
+
+
+def _ordered_moves(board: chess.Board) -> list[chess.Move]:
+    # captures of the most valuable pieces first, so alpha-beta cuts early
+    def capture_value(move: chess.Move) -> int:
+        if board.is_en_passant(move):
+            return PIECE_VALUES[chess.PAWN]
+        captured = board.piece_type_at(move.to_square)
+        return PIECE_VALUES[captured] if captured else 0
+
+    return sorted(board.legal_moves, key=capture_value, reverse=True)
+
+
+def create_engine_from_env() -> Engine:
+    """Use the Stockfish binary at STOCKFISH_PATH if set, the pure-Python searcher otherwise."""
+    path = os.getenv("STOCKFISH_PATH")
+    if path:
+        return UciEnginePool(
+            path,
+            size=int(os.getenv("ENGINE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+            time_limit=float(os.getenv("ENGINE_TIME_LIMIT", DEFAULT_TIME_LIMIT)),
+        )
+    return MaterialSearchEngine(depth=int(os.getenv("ENGINE_SEARCH_DEPTH", DEFAULT_SEARCH_DEPTH)))
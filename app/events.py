@@ -0,0 +1,30 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from app.resource import AgentEvent, AgentEventType
+
+# queue of the client streaming the current agent turn, if any. Tasks spawned during the
+# turn (e.g. fan-out candidates) inherit it through the context.
+_event_queue: ContextVar[asyncio.Queue[AgentEvent] | None] = ContextVar("agent_event_queue", default=None)
+
+
+def is_streaming() -> bool:
+    return _event_queue.get() is not None
+
+
+def emit(event_type: AgentEventType, **data) -> None:
+    """Publish an event to the client streaming the current turn; a no-op when nobody listens."""
+    queue = _event_queue.get()
+    if queue is not None:
+        queue.put_nowait(AgentEvent(type=event_type, data=data))
+
+
+@contextmanager
+def stream_events(queue: asyncio.Queue[AgentEvent]) -> Iterator[None]:
+    token = _event_queue.set(queue)
+    try:
+        yield
+    finally:
+        _event_queue.reset(token)
@@ -0,0 +1,240 @@
+"""Append-only storage of games, so that they survive restarts and any worker can serve any game.
+
+A game is stored as its settings plus one record per ply (the move, the entries it added to
+the agent's game memory and the clocks after it) and the candidate analyses of the turn in
+progress. Records are only ever appended; a ply that already exists is a conflict, which is
+how two workers racing on the same game find out.
+
+GAME_STORE_PATH selects a SQLite file shared by every worker on the host. Without it games
+only live in the registry of one worker, as before. `MemoryGameStore` stands in for a
+shared store in tests.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+
+
+class PlyConflictError(Exception):
+    """Raised when a ply is appended that another worker has already stored."""
+
+
+@dataclass
+class PlyRecord:
+    ply: int
+    uci: str
+    # entries the move added to the agent's game memory
+    memory: list[str] = field(default_factory=list)
+    # remaining seconds of white and black after the move, for games with a clock
+    clock: tuple[float, float] | None = None
+    played_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class StoredGame:
+    game_id: str
+    settings: dict
+    plies: list[PlyRecord]
+    # analyses of the turn in progress, i.e. made at the ply after the last stored one
+    analysis: list[dict]
+
+
+class GameStore(ABC):
+    name: str
+
+    @abstractmethod
+    def create_game(self, game_id: str, settings: dict) -> None:
+        pass
+
+    @abstractmethod
+    def load_game(self, game_id: str) -> StoredGame | None:
+        """The whole game, or None if it doesn't exist."""
+
+    @abstractmethod
+    def load_plies(self, game_id: str, since: int) -> list[PlyRecord] | None:
+        """The plies from `since` on, or None if the game doesn't exist (anymore)."""
+
+    @abstractmethod
+    def append_ply(self, game_id: str, record: PlyRecord) -> None:
+        """Store `record`, raising `PlyConflictError` if its ply is stored already."""
+
+    @abstractmethod
+    def append_analysis(self, game_id: str, ply: int, analysis: dict) -> None:
+        pass
+
+    @abstractmethod
+    def delete_game(self, game_id: str) -> bool:
+        """Delete the game and return whether it existed."""
+
+    @abstractmethod
+    def version(self) -> int:
+        """A cheap token that changes whenever another worker may have stored something.
+
+        As long as it is unchanged, what was loaded before is still up to date.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryGameStore(GameStore):
+    """Games in process memory: lost on restart and private to one worker."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._games: dict[str, StoredGame] = {}
+        # analyses of every ply, of which only those of the turn in progress are loaded
+        self._analyses: dict[str, list[tuple[int, dict]]] = {}
+        # counts every write, since the registries sharing this store can't tell whose it was
+        self._version = 0
+
+    def create_game(self, game_id: str, settings: dict) -> None:
+        self._games[game_id] = StoredGame(game_id=game_id, settings=settings, plies=[], analysis=[])
+        self._analyses[game_id] = []
+        self._version += 1
+
+    def load_game(self, game_id: str) -> StoredGame | None:
+        game = self._games.get(game_id)
+        if game is None:
+            return None
+        next_ply = len(game.plies)
+        return StoredGame(
+            game_id=game_id,
+            settings=dict(game.settings),
+            plies=list(game.plies),
+            analysis=[analysis for ply, analysis in self._analyses[game_id] if ply == next_ply],
+        )
+
+    def load_plies(self, game_id: str, since: int) -> list[PlyRecord] | None:
+        game = self._games.get(game_id)
+        return None if game is None else game.plies[since:]
+
+    def append_ply(self, game_id: str, record: PlyRecord) -> None:
+        plies = self._games[game_id].plies
+        if record.ply != len(plies):
+            raise PlyConflictError(f"Ply {record.ply} of game {game_id} conflicts with {len(plies)} stored plies")
+        plies.append(record)
+        self._version += 1
+
+    def append_analysis(self, game_id: str, ply: int, analysis: dict) -> None:
+        self._analyses[game_id].append((ply, analysis))
+
+    def delete_game(self, game_id: str) -> bool:
+        self._analyses.pop(game_id, None)
+        self._version += 1
+        return self._games.pop(game_id, None) is not None
+
+    def version(self) -> int:
+        return self._version
+
+
+class SqliteGameStore(GameStore):
+    """Games in a SQLite file in WAL mode, shared by every worker process on the host.
+
+    Every append is its own transaction, so a crash loses at most the record being written.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        # writers from other workers wait for each other instead of failing right away
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS games ("
+            "game_id TEXT PRIMARY KEY, settings TEXT NOT NULL, created_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS plies ("
+            "game_id TEXT NOT NULL, ply INTEGER NOT NULL, record TEXT NOT NULL, PRIMARY KEY (game_id, ply));"
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            "game_id TEXT NOT NULL, ply INTEGER NOT NULL, analysis TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS analyses_game_ply ON analyses (game_id, ply);"
+        )
+
+    @staticmethod
+    def _ply_record(value: str) -> PlyRecord:
+        record = json.loads(value)
+        if record["clock"] is not None:
+            record["clock"] = tuple(record["clock"])
+        return PlyRecord(**record)
+
+    def create_game(self, game_id: str, settings: dict) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO games (game_id, settings, created_at) VALUES (?, ?, ?)",
+                (game_id, json.dumps(settings), time.time()),
+            )
+
+    def load_game(self, game_id: str) -> StoredGame | None:
+        with self._lock:
+            row = self._connection.execute("SELECT settings FROM games WHERE game_id = ?", (game_id,)).fetchone()
+            if row is None:
+                return None
+            plies = [
+                self._ply_record(value)
+                for value, in self._connection.execute(
+                    "SELECT record FROM plies WHERE game_id = ? ORDER BY ply", (game_id,)
+                )
+            ]
+            analysis = [
+                json.loads(value)
+                for value, in self._connection.execute(
+                    "SELECT analysis FROM analyses WHERE game_id = ? AND ply = ? ORDER BY rowid", (game_id, len(plies))
+                )
+            ]
+        return StoredGame(game_id=game_id, settings=json.loads(row[0]), plies=plies, analysis=analysis)
+
+    def load_plies(self, game_id: str, since: int) -> list[PlyRecord] | None:
+        with self._lock:
+            if self._connection.execute("SELECT 1 FROM games WHERE game_id = ?", (game_id,)).fetchone() is None:
+                return None
+            return [
+                self._ply_record(value)
+                for value, in self._connection.execute(
+                    "SELECT record FROM plies WHERE game_id = ? AND ply >= ? ORDER BY ply", (game_id, since)
+                )
+            ]
+
+    def append_ply(self, game_id: str, record: PlyRecord) -> None:
+        with self._lock:
+            try:
+                self._connection.execute(
+                    "INSERT INTO plies (game_id, ply, record) VALUES (?, ?, ?)",
+                    (game_id, record.ply, json.dumps(asdict(record))),
+                )
+            except sqlite3.IntegrityError as e:
+                raise PlyConflictError(f"Ply {record.ply} of game {game_id} is stored already") from e
+
+    def append_analysis(self, game_id: str, ply: int, analysis: dict) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO analyses (game_id, ply, analysis) VALUES (?, ?, ?)", (game_id, ply, json.dumps(analysis))
+            )
+
+    def delete_game(self, game_id: str) -> bool:
+        with self._lock:
+            self._connection.execute("BEGIN")
+            deleted = self._connection.execute("DELETE FROM games WHERE game_id = ?", (game_id,)).rowcount
+            self._connection.execute("DELETE FROM plies WHERE game_id = ?", (game_id,))
+            self._connection.execute("DELETE FROM analyses WHERE game_id = ?", (game_id,))
+            self._connection.execute("COMMIT")
+        return deleted > 0
+
+    def version(self) -> int:
+        # changes with every commit of another connection, i.e. another worker, and costs no disk read
+        with self._lock:
+            return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def create_game_store_from_env() -> GameStore | None:
+    path = os.getenv("GAME_STORE_PATH")
+    return SqliteGameStore(path) if path else None
@@ -1,54 +1,277 @@
+import asyncio
 import os
-from dotenv import load_dotenv
+import random
+import time
+from dataclasses import dataclass
 import logging
 
-from openai import OpenAI
-from openai.types.responses.parsed_response import (
-    ParsedResponse,
-    ParsedResponseOutputMessage,
+from app import events
+from app.llm_backend import LLMBackend, create_backend_from_env
+from app.llm_resilience import (
+    LLM_FALLBACKS,
+    LLM_HEDGES,
+    LLM_RETRIES,
+    LatencyTracker,
+    LLMTimeoutError,
+    LLMUnavailableError,
+    ResiliencePolicy,
+    failure_reason,
+    is_retryable,
 )
+from app.llm_scheduler import LLMScheduler
+from app.metrics import LLM_CALL_SECONDS, LLM_CALLS, LLM_COST, LLM_TOKENS
 
 # Configure logging for OpenAI
 logging.getLogger("openai").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 64
+DEFAULT_LOG_SAMPLE_RATE = 0.05
+
+# US dollars per million (uncached input, cached input, output) tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def estimate_cost(model: str, input_tokens: int, cached_input_tokens: int, output_tokens: int) -> float:
+    """Dollar cost of one call, or 0 for models missing from MODEL_PRICES."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    input_price, cached_input_price, output_price = prices
+    return (
+        (input_tokens - cached_input_tokens) * input_price
+        + cached_input_tokens * cached_input_price
+        + output_tokens * output_price
+    ) / 1_000_000
+
+
+@dataclass
+class LLMUsage:
+    """Running token counts of the LLM calls made on behalf of one consumer."""
+    calls: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+
+    def record(self, input_tokens: int, cached_input_tokens: int, output_tokens: int, cost_usd: float = 0.0) -> None:
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.cached_input_tokens += cached_input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += cost_usd
+
+
 class LLMManager():
-    def __init__(self):
-        load_dotenv("secrets.env")
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=openai_api_key)
+    """Runs LLM calls through a pluggable backend, by default the OpenAI Responses API.
+
+    A single instance is meant to be shared by every game so that all agents reuse
+    one backend (and its pooled HTTP client) and one `LLMScheduler`, which bounds how many
+    calls are in flight across the whole server, applies the global rate limits and
+    coalesces identical concurrent calls. Calls are bounded by the deadlines, retries,
+    hedging and model fallbacks of a `ResiliencePolicy`.
+
+    Every call feeds the LLM metrics. Only a `log_sample_rate` share of calls is logged,
+    with the full prompts and response at DEBUG, so that logging stays cheap under load.
+    """
 
-    def call_llm(
+    def __init__(
+            self,
+            backend: LLMBackend | None = None,
+            max_concurrent_requests: int | None = None,
+            log_sample_rate: float | None = None,
+            policy: ResiliencePolicy | None = None,
+        ):
+        if max_concurrent_requests is None:
+            max_concurrent_requests = int(
+                os.getenv("LLM_MAX_CONCURRENT_REQUESTS", DEFAULT_MAX_CONCURRENT_REQUESTS)
+            )
+        if log_sample_rate is None:
+            log_sample_rate = float(os.getenv("LLM_LOG_SAMPLE_RATE", DEFAULT_LOG_SAMPLE_RATE))
+
+        self.backend = backend if backend is not None else create_backend_from_env()
+        self.log_sample_rate = log_sample_rate
+        self.scheduler = LLMScheduler.from_env(self.backend, max_concurrent_requests)
+        self.policy = policy if policy is not None else ResiliencePolicy.from_env()
+        self.latencies = LatencyTracker()
+
+    async def warm_up(self, response_formats: list[type]) -> None:
+        """Let the backend prepare for calls with `response_formats`, e.g. open its connections."""
+        await self.backend.warm_up(response_formats)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    async def call_llm(
             self,
             model: str,
             system_prompt: str,
             user_prompt: str,
             response_format,
             temperature: float = 1,
+            usage: LLMUsage | None = None,
+            stage: str | None = None,
         ):
-        print(
-            f"Calling LLM with system prompt: {system_prompt}\n\n"
-            f"User prompt: {user_prompt}\n\n"
-            f"Response format: {response_format}"
-        )
-        response = self.client.responses.parse(
-            model=model,
-            input=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            text_format=response_format,
-            temperature=temperature,
-        )
-        print("OpenAI call successful")
+        """Return the parsed answer of `model` or, once it keeps failing, of its fallback models.
+
+        Raises `LLMTimeoutError` when the deadline of `stage` passes first, `LLMUnavailableError`
+        when every model of the chain failed with retryable errors, and any other error as is.
+        """
+        deadline = time.monotonic() + self.policy.deadline(stage)
+        chain = self.policy.model_chain(model)
+        last_error: Exception | None = None
+
+        for model_index, chain_model in enumerate(chain):
+            if model_index > 0:
+                LLM_FALLBACKS.inc(from_model=chain[model_index - 1], to_model=chain_model)
+                logger.warning(
+                    "llm_fallback from_model=%s to_model=%s stage=%s", chain[model_index - 1], chain_model, stage
+                )
 
-        print("Extracting Pydantic object from OpenAI response...")
-        output_message = next(
-            item
-            for item in response.output
-            if isinstance(item, ParsedResponseOutputMessage)
+            for attempt in range(self.policy.max_retries + 1):
+                if attempt > 0:
+                    LLM_RETRIES.inc(model=chain_model, reason=failure_reason(last_error))
+                    await asyncio.sleep(min(self.policy.backoff(attempt - 1), max(deadline - time.monotonic(), 0)))
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError(f"No LLM answer for stage {stage} within its deadline") from last_error
+                try:
+                    async with asyncio.timeout(min(remaining, self.policy.attempt_timeout)):
+                        return await self._call_hedged(
+                            chain_model, system_prompt, user_prompt, response_format, temperature, usage
+                        )
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    last_error = e
+
+        raise LLMUnavailableError(f"Every model of {' > '.join(chain)} failed for stage {stage}") from last_error
+
+    async def _call_hedged(
+            self,
+            model: str,
+            system_prompt: str,
+            user_prompt: str,
+            response_format,
+            temperature: float,
+            usage: LLMUsage | None,
+        ):
+        """Make one attempt, duplicated once it takes longer than the hedging percentile.
+
+        Streamed attempts are never hedged, as the client would see both answers' deltas.
+        """
+        hedge_after = None
+        if self.policy.hedge_percentile > 0 and not events.is_streaming():
+            hedge_after = self.latencies.percentile(
+                model, response_format.__name__, self.policy.hedge_percentile, self.policy.hedge_min_samples
+            )
+        if hedge_after is None:
+            return await self._call(model, system_prompt, user_prompt, response_format, temperature, usage)
+
+        primary = asyncio.ensure_future(
+            self._call(model, system_prompt, user_prompt, response_format, temperature, usage)
         )
-        data = output_message.content[0].parsed
-        print(f"Pydantic object extracted from OpenAI response: {data}")
-        return data
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done:
+                return primary.result()
+
+            hedge = asyncio.ensure_future(
+                self._call(model, system_prompt, user_prompt, response_format, temperature, usage, hedge=True)
+            )
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGES.inc(model=model, winner="hedge" if task is hedge else "primary")
+                        return task.result()
+            # both failed
+            return primary.result()
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    async def _call(
+            self,
+            model: str,
+            system_prompt: str,
+            user_prompt: str,
+            response_format,
+            temperature: float,
+            usage: LLMUsage | None,
+            hedge: bool = False,
+        ):
+        start = time.perf_counter()
+        try:
+            response, coalesced = await self.scheduler.submit(
+                model=model,
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                response_format=response_format,
+                temperature=temperature,
+                hedge=hedge,
+            )
+        except asyncio.CancelledError:
+            LLM_CALLS.inc(model=model, response_format=response_format.__name__, status="cancelled")
+            raise
+        except Exception:
+            LLM_CALLS.inc(model=model, response_format=response_format.__name__, status="error")
+            logger.warning(
+                "llm_call_failed backend=%s model=%s response_format=%s seconds=%.3f",
+                self.backend.name, model, response_format.__name__, time.perf_counter() - start,
+            )
+            raise
+        seconds = time.perf_counter() - start
+        if coalesced:
+            # the call that went out is accounted for already
+            LLM_CALLS.inc(model=model, response_format=response_format.__name__, status="coalesced")
+            # a copy, because the agent rewrites the move of the response it gets in place
+            return response.parsed.model_copy(deep=True)
+
+        cost_usd = 0.0
+        if response.billed:
+            cost_usd = estimate_cost(model, response.input_tokens, response.cached_input_tokens, response.output_tokens)
+        LLM_CALLS.inc(model=model, response_format=response_format.__name__, status="ok")
+        LLM_CALL_SECONDS.observe(seconds, model=model, response_format=response_format.__name__)
+        self.latencies.record(model, response_format.__name__, seconds)
+        LLM_TOKENS.inc(response.input_tokens, model=model, kind="input")
+        LLM_TOKENS.inc(response.cached_input_tokens, model=model, kind="cached_input")
+        LLM_TOKENS.inc(response.output_tokens, model=model, kind="output")
+        LLM_COST.inc(cost_usd, model=model)
+        if usage is not None:
+            usage.record(
+                input_tokens=response.input_tokens,
+                cached_input_tokens=response.cached_input_tokens,
+                output_tokens=response.output_tokens,
+                cost_usd=cost_usd,
+            )
 
+        if random.random() < self.log_sample_rate:
+            logger.info(
+                "llm_call backend=%s model=%s response_format=%s seconds=%.3f input_tokens=%d "
+                "cached_input_tokens=%d output_tokens=%d cost_usd=%.6f",
+                self.backend.name,
+                model,
+                response_format.__name__,
+                seconds,
+                response.input_tokens,
+                response.cached_input_tokens,
+                response.output_tokens,
+                cost_usd,
+            )
+            logger.debug(
+                "llm_call_payload system_prompt=%r user_prompt=%r response=%s",
+                system_prompt,
+                user_prompt,
+                response.parsed.model_dump_json(),
+            )
+        return response.parsed
@@ -0,0 +1,573 @@
+"""Interchangeable backends behind `LLMManager`.
+
+LLM_BACKEND selects one:
+
+- `openai` (default) calls the OpenAI Responses API.
+- `synthetic` answers locally with random legal moves after a latency drawn from
+  LLM_SYNTHETIC_LATENCY, for load tests and benchmarks without network access.
+- `record` answers from the recordings in LLM_RECORDINGS_PATH and calls OpenAI, saving
+  the answer, for any prompt it has not seen yet.
+- `replay` answers only from LLM_RECORDINGS_PATH and fails on unseen prompts, which makes
+  runs deterministic and free.
+- `batch_file` answers from LLM_RECORDINGS_PATH where it can, and otherwise appends the
+  request to the OpenAI Batch API file LLM_BATCH_FILE_PATH and answers synthetically. For
+  evaluation runs at batch prices: run, submit the file to the Batch API, import its
+  results with `python -m app.llm_backend import-batch-results`, and run again; every
+  round answers one more step of each game from real model output.
+
+Every backend returns the same Pydantic response models the agent asks for. Constructing one
+is cheap: the OpenAI client is only created on the first call, or by `warm_up` when the
+server starts.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import Generic, Literal, TypeVar, get_args, get_origin
+
+import chess
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAIError, pydantic_function_tool
+from openai.types.responses.parsed_response import ParsedResponse, ParsedResponseOutputMessage
+from pydantic import BaseModel, ValidationError
+
+from app import events
+from app.llm_resource import AnalysisLLMChessMove, Decision, DecisionOptions, MoveSelection
+from app.prompt_builder import estimate_tokens
+from app.resource import AgentEventType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_WARM_UP_CONNECTIONS = 2
+DEFAULT_WARM_UP_TIMEOUT = 5.0
+DEFAULT_RECORDINGS_PATH = "llm_recordings"
+DEFAULT_BATCH_FILE_PATH = "llm_batch_requests.jsonl"
+
+FEN_PATTERN = re.compile(r"FEN: (.+)")
+CONSIDERED_PATTERN = re.compile(r"<considered_moves>\n(.*?)\n</considered_moves>", re.DOTALL)
+
+ParsedT = TypeVar("ParsedT", bound=BaseModel)
+
+
+def text_format_param(response_format: type[BaseModel]) -> dict:
+    """The Responses API `text.format` of `response_format`, as `responses.parse(text_format=...)` sends it.
+
+    Built from the strict JSON schema of the SDK's public `pydantic_function_tool`.
+    """
+    tool = pydantic_function_tool(response_format)
+    return {
+        "type": "json_schema",
+        "strict": True,
+        "name": response_format.__name__,
+        "schema": tool["function"]["parameters"],
+    }
+
+
+class LLMBackendType(str, Enum):
+    OPENAI = "openai"
+    SYNTHETIC = "synthetic"
+    RECORD = "record"
+    REPLAY = "replay"
+    BATCH_FILE = "batch_file"
+
+
+@dataclass
+class LLMResponse(Generic[ParsedT]):
+    """A parsed response, the token usage reported for it and whether the API charged for it."""
+    parsed: ParsedT
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    # only answers that actually came from the OpenAI API, not synthetic or replayed ones
+    billed: bool = False
+
+
+class RecordingNotFoundError(LookupError):
+    pass
+
+
+class LLMBackend(ABC):
+    name: str
+
+    @abstractmethod
+    async def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: type[ParsedT],
+        temperature: float = 1,
+    ) -> LLMResponse[ParsedT]:
+        """Return the model's answer to the prompts parsed into `response_format`."""
+
+    async def warm_up(self, response_formats: list[type[BaseModel]]) -> None:
+        """Prepare what the first calls with `response_formats` would otherwise wait for.
+
+        Failures are logged rather than raised: the first call just pays for it instead.
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """The OpenAI Responses API on one pooled HTTP client, created on first use.
+
+    Warming up creates the client, converts the response formats to their JSON schemas once
+    and opens LLM_WARM_UP_CONNECTIONS connections to the API, so that the first moves don't
+    pay for the TLS handshakes.
+    """
+
+    name = "openai"
+
+    def __init__(self, max_connections: int | None = None, max_keepalive_connections: int | None = None):
+        if max_connections is None:
+            max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS))
+        if max_keepalive_connections is None:
+            max_keepalive_connections = int(
+                os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE_CONNECTIONS)
+            )
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.warm_up_connections = int(os.getenv("LLM_WARM_UP_CONNECTIONS", DEFAULT_WARM_UP_CONNECTIONS))
+        self.warm_up_timeout = float(os.getenv("LLM_WARM_UP_TIMEOUT", DEFAULT_WARM_UP_TIMEOUT))
+        self._client: AsyncOpenAI | None = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            # retries and timeouts are applied per agent stage by `LLMManager`
+            self._client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=DefaultAsyncHttpxClient(limits=self.limits),
+                max_retries=0,
+            )
+        return self._client
+
+    async def warm_up(self, response_formats: list[type[BaseModel]]) -> None:
+        try:
+            client = self.client
+        except OpenAIError as e:
+            logger.warning("Could not create the OpenAI client: %s", e)
+            return
+        for response_format in response_formats:
+            text_format_param(response_format)
+        if self.warm_up_connections <= 0:
+            return
+
+        # concurrent requests, so that each one opens its own pooled connection
+        requests = [client.models.list() for _ in range(self.warm_up_connections)]
+        try:
+            await asyncio.wait_for(asyncio.gather(*requests), self.warm_up_timeout)
+        except Exception as e:
+            logger.warning("Could not open connections to the OpenAI API: %s", e)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+
+    async def _stream_response(
+        self,
+        model: str,
+        llm_input: list[dict],
+        response_format,
+        temperature: float,
+    ) -> ParsedResponse:
+        """Same as `responses.parse`, but forwards the output text to the streaming client as it is generated."""
+        async with self.client.responses.stream(
+            model=model,
+            input=llm_input,
+            text_format=response_format,
+            temperature=temperature,
+        ) as stream:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    events.emit(
+                        AgentEventType.REASONING_DELTA,
+                        response_format=response_format.__name__,
+                        delta=event.delta,
+                    )
+            return await stream.get_final_response()
+
+    async def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: type[ParsedT],
+        temperature: float = 1,
+    ) -> LLMResponse[ParsedT]:
+        llm_input = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        if events.is_streaming():
+            response = await self._stream_response(model, llm_input, response_format, temperature)
+        else:
+            response = await self.client.responses.parse(
+                model=model,
+                input=llm_input,
+                text_format=response_format,
+                temperature=temperature,
+            )
+
+        output_message = next(
+            item
+            for item in response.output
+            if isinstance(item, ParsedResponseOutputMessage)
+        )
+        llm_response = LLMResponse(parsed=output_message.content[0].parsed, billed=True)
+        if response.usage is not None:
+            llm_response.input_tokens = response.usage.input_tokens
+            llm_response.cached_input_tokens = response.usage.input_tokens_details.cached_tokens
+            llm_response.output_tokens = response.usage.output_tokens
+        return llm_response
+
+
+class LatencyDistribution:
+    """Seconds to wait per synthetic call, parsed from a spec such as:
+
+    - `0.5`: always half a second
+    - `uniform:0.2:1.5`: uniformly between the two bounds
+    - `normal:0.8:0.2`: mean and standard deviation, clipped at zero
+    - `lognormal:0.8:0.5`: median and shape, which gives the long tail real APIs show
+    """
+
+    def __init__(self, spec: str = "0"):
+        kind, _, params = spec.partition(":")
+        try:
+            if not params:
+                self.kind, self.params = "fixed", (float(kind),)
+            else:
+                self.kind, self.params = kind, tuple(float(param) for param in params.split(":"))
+        except ValueError as e:
+            raise ValueError(f"Invalid latency distribution {spec!r}") from e
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal") or len(self.params) != (
+            1 if self.kind == "fixed" else 2
+        ):
+            raise ValueError(f"Invalid latency distribution {spec!r}")
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(rng.gauss(*self.params), 0.0)
+        median, sigma = self.params
+        return median * rng.lognormvariate(0, sigma)
+
+
+class SyntheticBackend(LLMBackend):
+    """Answers every call with a random legal move read off the FEN line of the prompt.
+
+    It considers two moves before deciding (or selects from two random candidates in a
+    single call), reports token counts estimated from the prompt, and with
+    `illegal_move_rate` above zero deliberately answers some calls with an illegal move so
+    that the repair path gets exercised. Like structured outputs, it only answers with the
+    moves of a response format restricted by `MoveSchemaFactory`.
+    """
+
+    name = "synthetic"
+
+    def __init__(
+        self,
+        latency: LatencyDistribution | None = None,
+        illegal_move_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.latency = latency if latency is not None else LatencyDistribution()
+        self.illegal_move_rate = illegal_move_rate
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls) -> "SyntheticBackend":
+        seed = os.getenv("LLM_SYNTHETIC_SEED")
+        return cls(
+            latency=LatencyDistribution(os.getenv("LLM_SYNTHETIC_LATENCY", "0")),
+            illegal_move_rate=float(os.getenv("LLM_SYNTHETIC_ILLEGAL_MOVE_RATE", 0)),
+            seed=int(seed) if seed is not None else None,
+        )
+
+    @staticmethod
+    def _choices(response_format: type[BaseModel]) -> tuple[str, ...] | None:
+        """The moves a restricted response format admits, or None if it admits any string."""
+        annotation = response_format.model_fields["move"].annotation
+        return get_args(annotation) if get_origin(annotation) is Literal else None
+
+    def _random_move(self, user_prompt: str, choices: tuple[str, ...] | None = None) -> str:
+        if choices:
+            return self.random.choice(choices)
+        if self.random.random() < self.illegal_move_rate:
+            return "Ke9"
+        board = chess.Board(FEN_PATTERN.search(user_prompt).group(1))
+        return board.san(self.random.choice(list(board.legal_moves)))
+
+    def _answer(self, user_prompt: str, response_format: type[BaseModel]) -> BaseModel:
+        if issubclass(response_format, Decision):
+            considered = CONSIDERED_PATTERN.search(user_prompt)
+            num_considered = 0
+            if considered is not None and not considered.group(1).startswith("No moves"):
+                num_considered = len(considered.group(1).splitlines())
+            decision = DecisionOptions.CONSIDER_NEW_MOVE if num_considered < 2 else DecisionOptions.DECIDE_ON_MOVE
+            return Decision(decision=decision, reasoning="synthetic")
+        if issubclass(response_format, MoveSelection):
+            candidate_format = get_args(response_format.model_fields["candidates"].annotation)[0]
+            choices = self._choices(candidate_format)
+            candidates = [
+                candidate_format(move=self._random_move(user_prompt, choices), reasoning="synthetic", counter_moves=[])
+                for _ in range(2)
+            ]
+            return response_format(candidates=candidates, move=candidates[0].move, reasoning="synthetic")
+        move = self._random_move(user_prompt, self._choices(response_format))
+        if issubclass(response_format, AnalysisLLMChessMove):
+            return response_format(move=move, reasoning="synthetic", counter_moves=[])
+        return response_format(move=move, reasoning="synthetic")
+
+    async def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: type[ParsedT],
+        temperature: float = 1,
+    ) -> LLMResponse[ParsedT]:
+        delay = self.latency.sample(self.random)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        parsed = self._answer(user_prompt, response_format)
+        return LLMResponse(
+            parsed=parsed,
+            input_tokens=estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+            output_tokens=estimate_tokens(parsed.model_dump_json()),
+        )
+
+
+class RecordReplayBackend(LLMBackend):
+    """Serves recorded responses from a directory, one JSON file per prompt hash.
+
+    With an `inner` backend, prompts that were never recorded are forwarded to it and its
+    answer is saved; without one they raise `RecordingNotFoundError`. A recording that doesn't
+    validate against the requested format, e.g. a free-form move asked for again with the
+    moves restricted, counts as not recorded. One file per recording means concurrent
+    processes can share a directory without coordination.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, inner: LLMBackend | None = None):
+        self.path = path
+        self.inner = inner
+        if inner is not None:
+            self.name = "record"
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def prompt_hash(model: str, system_prompt: str, user_prompt: str, response_format: type[BaseModel]) -> str:
+        digest = hashlib.sha256()
+        for part in (model, response_format.__name__, system_prompt, user_prompt):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _recording_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def _load(self, key: str, response_format: type[ParsedT]) -> LLMResponse[ParsedT] | None:
+        try:
+            with open(self._recording_path(key), encoding="utf-8") as recording_file:
+                recording = json.load(recording_file)
+        except FileNotFoundError:
+            return None
+        try:
+            parsed = response_format.model_validate(recording["response"])
+        except ValidationError:
+            # e.g. a free-form move outside the moves a restricted format admits: not an answer to this call
+            logger.info("Recorded %s response %s does not fit the requested format", response_format.__name__, key[:12])
+            return None
+        return LLMResponse(
+            parsed=parsed,
+            input_tokens=recording["input_tokens"],
+            cached_input_tokens=recording["cached_input_tokens"],
+            output_tokens=recording["output_tokens"],
+        )
+
+    def _save(self, key: str, model: str, response_format: type[BaseModel], response: LLMResponse) -> None:
+        self.save_recording(key, {
+            "model": model,
+            "response_format": response_format.__name__,
+            "response": response.parsed.model_dump(mode="json"),
+            "input_tokens": response.input_tokens,
+            "cached_input_tokens": response.cached_input_tokens,
+            "output_tokens": response.output_tokens,
+        })
+
+    def save_recording(self, key: str, recording: dict) -> None:
+        # write then rename, so a concurrent reader never sees half a recording
+        temporary_path = f"{self._recording_path(key)}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as recording_file:
+            json.dump(recording, recording_file)
+        os.replace(temporary_path, self._recording_path(key))
+
+    async def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: type[ParsedT],
+        temperature: float = 1,
+    ) -> LLMResponse[ParsedT]:
+        key = self.prompt_hash(model, system_prompt, user_prompt, response_format)
+        response = self._load(key, response_format)
+        if response is not None:
+            return response
+        if self.inner is None:
+            raise RecordingNotFoundError(f"No recorded {response_format.__name__} response for prompt {key[:12]}")
+
+        response = await self.inner.complete(model, system_prompt, user_prompt, response_format, temperature)
+        self._save(key, model, response_format, response)
+        return response
+
+    async def warm_up(self, response_formats: list[type[BaseModel]]) -> None:
+        if self.inner is not None:
+            await self.inner.warm_up(response_formats)
+
+    async def close(self) -> None:
+        if self.inner is not None:
+            await self.inner.close()
+
+
+class BatchFileBackend(LLMBackend):
+    """Queues unanswered prompts in an OpenAI Batch API input file instead of calling the API.
+
+    Prompts already answered in `recordings` are replayed. Every other prompt is appended to
+    `path` once, keyed by its prompt hash, and answered by `fallback` so that the game can go on.
+    """
+
+    name = "batch_file"
+
+    def __init__(self, path: str, recordings: RecordReplayBackend, fallback: LLMBackend):
+        self.path = path
+        self.recordings = recordings
+        self.fallback = fallback
+        self._queued: set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as batch_file:
+                self._queued = {json.loads(line)["custom_id"] for line in batch_file if line.strip()}
+
+    async def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: type[ParsedT],
+        temperature: float = 1,
+    ) -> LLMResponse[ParsedT]:
+        try:
+            return await self.recordings.complete(model, system_prompt, user_prompt, response_format, temperature)
+        except RecordingNotFoundError:
+            pass
+
+        key = RecordReplayBackend.prompt_hash(model, system_prompt, user_prompt, response_format)
+        if key not in self._queued:
+            self._queued.add(key)
+            request = {
+                "custom_id": key,
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": {
+                    "model": model,
+                    "input": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    "text": {"format": text_format_param(response_format)},
+                    "temperature": temperature,
+                },
+            }
+            with open(self.path, "a", encoding="utf-8") as batch_file:
+                batch_file.write(json.dumps(request) + "\n")
+        return await self.fallback.complete(model, system_prompt, user_prompt, response_format, temperature)
+
+
+def import_batch_results(results_path: str, recordings_path: str) -> int:
+    """Store the successful responses of a Batch API output file as recordings; return how many."""
+    recordings = RecordReplayBackend(recordings_path)
+    imported = 0
+    with open(results_path, encoding="utf-8") as results_file:
+        for line in results_file:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                logger.warning("Skipping failed batch request %s: %s", result["custom_id"], result.get("error"))
+                continue
+
+            body = response["body"]
+            text = next(
+                content["text"]
+                for item in body["output"] if item["type"] == "message"
+                for content in item["content"] if content["type"] == "output_text"
+            )
+            usage = body.get("usage") or {}
+            recordings.save_recording(result["custom_id"], {
+                "model": body.get("model"),
+                "response": json.loads(text),
+                "input_tokens": usage.get("input_tokens", 0),
+                "cached_input_tokens": (usage.get("input_tokens_details") or {}).get("cached_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0),
+            })
+            imported += 1
+    return imported
+
+
+def create_backend(backend_type: LLMBackendType) -> LLMBackend:
+    recordings_path = os.getenv("LLM_RECORDINGS_PATH", DEFAULT_RECORDINGS_PATH)
+    if backend_type == LLMBackendType.BATCH_FILE:
+        return BatchFileBackend(
+            os.getenv("LLM_BATCH_FILE_PATH", DEFAULT_BATCH_FILE_PATH),
+            recordings=RecordReplayBackend(recordings_path),
+            fallback=SyntheticBackend.from_env(),
+        )
+    if backend_type == LLMBackendType.SYNTHETIC:
+        return SyntheticBackend.from_env()
+    if backend_type == LLMBackendType.RECORD:
+        return RecordReplayBackend(recordings_path, inner=OpenAIBackend())
+    if backend_type == LLMBackendType.REPLAY:
+        return RecordReplayBackend(recordings_path)
+    return OpenAIBackend()
+
+
+def create_backend_from_env() -> LLMBackend:
+    backend_type = LLMBackendType(os.getenv("LLM_BACKEND", LLMBackendType.OPENAI.value))
+    logger.info("Using the %s LLM backend", backend_type.value)
+    return create_backend(backend_type)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Import OpenAI Batch API results as LLM recordings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import-batch-results", help="store a batch output file as recordings")
+    import_parser.add_argument("results", help="the batch's output JSONL file")
+    import_parser.add_argument("--recordings", default=os.getenv("LLM_RECORDINGS_PATH", DEFAULT_RECORDINGS_PATH),
+                               help="recordings directory used by the replay and batch_file backends")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    imported = import_batch_results(args.results, args.recordings)
+    print(f"Imported {imported} responses into {args.recordings}")
+
+
+if __name__ == "__main__":
+    main()
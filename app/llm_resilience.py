@@ -0,0 +1,156 @@
+"""Timeouts, retries, hedged requests and model fallbacks for LLM calls.
+
+Every call made through `LLMManager.call_llm` gets a deadline for its agent stage
+(LLM_STAGE_DEADLINES, e.g. "decide_on_action=15,decide_on_move=30", else
+LLM_STAGE_DEADLINE_SECONDS), and every attempt within it at most LLM_ATTEMPT_TIMEOUT_SECONDS.
+Attempts that time out or fail with a retryable error (connection problems, rate limits,
+server errors) are retried LLM_MAX_RETRIES times after an exponential backoff with full
+jitter, then the next model of the fallback chain is tried (LLM_FALLBACK_MODELS, e.g.
+"gpt-4o=gpt-4o-mini"). An attempt still unanswered after the LLM_HEDGE_PERCENTILE latency
+of its model and response format gets a duplicate request, and whichever answers first wins.
+"""
+import os
+import random
+from collections import deque
+from dataclasses import dataclass, field
+
+import httpx
+import openai
+
+from app.metrics import REGISTRY
+
+DEFAULT_STAGE_DEADLINE = 60.0
+DEFAULT_ATTEMPT_TIMEOUT = 30.0
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 8.0
+DEFAULT_HEDGE_PERCENTILE = 0.95
+# latencies needed before the percentile is trusted enough to hedge on
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_FALLBACK_MODELS = {"gpt-4o": ("gpt-4o-mini",)}
+LATENCY_WINDOW = 200
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
+LLM_RETRIES = REGISTRY.counter(
+    "chess_llm_retries_total", "LLM attempts retried, by the reason the previous attempt failed", ("model", "reason")
+)
+LLM_HEDGES = REGISTRY.counter(
+    "chess_llm_hedges_total", "Duplicate LLM requests sent after the hedging threshold, by which one answered first",
+    ("model", "winner"),
+)
+LLM_FALLBACKS = REGISTRY.counter(
+    "chess_llm_fallbacks_total", "Calls that moved on to the next model of the fallback chain",
+    ("from_model", "to_model"),
+)
+
+
+class LLMError(Exception):
+    """An LLM call that could not be answered within its deadline and fallback chain."""
+
+
+class LLMTimeoutError(LLMError, TimeoutError):
+    pass
+
+
+class LLMUnavailableError(LLMError):
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def failure_reason(error: BaseException) -> str:
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIStatusError):
+        return str(error.status_code)
+    return type(error).__name__
+
+
+def _parse_mapping(spec: str) -> dict[str, str]:
+    """Parse "key=value,key=value" into a dict, ignoring blank entries."""
+    mapping = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        key, sep, value = entry.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid entry {entry!r}, expected key=value")
+        mapping[key.strip()] = value.strip()
+    return mapping
+
+
+@dataclass
+class ResiliencePolicy:
+    stage_deadlines: dict[str, float] = field(default_factory=dict)
+    default_deadline: float = DEFAULT_STAGE_DEADLINE
+    attempt_timeout: float = DEFAULT_ATTEMPT_TIMEOUT
+    max_retries: int = DEFAULT_MAX_RETRIES
+    backoff_base: float = DEFAULT_BACKOFF_BASE
+    backoff_max: float = DEFAULT_BACKOFF_MAX
+    # 0 disables hedging
+    hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE
+    hedge_min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES
+    fallback_models: dict[str, tuple[str, ...]] = field(default_factory=lambda: dict(DEFAULT_FALLBACK_MODELS))
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        fallback_spec = os.getenv("LLM_FALLBACK_MODELS")
+        if fallback_spec is None:
+            fallback_models = dict(DEFAULT_FALLBACK_MODELS)
+        else:
+            # "a=b>c" falls back from a to b, then c
+            fallback_models = {
+                model: tuple(fallbacks.split(">")) for model, fallbacks in _parse_mapping(fallback_spec).items()
+            }
+        return cls(
+            stage_deadlines={
+                stage: float(seconds) for stage, seconds in _parse_mapping(os.getenv("LLM_STAGE_DEADLINES", "")).items()
+            },
+            default_deadline=float(os.getenv("LLM_STAGE_DEADLINE_SECONDS", DEFAULT_STAGE_DEADLINE)),
+            attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", DEFAULT_ATTEMPT_TIMEOUT)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", DEFAULT_BACKOFF_BASE)),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", DEFAULT_BACKOFF_MAX)),
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", DEFAULT_HEDGE_PERCENTILE)),
+            hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", DEFAULT_HEDGE_MIN_SAMPLES)),
+            fallback_models=fallback_models,
+        )
+
+    def deadline(self, stage: str | None) -> float:
+        return self.stage_deadlines.get(stage, self.default_deadline)
+
+    def model_chain(self, model: str) -> tuple[str, ...]:
+        return (model, *self.fallback_models.get(model, ()))
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform up to the exponentially growing cap, so retrying callers spread out."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class LatencyTracker:
+    """Recent successful call latencies per model and response format, for the hedging threshold."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._latencies: dict[tuple[str, str], deque[float]] = {}
+
+    def record(self, model: str, response_format: str, seconds: float) -> None:
+        key = (model, response_format)
+        latencies = self._latencies.get(key)
+        if latencies is None:
+            latencies = self._latencies[key] = deque(maxlen=self.window)
+        latencies.append(seconds)
+
+    def percentile(self, model: str, response_format: str, percentile: float, min_samples: int) -> float | None:
+        """The `percentile` latency, or None with fewer than `min_samples` latencies recorded."""
+        latencies = self._latencies.get((model, response_format))
+        if not latencies or len(latencies) < min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(int(len(ordered) * percentile), len(ordered) - 1)]
@@ -1,11 +1,37 @@
-from pydantic import BaseModel, Field
+import functools
 from enum import Enum
 
-MOVE_DESCRIPTION = """The move to make in standard algebraic notation.
+import chess
+from pydantic import BaseModel, Field, create_model
+
+# the side-dependent descriptions are templates; the models below are written for Black, `for_side` rewrites them
+MOVE_DESCRIPTION_TEMPLATE = """The move to make in standard algebraic notation.
 Example of a correct response: 'e5'.
 Examples of incorrect responses: '2. e5' or 'e5 is the best move to play in this position.'
 For the love of god please don't add prefixes like '2.' or '2... ' to your move.
-Black to play."""
+{Side} to play."""
+COUNTER_MOVE_DESCRIPTION_TEMPLATE = "The counter move by {opponent} to consider in standard algebraic notation."
+COUNTER_MOVE_REASONING_DESCRIPTION_TEMPLATE = (
+    "A thorough analysis of the counter move considered. "
+    "Be concise - don't use more than three sentences. "
+    "Focus on the threats that this counter move creates for {side}. "
+    "Conclude with the strength of this counter move and how it affects the merit of the original move."
+)
+COUNTER_MOVES_DESCRIPTION_TEMPLATE = "A list of counter moves by {opponent} to consider. Consider at least two moves."
+CHOOSE_FROM_CANDIDATES = "\nChoose it from your candidates."
+
+
+def side_names(color: chess.Color) -> dict[str, str]:
+    """The fields of the side-dependent templates of prompts and schemas, for the agent playing `color`."""
+    return {
+        "Side": chess.COLOR_NAMES[color].capitalize(),
+        "side": chess.COLOR_NAMES[color],
+        "opponent": chess.COLOR_NAMES[not color],
+    }
+
+
+BLACK = side_names(chess.BLACK)
+MOVE_DESCRIPTION = MOVE_DESCRIPTION_TEMPLATE.format(**BLACK)
 
 class DecisionOptions(Enum):
     CONSIDER_NEW_MOVE = "consider_new_move"
@@ -16,11 +42,8 @@ class Decision(BaseModel):
     reasoning: str
 
 class CounterMove(BaseModel):
-    counter_move: str = Field(description="The counter move by white to consider in standard algebraic notation.")
-    reasoning: str = Field(description="A thorough analysis of the counter move considered. "
-        "Be concise - don't use more than three sentences. "
-        "Focus on the threats that this counter move creates for black. "
-        "Conclude with the strength of this counter move and how it affects the merit of the original move.")
+    counter_move: str = Field(description=COUNTER_MOVE_DESCRIPTION_TEMPLATE.format(**BLACK))
+    reasoning: str = Field(description=COUNTER_MOVE_REASONING_DESCRIPTION_TEMPLATE.format(**BLACK))
 
 class BaseLLMChessMove(BaseModel):
     move: str = Field(description=MOVE_DESCRIPTION)
@@ -40,4 +63,64 @@ class AnalysisLLMChessMove(BaseLLMChessMove):
         "After the opening, focus on tactical considerations rather than vague, positional statements. "
         "Conclude with the strength of this move based on the analysis of the counter moves considered."
     ))
-    counter_moves: list[CounterMove] = Field(description="A list of counter moves by white to consider. Consider at least two moves.")
+    counter_moves: list[CounterMove] = Field(description=COUNTER_MOVES_DESCRIPTION_TEMPLATE.format(**BLACK))
+
+class MoveSelection(BaseModel):
+    """Candidates, their counter moves and the final choice in a single response."""
+    candidates: list[AnalysisLLMChessMove] = Field(
+        description="The candidate moves you analysed, most promising first. Analyse at least two distinct moves."
+    )
+    move: str = Field(description=MOVE_DESCRIPTION + CHOOSE_FROM_CANDIDATES)
+    reasoning: str = Field(description="Why this move is the best of the candidates. "
+        "Be concise - don't use more than three sentences.")
+
+# every response format the agent asks for
+RESPONSE_FORMATS = [Decision, BaseLLMChessMove, AnalysisLLMChessMove, MoveSelection]
+
+
+@functools.cache
+def for_side(response_format: type[BaseModel], color: chess.Color) -> type[BaseModel]:
+    """`response_format` with its descriptions written for the agent playing `color`.
+
+    The models above are Black's and are returned as they are, like `Decision`, which
+    doesn't depend on the side. White's copies keep the original names, which key
+    metrics and recordings; their prompts name the side, so they never share a response.
+    """
+    if color == chess.BLACK or response_format is Decision:
+        return response_format
+    names = side_names(color)
+    move = (str, Field(description=MOVE_DESCRIPTION_TEMPLATE.format(**names)))
+    if response_format is BaseLLMChessMove:
+        return create_model(BaseLLMChessMove.__name__, __base__=BaseLLMChessMove, move=move)
+
+    counter_move = create_model(
+        CounterMove.__name__,
+        __base__=CounterMove,
+        counter_move=(str, Field(description=COUNTER_MOVE_DESCRIPTION_TEMPLATE.format(**names))),
+        reasoning=(str, Field(description=COUNTER_MOVE_REASONING_DESCRIPTION_TEMPLATE.format(**names))),
+    )
+    analysis = create_model(
+        AnalysisLLMChessMove.__name__,
+        __base__=AnalysisLLMChessMove,
+        move=move,
+        counter_moves=(list[counter_move], Field(description=COUNTER_MOVES_DESCRIPTION_TEMPLATE.format(**names))),
+    )
+    if response_format is AnalysisLLMChessMove:
+        return analysis
+    if response_format is MoveSelection:
+        return create_model(
+            MoveSelection.__name__,
+            __base__=MoveSelection,
+            candidates=(list[analysis], MoveSelection.model_fields["candidates"]),
+            move=(str, Field(description=MOVE_DESCRIPTION_TEMPLATE.format(**names) + CHOOSE_FROM_CANDIDATES)),
+        )
+    raise ValueError(f"No descriptions for {response_format.__name__} to rewrite")
+
+
+def move_restriction(response_format: type[BaseModel]) -> str | None:
+    """Digest of the moves a format restricted by `MoveSchemaFactory` admits, None for the original formats.
+
+    Restricted formats keep the original's name, so calls that must not share answers with
+    calls for the original format or other restrictions key on this as well.
+    """
+    return getattr(response_format, "move_restriction", None)
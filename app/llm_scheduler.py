@@ -0,0 +1,246 @@
+"""Scheduling of LLM calls shared by every game: micro-batching, coalescing and rate limiting.
+
+Calls submitted within LLM_BATCH_WINDOW_MS of each other are collected and dispatched
+together (at most LLM_MAX_BATCH_SIZE at a time, and immediately with a window of 0), each
+one waiting for the global rate limit of LLM_REQUESTS_PER_MINUTE requests and
+LLM_TOKENS_PER_MINUTE tokens before it is sent. A call identical to one still in flight
+(same model, response format, including the moves it is restricted to, and prompts, which
+means the same position and memory) does not go out at all and shares the first call's
+answer. A call whose callers have all gone away, e.g. after a timeout, is cancelled.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from app.llm_backend import LLMBackend, LLMResponse, RecordReplayBackend
+from app.llm_resource import move_restriction
+from app.metrics import REGISTRY
+from app.prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_WINDOW_MS = 5
+DEFAULT_MAX_BATCH_SIZE = 64
+# providers count the requested output allowance against the token limit before the call
+ESTIMATED_OUTPUT_TOKENS = 300
+
+LLM_COALESCED = REGISTRY.counter(
+    "chess_llm_coalesced_total", "LLM calls answered by an identical call already in flight", ("model",)
+)
+LLM_BATCH_SIZE = REGISTRY.histogram(
+    "chess_llm_batch_size", "Calls dispatched together per scheduling window", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+LLM_RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "chess_llm_rate_limit_wait_seconds", "Time calls waited for the global request and token rate limits"
+)
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, refilled continuously. 0 means unlimited.
+
+    Waiting callers are served in arrival order, so a large request is not starved by
+    a stream of small ones.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed_minutes = (now - self._updated) / 60
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self._requests + elapsed_minutes * self.requests_per_minute, self.requests_per_minute)
+        if self.tokens_per_minute:
+            self._tokens = min(self._tokens + elapsed_minutes * self.tokens_per_minute, self.tokens_per_minute)
+
+    async def acquire(self, tokens: int) -> None:
+        if not self.limited:
+            return
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Give back (or take) the difference between the estimate a call reserved and what it used."""
+        if self.tokens_per_minute:
+            self._tokens = min(self._tokens + estimated_tokens - actual_tokens, self.tokens_per_minute)
+
+
+@dataclass
+class _PendingCall:
+    key: str
+    model: str
+    system_prompt: str
+    user_prompt: str
+    response_format: type
+    temperature: float
+    future: asyncio.Future
+    waiters: int = 1
+    task: asyncio.Task | None = None
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        backend: LLMBackend,
+        max_concurrent_requests: int,
+        rate_limiter: RateLimiter | None = None,
+        batch_window: float = DEFAULT_BATCH_WINDOW_MS / 1000,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    ):
+        self.backend = backend
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._in_flight: dict[str, _PendingCall] = {}
+        self._pending: list[_PendingCall] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # the event loop only keeps weak references to tasks
+        self._dispatching: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, backend: LLMBackend, max_concurrent_requests: int) -> "LLMScheduler":
+        return cls(
+            backend,
+            max_concurrent_requests,
+            rate_limiter=RateLimiter(
+                requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", 0)),
+                tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", 0)),
+            ),
+            batch_window=float(os.getenv("LLM_BATCH_WINDOW_MS", DEFAULT_BATCH_WINDOW_MS)) / 1000,
+            max_batch_size=int(os.getenv("LLM_MAX_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE)),
+        )
+
+    async def submit(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: type,
+        temperature: float = 1,
+        hedge: bool = False,
+    ) -> tuple[LLMResponse, bool]:
+        """Return the response and whether it was shared with an identical call already in flight.
+
+        A `hedge` call duplicates one already in flight on purpose, so it is only coalesced
+        with other hedges.
+        """
+        key = RecordReplayBackend.prompt_hash(model, system_prompt, user_prompt, response_format)
+        restriction = move_restriction(response_format)
+        if restriction is not None:
+            key += f":{restriction}"
+        if hedge:
+            key += ":hedge"
+        call = self._in_flight.get(key)
+        coalesced = call is not None
+        if coalesced:
+            LLM_COALESCED.inc(model=model)
+            call.waiters += 1
+        else:
+            call = _PendingCall(
+                key, model, system_prompt, user_prompt, response_format, temperature,
+                asyncio.get_running_loop().create_future(),
+            )
+            self._in_flight[key] = call
+            self._pending.append(call)
+            if len(self._pending) >= self.max_batch_size or self.batch_window <= 0:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+
+        try:
+            # shielded so that one caller going away doesn't cancel the call for the others
+            return await asyncio.shield(call.future), coalesced
+        except asyncio.CancelledError:
+            call.waiters -= 1
+            if call.waiters == 0:
+                self._cancel(call)
+            raise
+
+    def _cancel(self, call: _PendingCall) -> None:
+        if call.future.done():
+            return
+        # nobody may join a call that is being cancelled
+        del self._in_flight[call.key]
+        if call.task is not None:
+            call.task.cancel()
+        else:
+            self._pending.remove(call)
+            call.future.cancel()
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        LLM_BATCH_SIZE.observe(len(batch))
+        for call in batch:
+            call.task = asyncio.ensure_future(self._dispatch(call))
+            self._dispatching.add(call.task)
+            call.task.add_done_callback(functools.partial(self._dispatched, call))
+
+    def _dispatched(self, call: _PendingCall, task: asyncio.Task) -> None:
+        # a callback rather than a `finally`, which doesn't run for a task cancelled before it started
+        self._dispatching.discard(task)
+        if self._in_flight.get(call.key) is call:
+            del self._in_flight[call.key]
+        if not call.future.done():
+            call.future.cancel()
+
+    async def _dispatch(self, call: _PendingCall) -> None:
+        estimated_tokens = (
+            estimate_tokens(call.system_prompt) + estimate_tokens(call.user_prompt) + ESTIMATED_OUTPUT_TOKENS
+        )
+        try:
+            start = time.perf_counter()
+            await self.rate_limiter.acquire(estimated_tokens)
+            if self.rate_limiter.limited:
+                LLM_RATE_LIMIT_WAIT.observe(time.perf_counter() - start)
+
+            async with self._semaphore:
+                response = await self.backend.complete(
+                    model=call.model,
+                    system_prompt=call.system_prompt,
+                    user_prompt=call.user_prompt,
+                    response_format=call.response_format,
+                    temperature=call.temperature,
+                )
+            self.rate_limiter.settle(estimated_tokens, response.input_tokens + response.output_tokens)
+        except Exception as e:
+            call.future.set_exception(e)
+            # marked as retrieved, as every caller may have gone away in the meantime
+            call.future.exception()
+        else:
+            call.future.set_result(response)
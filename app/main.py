@@ -1,19 +1,42 @@
+import asyncio
+import json
 import logging
+import os
+import time
+from contextlib import asynccontextmanager, suppress
+from dataclasses import asdict
 from typing import Optional
 
 import chess
 import chess.engine
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Depends
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from dotenv import load_dotenv
 
-from app.agent import ChessAgent
-from app.chess_helper import convert_board_to_pgn
-from app.resource import GameState, MoveRequest
+from app.agent import AgentMoveError
+from app.events import stream_events
+from app.game_store import PlyConflictError
+from app.metrics import AGENT_MOVE_SECONDS, LIVE_GAMES, REGISTRY
+from app.resource import (
+    AgentEvent,
+    AgentEventType,
+    GameState,
+    GameStateDelta,
+    MoveRequest,
+    NewGameRequest,
+    NewGameResponse,
+)
+from app.session import GameNotFoundError, GameRegistry, GameSession
+from app.tracing import configure_tracing, tracer
 
-# Configure logging to see detailed errors
-logging.basicConfig(level=logging.DEBUG)
+# the server's configuration and API keys; loaded before anything below reads the environment
+load_dotenv("secrets.env")
+configure_tracing()
+
+# LOG_LEVEL=DEBUG also logs the full prompts and responses of sampled LLM calls
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Silence httpcore logs
@@ -21,36 +44,79 @@ logging.getLogger("httpcore").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)  # Also silence httpx if you're using it
 
 
-class GameManager:
-    """Manages game state and chess agent."""
-    
-    def __init__(self):
-        self.board = chess.Board()
-        self.chess_agent = ChessAgent()
-    
-    def get_board(self) -> chess.Board:
-        return self.board
-    
-    def get_agent(self) -> ChessAgent:
-        return self.chess_agent
-    
-    def reset_game(self):
-        """Reset the game to initial state."""
-        self.board = chess.Board()
+MOVE_TIME_DESCRIPTION = (
+    "Thinking time for this move in seconds, overriding the game's move time and clock budget. "
+    "Capped by the agent's remaining clock time."
+)
+
+# How often a streamed turn checks whether its client is still connected while no events arrive
+DISCONNECT_POLL_SECONDS = 0.5
+
+# Create a single registry holding every live game
+game_registry = GameRegistry()
+
+
+def get_game_registry() -> GameRegistry:
+    """Dependency injection function to get the game registry."""
+    return game_registry
 
 
-# Create a single instance of the game manager
-game_manager = GameManager()
+async def get_game_session(game_id: str, registry: GameRegistry = Depends(get_game_registry)) -> GameSession:
+    """Dependency injection function to get the session of the game in the path."""
+    return await registry.get_game(game_id)
 
 
-def get_game_manager() -> GameManager:
-    """Dependency injection function to get the game manager."""
-    return game_manager
+def build_game_state(
+    session: GameSession, ai_reasoning: Optional[str] = None, agent_move_budget: Optional[float] = None
+) -> GameState:
+    """The session's cached state snapshot, with the agent's reasoning and budget when it just moved."""
+    state = session.snapshot().state
+    if ai_reasoning is None and agent_move_budget is None:
+        return state
+    return state.model_copy(update={
+        "ai_reasoning": ai_reasoning,
+        "agent_move_budget_seconds": round(agent_move_budget, 3) if agent_move_budget is not None else None,
+    })
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header matches `etag`, weakly compared as RFC 9110 requires."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # STARTUP_WARM_UP=0 starts serving right away and leaves the warming to the first requests
+    if os.getenv("STARTUP_WARM_UP", "1") != "0":
+        templates.get_template("index.html")
+        await game_registry.warm_up()
+    yield
+    await game_registry.llm_manager.close()
+    await game_registry.engine.close()
+    if game_registry.opening_book is not None:
+        game_registry.opening_book.close()
+    game_registry.move_cache.close()
+    if game_registry.store is not None:
+        game_registry.store.close()
+    tracer.shutdown()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Global exception handlers
+@app.exception_handler(GameNotFoundError)
+async def game_not_found_handler(request: Request, exc: GameNotFoundError):
+    logger.warning("Unknown or expired game requested: %s", str(exc))
+    return JSONResponse(
+        status_code=404,
+        content={"error": "Game not found", "detail": f"No active game with ID {exc.args[0]}"}
+    )
+
 @app.exception_handler(chess.InvalidMoveError)
 async def chess_invalid_move_handler(request: Request, exc: chess.InvalidMoveError):
     logger.warning("Invalid chess move attempted: %s", str(exc))
@@ -59,6 +125,22 @@ async def chess_invalid_move_handler(request: Request, exc: chess.InvalidMoveErr
         content={"error": "Invalid chess move", "detail": str(exc)}
     )
 
+@app.exception_handler(PlyConflictError)
+async def ply_conflict_handler(request: Request, exc: PlyConflictError):
+    logger.warning("Move conflicts with one stored by another worker: %s", str(exc))
+    return JSONResponse(
+        status_code=409,
+        content={"error": "Game changed", "detail": "The game was changed concurrently, reload it and try again"}
+    )
+
+@app.exception_handler(AgentMoveError)
+async def agent_move_error_handler(request: Request, exc: AgentMoveError):
+    logger.warning("Agent could not choose a move: %s", str(exc))
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Agent unavailable", "detail": str(exc)}
+    )
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request: Request, exc: ValueError):
     logger.warning("Value error in chess operation: %s", str(exc))
@@ -86,26 +168,88 @@ templates = Jinja2Templates(directory="app/templates")
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
-@app.get("/board")
-async def get_board(game_manager: GameManager = Depends(get_game_manager)) -> GameState:
-    board = game_manager.get_board()
-    return GameState(
-        fen=board.fen(),
-        legal_moves=[move.uci() for move in board.legal_moves],
-        is_check=board.is_check(),
-        is_checkmate=board.is_checkmate(),
-        is_game_over=board.is_game_over(),
-        result=board.result() if board.is_game_over() else None
+@app.post("/games")
+async def create_game(
+    new_game_request: NewGameRequest | None = None,
+    registry: GameRegistry = Depends(get_game_registry),
+) -> NewGameResponse:
+    new_game_request = new_game_request or NewGameRequest()
+    session = await registry.create_game(
+        strategy=new_game_request.strategy,
+        mode=new_game_request.mode,
+        time_control=new_game_request.time_control,
+        move_time=new_game_request.move_time_seconds,
+        ponder=new_game_request.ponder,
     )
+    logger.debug("Created game %s (%d live games)", session.game_id, len(registry))
+    return NewGameResponse(
+        game_id=session.game_id,
+        strategy=session.chess_agent.strategy,
+        mode=session.mode,
+        state=build_game_state(session),
+        time_control=new_game_request.time_control,
+        move_time_seconds=new_game_request.move_time_seconds,
+        ponder=new_game_request.ponder,
+    )
+
+@app.delete("/games/{game_id}", status_code=204)
+async def delete_game(game_id: str, registry: GameRegistry = Depends(get_game_registry)) -> None:
+    await registry.delete_game(game_id)
+
+@app.get("/cache/stats")
+async def get_cache_stats(registry: GameRegistry = Depends(get_game_registry)) -> dict:
+    return registry.move_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(registry: GameRegistry = Depends(get_game_registry)) -> str:
+    LIVE_GAMES.set(len(registry))
+    return REGISTRY.render()
 
-@app.post("/move/player")
+@app.get("/games/{game_id}/board", response_model=GameState, responses={304: {"description": "Not modified"}})
+async def get_board(request: Request, session: GameSession = Depends(get_game_session)) -> Response:
+    """The current state, served from the game's snapshot and answered with 304 when the client has it already.
+
+    Doesn't wait for the session lock, so polling clients get the last state even during an agent turn.
+    """
+    snapshot = session.snapshot()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if if_none_match(request, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get(
+    "/games/{game_id}/board/delta",
+    response_model=GameStateDelta,
+    response_model_exclude_unset=True,
+    responses={304: {"description": "Not modified"}},
+)
+async def get_board_delta(
+    since: int = Query(description="The last version the client has."),
+    session: GameSession = Depends(get_game_session),
+):
+    """The moves played after version `since` and the flags that changed, for clients that already have that version."""
+    if since == session.version:
+        return Response(status_code=304, headers={"ETag": session.snapshot().etag})
+    return session.delta(since)
+
+@app.get("/games/{game_id}/stats")
+async def get_game_stats(session: GameSession = Depends(get_game_session)) -> dict:
+    stats = {
+        "plies": len(session.board.move_stack),
+        "moves": asdict(session.chess_agent.stats),
+        "usage": asdict(session.chess_agent.usage),
+        "stages": session.chess_agent.stage_timings.summary(),
+    }
+    if session.chess_agent.ponderer is not None:
+        stats["ponder"] = asdict(session.chess_agent.ponderer.stats)
+    return stats
+
+@app.post("/games/{game_id}/move/player")
 async def make_player_move(
     move_request: MoveRequest, 
-    game_manager: GameManager = Depends(get_game_manager)
+    session: GameSession = Depends(get_game_session)
 ) -> GameState:
-    board = game_manager.get_board()
-
-    logger.debug("Received player move request: %s", move_request)
+    logger.debug("Received player move request for game %s: %s", session.game_id, move_request)
     
     from_square = move_request.from_square
     to_square = move_request.to_square
@@ -113,60 +257,130 @@ async def make_player_move(
     logger.debug("Attempting player move from %s to %s", from_square, to_square)
     
     move = chess.Move.from_uci(f"{from_square}{to_square}")
-    
-    if move not in board.legal_moves:
-        logger.warning("Illegal move attempted: %s%s", from_square, to_square)
-        raise HTTPException(status_code=400, detail="Illegal move")
-    
-    board.push(move)
-    logger.debug("Player move completed: %s%s", from_square, to_square)
-    
-    return GameState(
-        fen=board.fen(),
-        legal_moves=[move.uci() for move in board.legal_moves],
-        is_check=board.is_check(),
-        is_checkmate=board.is_checkmate(),
-        is_game_over=board.is_game_over(),
-        result=board.result() if board.is_game_over() else None
-    )
 
-@app.post("/move/llm-agent")
-async def make_llm_agent_move(
-    game_manager: GameManager = Depends(get_game_manager)
-) -> GameState:
-    board = game_manager.get_board()
-    chess_agent = game_manager.get_agent()
+    async with session.lock:
+        board = session.board
+
+        if session.flagged() is not None:
+            raise HTTPException(status_code=400, detail="Game is over on time")
+        if move not in board.legal_moves:
+            logger.warning("Illegal move attempted: %s%s", from_square, to_square)
+            raise HTTPException(status_code=400, detail="Illegal move")
+        
+        await session.push_move(move)
+        logger.debug("Player move completed: %s%s", from_square, to_square)
+        
+        return build_game_state(session)
 
+def check_agent_turn(session: GameSession) -> None:
     # Check if it's not black's turn or game is over
-    if board.turn != chess.BLACK or board.is_game_over():
+    if session.board.turn != chess.BLACK or session.is_game_over():
         logger.warning("AI move requested when it's not AI's turn or game is over")
         raise HTTPException(status_code=400, detail="Not AI's turn or game is over")
-    
-    logger.debug("AI turn begins")
 
-    pgn_string = convert_board_to_pgn(board)
-    move_result = chess_agent.make_valid_move(board=board, position=pgn_string)
-    
-    if not move_result:
-        logger.error("AI could not make a move")
-        return HTTPException(status_code=500, detail="AI could not make a move")
-        
-    move, reasoning = move_result
-    
+
+async def play_agent_turn(session: GameSession, move_time: float | None = None) -> GameState:
+    """Let the agent choose and play its move. The caller must hold the session lock."""
+    board = session.board
+    check_agent_turn(session)
+
+    budget = session.agent_move_budget(move_time)
+    logger.debug(
+        "AI turn begins for game %s (%s, budget %s)", session.game_id, session.move_provider.name, budget
+    )
+
+    position = session.encode_position()
+    start = time.perf_counter()
+    move, reasoning = await session.move_provider.choose_move(board=board, position=position, budget=budget)
+    AGENT_MOVE_SECONDS.observe(time.perf_counter() - start, provider=session.move_provider.name)
+
     logger.info("AI made move: %s", move.uci())
     logger.info("AI reasoning: %s", reasoning)
-    
-    board.push(move)
-    
-    return GameState(
-        fen=board.fen(),
-        legal_moves=[move.uci() for move in board.legal_moves],
-        is_check=board.is_check(),
-        is_checkmate=board.is_checkmate(),
-        is_game_over=board.is_game_over(),
-        result=board.result() if board.is_game_over() else None,
-        ai_reasoning=reasoning
-    )
+
+    await session.push_move(move)
+
+    return build_game_state(session, ai_reasoning=reasoning, agent_move_budget=budget)
+
+
+@app.post("/games/{game_id}/move/llm-agent")
+async def make_llm_agent_move(
+    move_time: float | None = Query(default=None, gt=0, description=MOVE_TIME_DESCRIPTION),
+    session: GameSession = Depends(get_game_session),
+) -> GameState:
+    async with session.lock:
+        return await play_agent_turn(session, move_time=move_time)
+
+@app.post("/games/{game_id}/move/llm-agent/stream")
+async def stream_llm_agent_move(
+    request: Request,
+    move_time: float | None = Query(default=None, gt=0, description=MOVE_TIME_DESCRIPTION),
+    session: GameSession = Depends(get_game_session),
+) -> StreamingResponse:
+    """Play the agent's move while streaming its progress as server-sent events.
+
+    Events are sent as the agent makes decisions, analyses candidates (with their counter
+    moves) and generates text, followed by the final move and the new board state. If the
+    client disconnects the turn is cancelled and no move is played.
+    """
+    # fail fast with a normal 400 instead of an error event when it's clearly not the agent's turn
+    check_agent_turn(session)
+
+    async def event_stream():
+        queue: asyncio.Queue[AgentEvent] = asyncio.Queue()
+
+        async with session.lock:
+            with stream_events(queue):
+                turn = asyncio.create_task(play_agent_turn(session, move_time=move_time))
+
+            next_event = None
+            try:
+                while True:
+                    if next_event is None:
+                        next_event = asyncio.create_task(queue.get())
+                    # wake up now and then even without events, so a disconnect is noticed during long LLM calls
+                    await asyncio.wait(
+                        {next_event, turn}, timeout=DISCONNECT_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED
+                    )
+
+                    if next_event.done():
+                        yield format_server_sent_event(next_event.result())
+                        next_event = None
+                    elif turn.done():
+                        break
+
+                    if await request.is_disconnected():
+                        logger.info("Client disconnected mid-turn, cancelling AI turn for game %s", session.game_id)
+                        return
+
+                # flush what the turn published after the last wake-up
+                next_event.cancel()
+                next_event = None
+                while not queue.empty():
+                    yield format_server_sent_event(queue.get_nowait())
+
+                try:
+                    state = turn.result()
+                except HTTPException as exc:
+                    yield format_server_sent_event(AgentEvent(type=AgentEventType.ERROR, data={"detail": exc.detail}))
+                except Exception as exc:
+                    logger.exception("AI turn failed for game %s", session.game_id)
+                    yield format_server_sent_event(AgentEvent(type=AgentEventType.ERROR, data={"detail": str(exc)}))
+                else:
+                    yield format_server_sent_event(AgentEvent(type=AgentEventType.STATE, data=state.model_dump()))
+            finally:
+                if next_event is not None:
+                    next_event.cancel()
+                if not turn.done():
+                    # the turn must have stopped before the lock is released, or it could still push its move
+                    turn.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await turn
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def format_server_sent_event(event: AgentEvent) -> str:
+    return f"event: {event.type.value}\ndata: {json.dumps(event.data)}\n\n"
 
 # Run the app
 if __name__ == "__main__":
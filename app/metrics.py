@@ -0,0 +1,232 @@
+"""Process-wide counters and histograms, rendered in the Prometheus text format by /metrics.
+
+Only the small subset of the Prometheus data model the app needs is implemented here:
+labelled counters, gauges and cumulative histograms.
+"""
+import functools
+import inspect
+import threading
+import time
+from dataclasses import dataclass
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Metric:
+    type_name: str
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (count per bucket, non-cumulative, with a final +Inf bucket; sum)
+        self._values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+LLM_CALLS = REGISTRY.counter(
+    "chess_llm_calls_total", "LLM calls by model, response format and outcome", ("model", "response_format", "status")
+)
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "chess_llm_call_seconds", "Latency of LLM calls, including the wait for a concurrency slot",
+    ("model", "response_format"),
+)
+LLM_TOKENS = REGISTRY.counter(
+    "chess_llm_tokens_total", "Tokens reported by the LLM backend, by kind (input, cached_input, output)",
+    ("model", "kind"),
+)
+LLM_COST = REGISTRY.counter("chess_llm_cost_usd_total", "Estimated spend on LLM calls in US dollars", ("model",))
+AGENT_STAGE_SECONDS = REGISTRY.histogram(
+    "chess_agent_stage_seconds", "Duration of each ChessAgent stage", ("stage",)
+)
+AGENT_MOVE_SECONDS = REGISTRY.histogram(
+    "chess_agent_move_seconds", "Duration of a whole agent move", ("provider",)
+)
+AGENT_MOVE_ITERATIONS = REGISTRY.histogram(
+    "chess_agent_move_iterations", "Orchestration iterations or fan-out candidates per agent move",
+    ("strategy",), buckets=(1, 2, 3, 4, 5, 6, 8, 10),
+)
+AGENT_MOVE_REPAIRS = REGISTRY.counter(
+    "chess_agent_move_repairs_total",
+    "LLM moves that needed fixing, by kind (local_repair, reask, unrecoverable, dropped_candidate)",
+    ("kind",),
+)
+AGENT_TURN_FALLBACKS = REGISTRY.counter(
+    "chess_agent_turn_fallbacks_total",
+    "Agent turns cut short by the turn budget or an unavailable LLM, by whether a candidate could be played",
+    ("reason", "outcome"),
+)
+LIVE_GAMES = REGISTRY.gauge("chess_live_games", "Games currently held by the registry")
+
+
+@dataclass
+class StageTiming:
+    calls: int = 0
+    total_seconds: float = 0.0
+
+
+class StageTimings:
+    """Per-game totals of the stage durations that also feed AGENT_STAGE_SECONDS."""
+
+    def __init__(self):
+        self.stages: dict[str, StageTiming] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        timing = self.stages.setdefault(stage, StageTiming())
+        timing.calls += 1
+        timing.total_seconds += seconds
+        AGENT_STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        return {
+            stage: {
+                "calls": timing.calls,
+                "total_seconds": round(timing.total_seconds, 4),
+                "mean_seconds": round(timing.total_seconds / timing.calls, 4),
+            }
+            for stage, timing in self.stages.items()
+        }
+
+
+def timed_stage(stage: str):
+    """Record the decorated method's duration in its instance's `stage_timings`, sync or async."""
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(self, *args, **kwargs)
+                finally:
+                    self.stage_timings.record(stage, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.stage_timings.record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,166 @@
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+
+import chess
+
+from app import events
+from app.agent import ChessAgent
+from app.engine import Engine, EngineLine
+from app.opening_book import OpeningBook
+from app.resource import AgentEventType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPLEXITY_THRESHOLD = 0.3
+# a best move this many centipawns ahead of the second best is considered clearly tactical
+DEFAULT_TACTICAL_MARGIN = 200
+
+
+def describe_score(line: EngineLine) -> str:
+    if line.mate is not None:
+        return f"mate in {line.mate}" if line.mate > 0 else f"mated in {-line.mate}"
+    return f"{line.score / 100:+.2f}"
+
+
+def position_complexity(board: chess.Board, lines: list[EngineLine]) -> float:
+    """Score from 0 (one obvious move) to 1 (many plausible moves) used to decide who answers.
+
+    It grows with the number of legal moves and shrinks as the gap between the engine's two
+    best lines widens.
+    """
+    if len(lines) < 2 or lines[0].mate is not None:
+        return 0.0
+
+    gap = max(lines[0].score - lines[1].score, 0)
+    mobility = min(board.legal_moves.count() / 40, 1.0)
+    return mobility * 100 / (100 + gap)
+
+
+class MoveProvider(ABC):
+    name: str
+
+    @abstractmethod
+    async def choose_move(
+        self, board: chess.Board, position: str, budget: float | None = None
+    ) -> tuple[chess.Move, str]:
+        """Return the move to play and the reasoning shown to the player, ideally within `budget` seconds."""
+
+
+class LLMMoveProvider(MoveProvider):
+    name = "llm"
+
+    def __init__(self, chess_agent: ChessAgent):
+        self.chess_agent = chess_agent
+
+    async def choose_move(
+        self, board: chess.Board, position: str, budget: float | None = None
+    ) -> tuple[chess.Move, str]:
+        return await self.chess_agent.make_valid_move(board=board, position=position, budget=budget)
+
+
+class EngineMoveProvider(MoveProvider):
+    name = "engine"
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    async def choose_move(
+        self, board: chess.Board, position: str, budget: float | None = None
+    ) -> tuple[chess.Move, str]:
+        # the engine's own time limit is far below any budget
+        best_line = (await self.engine.analyse(board))[0]
+        return self.play_line(board, best_line)
+
+    @staticmethod
+    def play_line(board: chess.Board, line: EngineLine, reason: str = "Engine move") -> tuple[chess.Move, str]:
+        san = board.san(line.move)
+        reasoning = f"{reason}: {san} ({describe_score(line)})."
+        events.emit(AgentEventType.MOVE, move=san, uci=line.move.uci(), reasoning=reasoning)
+        return line.move, reasoning
+
+
+class HybridMoveProvider(MoveProvider):
+    """Answers forced and clearly tactical positions with the engine and defers the rest to the LLM.
+
+    Positions whose `position_complexity` reaches `complexity_threshold` go to the LLM agent;
+    everything simpler is played by the engine in milliseconds. Engine moves are still recorded
+    in the agent's game memory so that its later reasoning stays coherent.
+    """
+
+    name = "hybrid"
+
+    def __init__(
+        self,
+        chess_agent: ChessAgent,
+        engine: Engine,
+        complexity_threshold: float = DEFAULT_COMPLEXITY_THRESHOLD,
+        tactical_margin: int = DEFAULT_TACTICAL_MARGIN,
+    ):
+        self.chess_agent = chess_agent
+        self.engine = engine
+        self.complexity_threshold = complexity_threshold
+        self.tactical_margin = tactical_margin
+
+    @classmethod
+    def from_env(cls, chess_agent: ChessAgent, engine: Engine) -> "HybridMoveProvider":
+        return cls(
+            chess_agent,
+            engine,
+            complexity_threshold=float(os.getenv("HYBRID_COMPLEXITY_THRESHOLD", DEFAULT_COMPLEXITY_THRESHOLD)),
+            tactical_margin=int(os.getenv("HYBRID_TACTICAL_MARGIN", DEFAULT_TACTICAL_MARGIN)),
+        )
+
+    async def choose_move(
+        self, board: chess.Board, position: str, budget: float | None = None
+    ) -> tuple[chess.Move, str]:
+        start = time.monotonic()
+        legal_moves = list(board.legal_moves)
+        if len(legal_moves) == 1:
+            return self._play_engine_move(board, EngineLine(move=legal_moves[0], score=0), "Forced move")
+
+        lines = await self.engine.analyse(board, multipv=2)
+        best_line = lines[0]
+
+        if best_line.mate is not None and best_line.mate > 0:
+            return self._play_engine_move(board, best_line, "Forced mate")
+
+        if len(lines) > 1 and best_line.score - lines[1].score >= self.tactical_margin:
+            return self._play_engine_move(board, best_line, "Tactical shot")
+
+        complexity = position_complexity(board, lines)
+        if complexity < self.complexity_threshold:
+            return self._play_engine_move(board, best_line, f"Simple position (complexity {complexity:.2f})")
+
+        logger.debug("Position complexity %.2f, deferring to the LLM agent", complexity)
+        if budget is not None:
+            budget = max(budget - (time.monotonic() - start), 0.0)
+        return await self.chess_agent.make_valid_move(board=board, position=position, budget=budget)
+
+    def _play_engine_move(self, board: chess.Board, line: EngineLine, reason: str) -> tuple[chess.Move, str]:
+        move, reasoning = EngineMoveProvider.play_line(board, line, reason)
+        self.chess_agent.remember_move(board.san(move), reasoning)
+        return move, reasoning
+
+
+class BookMoveProvider(MoveProvider):
+    """Plays from the opening book while the position is in it, then hands over to `fallback`."""
+
+    def __init__(self, book: OpeningBook, fallback: MoveProvider, chess_agent: ChessAgent):
+        self.book = book
+        self.fallback = fallback
+        self.chess_agent = chess_agent
+        self.name = f"book+{fallback.name}"
+
+    async def choose_move(
+        self, board: chess.Board, position: str, budget: float | None = None
+    ) -> tuple[chess.Move, str]:
+        book_move = self.book.lookup(board)
+        if book_move is None:
+            return await self.fallback.choose_move(board=board, position=position, budget=budget)
+
+        san = board.san(book_move.move)
+        events.emit(AgentEventType.MOVE, move=san, uci=book_move.move.uci(), reasoning=book_move.reasoning)
+        self.chess_agent.remember_move(san, book_move.reasoning)
+        return book_move.move, book_move.reasoning
@@ -0,0 +1,118 @@
+"""Response schemas whose move fields only admit the legal moves of the position.
+
+With MOVE_SCHEMA=legal, the agent's move responses are requested with a copy of their
+model in which every move of the agent is a `Literal` of the position's legal moves in
+SAN, so that structured outputs cannot produce an illegal move. MOVE_SCHEMA_TOP_K prunes
+the choices to the K most forcing moves of a cheap local ordering (mates, winning
+captures, checks and promotions before quiet moves), and a final decision can be limited
+to the candidates the agent analysed. The generated models are cached by position, so
+building them costs nothing on the calls after the first of a position.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Literal, get_args
+
+import chess
+from pydantic import BaseModel, Field, create_model
+
+from app.cache import ResponseT, position_key
+from app.engine import PIECE_VALUES
+from app.llm_resource import MoveSelection
+from app.tactics import AttackTable
+
+DEFAULT_CACHE_SIZE = 10_000
+# bonuses of the local ordering, in centipawns of static exchange evaluation
+CHECK_BONUS = 50
+MATE_BONUS = 100_000
+
+
+def order_moves(board: chess.Board) -> list[chess.Move]:
+    """Legal moves, most forcing first: mates, then by material won and checks given."""
+    table = AttackTable(board)
+
+    def score(move: chess.Move) -> int:
+        value = 0
+        if board.is_capture(move):
+            value = table.capture_value(move)
+        elif move.promotion:
+            value = PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN]
+        if board.gives_check(move):
+            board.push(move)
+            value += MATE_BONUS if board.is_checkmate() else CHECK_BONUS
+            board.pop()
+        return value
+
+    return sorted(board.legal_moves, key=score, reverse=True)
+
+
+class MoveSchemaFactory:
+    """Builds and caches the models restricting a response format's moves to a position's legal moves."""
+
+    def __init__(self, top_k: int | None = None, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.top_k = top_k
+        self.cache_size = cache_size
+        self._models: OrderedDict[tuple, type[BaseModel]] = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "MoveSchemaFactory | None":
+        """None unless MOVE_SCHEMA=legal, keeping the free-form move strings."""
+        if os.getenv("MOVE_SCHEMA", "free") != "legal":
+            return None
+        top_k = int(os.getenv("MOVE_SCHEMA_TOP_K", 0))
+        return cls(top_k=top_k or None, cache_size=int(os.getenv("MOVE_SCHEMA_CACHE_SIZE", DEFAULT_CACHE_SIZE)))
+
+    def restrict(
+        self, response_format: type[ResponseT], board: chess.Board, allowed: list[str] | None = None
+    ) -> type[ResponseT]:
+        """`response_format` with its moves limited to `allowed` (legal SAN) or else the legal, possibly pruned, moves.
+
+        Formats without a move, like `Decision`, are returned unchanged.
+        """
+        if "move" not in response_format.model_fields:
+            return response_format
+        key = (position_key(board), response_format, tuple(sorted(allowed)) if allowed else None)
+        model = self._models.get(key)
+        if model is not None:
+            self._models.move_to_end(key)
+            return model
+
+        if allowed:
+            moves = list(allowed)
+        else:
+            legal_moves = order_moves(board) if self.top_k else list(board.legal_moves)
+            moves = [board.san(move) for move in legal_moves[:self.top_k]]
+        model = self._build(response_format, moves)
+        self._models[key] = model
+        while len(self._models) > self.cache_size:
+            self._models.popitem(last=False)
+        return model
+
+    @classmethod
+    def _build(cls, response_format: type[ResponseT], moves: list[str]) -> type[ResponseT]:
+        model = cls._restricted_model(response_format, moves)
+        # read by `move_restriction`, which tells the restricted model apart from the original
+        model.move_restriction = hashlib.sha256(",".join(moves).encode()).hexdigest()[:16]
+        return model
+
+    @staticmethod
+    def _restricted_model(response_format: type[ResponseT], moves: list[str]) -> type[ResponseT]:
+        choices = Literal[tuple(moves)]
+
+        def move_field(model: type[BaseModel]) -> tuple:
+            return choices, Field(description=model.model_fields["move"].description)
+
+        # same name as the original, which keys metrics, latencies and recordings
+        if issubclass(response_format, MoveSelection):
+            # the candidate model of the format, which `for_side` may have rewritten for White
+            (candidate_format,) = get_args(response_format.model_fields["candidates"].annotation)
+            candidate = create_model(
+                candidate_format.__name__, __base__=candidate_format, move=move_field(candidate_format)
+            )
+            return create_model(
+                response_format.__name__,
+                __base__=response_format,
+                candidates=(list[candidate], response_format.model_fields["candidates"]),
+                move=move_field(response_format),
+            )
+        return create_model(response_format.__name__, __base__=response_format, move=move_field(response_format))
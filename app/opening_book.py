@@ -0,0 +1,173 @@
+"""Polyglot opening book: lookup during play and a streaming builder for PGN corpora.
+
+Build a book from one or more PGN files:
+
+    python -m app.opening_book build games.pgn more_games.pgn -o book.bin --max-ply 16
+
+and point OPENING_BOOK_PATH at it. Any other Polyglot .bin book works as well.
+"""
+import argparse
+import logging
+import os
+import struct
+import sys
+from dataclasses import dataclass
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PLY = 16
+DEFAULT_MIN_GAMES = 2
+POLYGLOT_ENTRY = struct.Struct(">QHHI")
+MAX_WEIGHT = 0xFFFF
+MAX_LEARN = 0xFFFFFFFF
+POLYGLOT_PROMOTIONS = {chess.KNIGHT: 1, chess.BISHOP: 2, chess.ROOK: 3, chess.QUEEN: 4}
+
+
+@dataclass
+class BookMove:
+    move: chess.Move
+    reasoning: str
+
+
+class OpeningBook:
+    """Memory-mapped Polyglot book. Lookups are a binary search over the mapped file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader = chess.polyglot.open_reader(path)
+
+    @classmethod
+    def from_env(cls) -> "OpeningBook | None":
+        path = os.getenv("OPENING_BOOK_PATH")
+        if not path:
+            return None
+        logger.info("Using opening book %s", path)
+        return cls(path)
+
+    def lookup(self, board: chess.Board) -> BookMove | None:
+        entries = list(self._reader.find_all(board))
+        if not entries:
+            return None
+
+        total_weight = sum(entry.weight for entry in entries)
+        best = max(entries, key=lambda entry: entry.weight)
+        san = board.san(best.move)
+        reasoning = f"Book move {san}, the main line here"
+        if total_weight:
+            reasoning += f" ({best.weight * 100 // total_weight}% of book games from this position"
+            # books built by this module store the number of games won by the side to move in `learn`
+            if best.learn and best.learn <= best.weight:
+                reasoning += f", scoring {best.learn * 100 // best.weight}% wins"
+            reasoning += ")"
+        return BookMove(move=best.move, reasoning=reasoning + ".")
+
+    def close(self) -> None:
+        self._reader.close()
+
+
+def _polyglot_move(board: chess.Board, move: chess.Move) -> int:
+    to_square = move.to_square
+    if board.is_castling(move):
+        # Polyglot encodes castling as the king capturing its own rook
+        rook_file = 7 if board.is_kingside_castling(move) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+
+    raw_move = to_square | (move.from_square << 6)
+    if move.promotion:
+        raw_move |= POLYGLOT_PROMOTIONS[move.promotion] << 12
+    return raw_move
+
+
+def _winner(game: chess.pgn.Game) -> chess.Color | None:
+    result = game.headers.get("Result")
+    if result == "1-0":
+        return chess.WHITE
+    if result == "0-1":
+        return chess.BLACK
+    return None
+
+
+def build_book(pgn_paths: list[str], output_path: str, max_ply: int = DEFAULT_MAX_PLY,
+               min_games: int = DEFAULT_MIN_GAMES) -> int:
+    """Build a Polyglot book from PGN files and return the number of entries written.
+
+    Games are read one at a time, so memory grows with the number of distinct opening
+    positions up to `max_ply`, not with the size of the corpus.
+    """
+    # (zobrist key, polyglot move) -> [games, wins for the side making the move]
+    counts: dict[tuple[int, int], list[int]] = {}
+    games = 0
+
+    for pgn_path in pgn_paths:
+        with open(pgn_path, encoding="utf-8", errors="replace") as pgn_file:
+            while True:
+                game = chess.pgn.read_game(pgn_file)
+                if game is None:
+                    break
+                games += 1
+                winner = _winner(game)
+
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves()):
+                    if ply >= max_ply:
+                        break
+                    key = (chess.polyglot.zobrist_hash(board), _polyglot_move(board, move))
+                    entry = counts.setdefault(key, [0, 0])
+                    entry[0] += 1
+                    if winner == board.turn:
+                        entry[1] += 1
+                    board.push(move)
+
+                if games % 10_000 == 0:
+                    logger.info("Read %d games, %d book entries so far", games, len(counts))
+
+    entries = sorted(
+        (key, raw_move, games_played, wins)
+        for (key, raw_move), (games_played, wins) in counts.items()
+        if games_played >= min_games
+    )
+    with open(output_path, "wb") as book_file:
+        for key, raw_move, games_played, wins in entries:
+            book_file.write(POLYGLOT_ENTRY.pack(key, raw_move, min(games_played, MAX_WEIGHT), min(wins, MAX_LEARN)))
+
+    logger.info("Wrote %d entries from %d games to %s", len(entries), games, output_path)
+    return len(entries)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build a Polyglot book from PGN files")
+    build_parser.add_argument("pgn", nargs="+", help="PGN files to read")
+    build_parser.add_argument("-o", "--output", required=True, help="path of the .bin book to write")
+    build_parser.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY, help="deepest ply to index")
+    build_parser.add_argument("--min-games", type=int, default=DEFAULT_MIN_GAMES,
+                              help="drop moves played in fewer games than this")
+
+    probe_parser = subparsers.add_parser("probe", help="look up a position in a book")
+    probe_parser.add_argument("book", help="path of the .bin book")
+    probe_parser.add_argument("--fen", default=chess.STARTING_FEN, help="position to look up")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        build_book(args.pgn, args.output, max_ply=args.max_ply, min_games=args.min_games)
+        return
+
+    book = OpeningBook(args.book)
+    book_move = book.lookup(chess.Board(args.fen))
+    book.close()
+    if book_move is None:
+        print("Position not in book")
+        sys.exit(1)
+    print(book_move.reasoning)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Pondering: analysing the positions after White's likeliest replies while the player thinks.
+
+After the agent moves, `Ponderer.start` predicts White's likeliest replies and runs the
+agent's consider_new_move analysis of the position after each of them in the background.
+The replies are the counter moves the agent expected when it analysed the move it played,
+or the engine's best lines when it had none. When White plays one of them, the agent's turn
+starts from that analysis instead of asking for it again; as soon as White plays anything
+else, the pondering is cancelled.
+"""
+import asyncio
+import copy
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import chess
+
+from app.chess_helper import normalize_move
+from app.engine import Engine
+from app.llm_resource import AnalysisLLMChessMove
+from app.metrics import REGISTRY
+from app.position_encoder import PositionEncoder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_LINES = 2
+
+PONDER_PREDICTIONS = REGISTRY.counter(
+    "chess_ponder_predictions_total", "White moves played while pondering, by whether they were pondered (hit, miss)",
+    ("outcome",),
+)
+PONDER_SECONDS_SAVED = REGISTRY.histogram(
+    "chess_ponder_seconds_saved", "Analysis time agent turns saved by starting from a pondered analysis"
+)
+
+# the agent's analysis of a position (after White's reply) given its encoding
+Analyse = Callable[[chess.Board, str], Awaitable[AnalysisLLMChessMove]]
+
+
+@dataclass
+class PonderStats:
+    hits: int = 0
+    misses: int = 0
+    seconds_saved: float = 0.0
+
+
+@dataclass
+class _PonderedLine:
+    fen: str
+    started: float
+    task: asyncio.Task | None = None
+    finished: float | None = None
+
+
+class Ponderer:
+    """Per-game cache of analyses of the positions after White's likeliest replies, computed in the background."""
+
+    def __init__(self, analyse: Analyse, engine: Engine | None = None, max_lines: int = DEFAULT_MAX_LINES):
+        self.analyse = analyse
+        self.engine = engine
+        self.max_lines = max_lines
+        self.stats = PonderStats()
+        self._lines: dict[chess.Move, _PonderedLine] = {}
+        self._predicting: asyncio.Task | None = None
+        # the line of the reply White actually played, until the agent's turn takes it
+        self._hit: _PonderedLine | None = None
+
+    @classmethod
+    def from_env(cls, analyse: Analyse, engine: Engine | None = None) -> "Ponderer":
+        return cls(analyse, engine, max_lines=int(os.getenv("PONDER_MAX_LINES", DEFAULT_MAX_LINES)))
+
+    @property
+    def active(self) -> bool:
+        return bool(self._lines) or self._predicting is not None
+
+    def start(self, board: chess.Board, encoder: PositionEncoder, expected_replies: list[str]) -> None:
+        """Ponder White's replies in `board`, the `expected_replies` in SAN first, topped up from the engine."""
+        self.cancel()
+        replies = []
+        for san in expected_replies:
+            move = normalize_move(board, san)
+            if move is not None and move not in replies:
+                replies.append(move)
+        replies = replies[:self.max_lines]
+        if len(replies) < self.max_lines and self.engine is not None:
+            self._predicting = asyncio.ensure_future(self._predict(board.copy(), copy.deepcopy(encoder), replies))
+            self._predicting.add_done_callback(self._predicted)
+        else:
+            self._ponder(board, encoder, replies)
+
+    async def _predict(self, board: chess.Board, encoder: PositionEncoder, replies: list[chess.Move]) -> None:
+        for line in await self.engine.analyse(board, multipv=self.max_lines):
+            if len(replies) >= self.max_lines:
+                break
+            if line.move not in replies:
+                replies.append(line.move)
+        self._ponder(board, encoder, replies)
+
+    def _predicted(self, task: asyncio.Task) -> None:
+        if self._predicting is task:
+            self._predicting = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Could not predict replies to ponder: %s", task.exception())
+
+    def _ponder(self, board: chess.Board, encoder: PositionEncoder, replies: list[chess.Move]) -> None:
+        for move in replies:
+            line_board = board.copy()
+            line_encoder = copy.deepcopy(encoder)
+            line_encoder.push(line_board, move)
+            line_board.push(move)
+            line = _PonderedLine(fen=line_board.fen(), started=time.monotonic())
+            line.task = asyncio.ensure_future(self._analyse(line, line_board, line_encoder.encode(line_board)))
+            line.task.add_done_callback(self._analysed)
+            self._lines[move] = line
+        if replies:
+            logger.debug("Pondering %s", ", ".join(board.san(move) for move in replies))
+
+    async def _analyse(self, line: _PonderedLine, board: chess.Board, position: str) -> AnalysisLLMChessMove:
+        try:
+            return await self.analyse(board, position)
+        finally:
+            line.finished = time.monotonic()
+
+    @staticmethod
+    def _analysed(task: asyncio.Task) -> None:
+        # failures only cost the time saving, the agent's turn asks again
+        if not task.cancelled() and task.exception() is not None:
+            logger.info("Pondering failed: %s", task.exception())
+
+    def resolve(self, board: chess.Board) -> None:
+        """White just played the last move of `board`: keep its line if it was pondered, cancel the rest."""
+        if not self.active:
+            return
+        move = board.peek()
+        line = self._lines.pop(move, None)
+        if line is not None and line.fen == board.fen():
+            self._hit = line
+            self.stats.hits += 1
+            PONDER_PREDICTIONS.inc(outcome="hit")
+        else:
+            self.stats.misses += 1
+            PONDER_PREDICTIONS.inc(outcome="miss")
+        self.cancel(keep_hit=True)
+
+    async def take(self, board: chess.Board) -> AnalysisLLMChessMove | None:
+        """The pondered analysis of `board`, waiting for it if it is still running, or None."""
+        line, self._hit = self._hit, None
+        if line is None or line.fen != board.fen():
+            return None
+
+        turn_started = time.monotonic()
+        try:
+            analysis = await line.task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # the pondering was cancelled, not the turn
+            return None
+        except Exception as e:
+            logger.info("Pondered analysis unusable: %s", e)
+            return None
+        saved = min(line.finished, turn_started) - line.started
+        self.stats.seconds_saved += saved
+        PONDER_SECONDS_SAVED.observe(saved)
+        return analysis
+
+    def cancel(self, keep_hit: bool = False) -> None:
+        if self._predicting is not None:
+            self._predicting.cancel()
+            self._predicting = None
+        for line in self._lines.values():
+            line.task.cancel()
+        self._lines = {}
+        if not keep_hit and self._hit is not None:
+            self._hit.task.cancel()
+            self._hit = None
@@ -0,0 +1,106 @@
+import os
+from enum import Enum
+
+import chess
+
+
+class PositionFormat(Enum):
+    # FEN, ASCII board and the full movetext, like chess_helper.convert_board_to_pgn
+    FULL = "full"
+    # FEN, ASCII board and only the last `recent_plies` plies of movetext
+    RECENT = "recent"
+    # FEN only, the cheapest encoding in tokens
+    FEN = "fen"
+
+
+DEFAULT_RECENT_PLIES = 12
+
+
+class PositionEncoder:
+    """Per-game position encoder that is updated move by move.
+
+    SAN is appended as moves are pushed instead of replaying the whole move stack
+    through `chess.pgn`, and the FEN and ASCII board of each ply are computed once.
+    """
+
+    def __init__(
+        self,
+        position_format: PositionFormat = PositionFormat.FULL,
+        recent_plies: int = DEFAULT_RECENT_PLIES,
+    ):
+        self.position_format = position_format
+        self.recent_plies = recent_plies
+        self._movetext_tokens: list[str] = []
+        self._moves: list[chess.Move] = []
+        self._move_numbers: list[int] = []
+        self._snapshot_ply = -1
+        self._snapshot: tuple[str, str] = ("", "")
+
+    @classmethod
+    def from_env(cls) -> "PositionEncoder":
+        return cls(
+            position_format=PositionFormat(os.getenv("POSITION_FORMAT", PositionFormat.FULL.value)),
+            recent_plies=int(os.getenv("POSITION_RECENT_PLIES", DEFAULT_RECENT_PLIES)),
+        )
+
+    def push(self, board: chess.Board, move: chess.Move) -> None:
+        """Record `move`; must be called before the move is pushed onto `board`."""
+        san = board.san(move)
+        if board.turn == chess.WHITE:
+            self._movetext_tokens.append(f"{board.fullmove_number}. {san}")
+        elif not self._movetext_tokens:
+            # the game started from a position with black to move
+            self._movetext_tokens.append(f"{board.fullmove_number}... {san}")
+        else:
+            self._movetext_tokens.append(san)
+        self._moves.append(move)
+        self._move_numbers.append(board.fullmove_number)
+
+    def sync(self, board: chess.Board) -> None:
+        """Rebuild from the board's move stack if moves were pushed without going through `push`."""
+        if len(self._moves) == len(board.move_stack) and (
+            not self._moves or self._moves[-1] == board.move_stack[-1]
+        ):
+            return
+
+        self._movetext_tokens = []
+        self._moves = []
+        self._move_numbers = []
+        self._snapshot_ply = -1
+        replay = board.root()
+        for move in board.move_stack:
+            self.push(replay, move)
+            replay.push(move)
+
+    def _get_snapshot(self, board: chess.Board) -> tuple[str, str]:
+        ply = len(board.move_stack)
+        if ply != self._snapshot_ply:
+            self._snapshot = (board.fen(), str(board))
+            self._snapshot_ply = ply
+        return self._snapshot
+
+    def encode(self, board: chess.Board) -> str:
+        self.sync(board)
+        fen, ascii_board = self._get_snapshot(board)
+
+        if self.position_format == PositionFormat.FEN:
+            return f"Current Board State:\nFEN: {fen}"
+
+        if self.position_format == PositionFormat.RECENT and len(self._movetext_tokens) > self.recent_plies:
+            recent_tokens = self._movetext_tokens[-self.recent_plies:]
+            # keep the move number on a leading black move so the excerpt stays unambiguous
+            if not recent_tokens[0][0].isdigit():
+                move_number = self._move_numbers[-self.recent_plies]
+                recent_tokens = [f"{move_number}... {recent_tokens[0]}", *recent_tokens[1:]]
+            game_moves = "... " + " ".join(recent_tokens)
+        else:
+            game_moves = " ".join(self._movetext_tokens)
+
+        return f"""Current Board State:
+FEN: {fen}
+
+Board Position:
+{ascii_board}
+
+Game Moves:
+{game_moves}"""
@@ -0,0 +1,121 @@
+import os
+from dataclasses import dataclass
+
+import chess
+
+from app.llm_resource import AnalysisLLMChessMove, side_names
+from app.prompts import MOVE_CONTEXT_PROMPT, SYSTEM_PROMPT
+
+DEFAULT_MAX_INPUT_TOKENS = 3000
+DEFAULT_PREVIOUS_MOVES_LIMIT = 3
+# rough average for English text and SAN with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _first_sentence(text: str) -> str:
+    end = text.find(". ")
+    return text if end == -1 else text[:end + 1]
+
+
+@dataclass
+class BuiltPrompt:
+    system_prompt: str
+    user_prompt: str
+    estimated_tokens: int
+    trimmed: bool = False
+
+
+class PromptBuilder:
+    """Assembles agent prompts with stable content first and enforces a per-call token budget.
+
+    When a prompt is over budget the per-call deltas are trimmed before the per-move context,
+    so the cacheable prefix stays identical across the calls of a move whenever possible:
+    older analyses are shortened to their first sentence, then analyses are reduced to the
+    bare moves, and only then are the oldest previous moves dropped.
+    """
+
+    def __init__(
+        self,
+        max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+        previous_moves_limit: int = DEFAULT_PREVIOUS_MOVES_LIMIT,
+    ):
+        self.max_input_tokens = max_input_tokens
+        self.previous_moves_limit = previous_moves_limit
+
+    @classmethod
+    def from_env(cls) -> "PromptBuilder":
+        return cls(max_input_tokens=int(os.getenv("PROMPT_MAX_INPUT_TOKENS", DEFAULT_MAX_INPUT_TOKENS)))
+
+    def build(
+        self,
+        stage_prompt: str,
+        position: str,
+        game_memory: list[str],
+        analysis_memory: list[AnalysisLLMChessMove],
+        color: chess.Color = chess.BLACK,
+        **stage_fields,
+    ) -> BuiltPrompt:
+        """The prompts of a call of the agent playing `color`, within the token budget if possible."""
+        stage_fields = {**side_names(color), **stage_fields}
+        previous_moves = game_memory[-self.previous_moves_limit:] if self.previous_moves_limit else []
+        considered_moves = [f"{move.move}: {move.reasoning}" for move in analysis_memory]
+
+        prompt = self._render(stage_prompt, position, previous_moves, considered_moves, stage_fields)
+        if prompt.estimated_tokens <= self.max_input_tokens:
+            return prompt
+
+        # 1. shorten every analysis but the latest one
+        for index, move in enumerate(analysis_memory[:-1]):
+            considered_moves[index] = f"{move.move}: {_first_sentence(move.reasoning)}"
+            prompt = self._render(stage_prompt, position, previous_moves, considered_moves, stage_fields)
+            if prompt.estimated_tokens <= self.max_input_tokens:
+                return self._trimmed(prompt)
+
+        # 2. keep only the considered moves themselves
+        considered_moves = [move.move for move in analysis_memory]
+        prompt = self._render(stage_prompt, position, previous_moves, considered_moves, stage_fields)
+        if prompt.estimated_tokens <= self.max_input_tokens:
+            return self._trimmed(prompt)
+
+        # 3. drop the oldest previous moves, which changes the prefix shared by the calls of the move
+        while previous_moves:
+            previous_moves = previous_moves[1:]
+            prompt = self._render(stage_prompt, position, previous_moves, considered_moves, stage_fields)
+            if prompt.estimated_tokens <= self.max_input_tokens:
+                break
+        return self._trimmed(prompt)
+
+    @staticmethod
+    def _trimmed(prompt: BuiltPrompt) -> BuiltPrompt:
+        prompt.trimmed = True
+        return prompt
+
+    @staticmethod
+    def _render(
+        stage_prompt: str,
+        position: str,
+        previous_moves: list[str],
+        considered_moves: list[str],
+        stage_fields: dict,
+    ) -> BuiltPrompt:
+        move_context = MOVE_CONTEXT_PROMPT.format(
+            position=position,
+            previous_moves="\n".join(previous_moves) if previous_moves else "No moves have been made yet.",
+        )
+        system_prompt = SYSTEM_PROMPT.format(**stage_fields)
+        user_prompt = stage_prompt.format(
+            move_context=move_context,
+            considered_moves=(
+                "\n".join(considered_moves) if considered_moves else "No moves have been considered yet."
+            ),
+            **stage_fields,
+        )
+        return BuiltPrompt(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            estimated_tokens=estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+        )
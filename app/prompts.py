@@ -1,9 +1,17 @@
-SYSTEM_PROMPT = """You are a grandmaster chess player playing a chess game.
-You are playing for you and your family's lives so it's important to play the best moves possible with the most robust reasoning."""
+# bump whenever a prompt or response schema changes so that cached responses are invalidated
+PROMPT_VERSION = "5"
 
-BASE_MOVE_PROMPT = """Given the position, choose the best, valid next move in standard algebraic notation.
+# Prompts are laid out for provider-side prefix caching: the system prompt is identical for
+# every call of a game, MOVE_CONTEXT_PROMPT is identical for every call made during one move
+# that chooses or analyses a move, and the stage prompts below carry the per-call deltas at
+# the very end. The orchestration call only decides whether to analyse more, so it gets the
+# FEN instead of the full move context. {side} and {opponent} are filled in with
+# `side_names` of the side the agent plays.
 
-<position>
+SYSTEM_PROMPT = """You are a grandmaster chess player playing a chess game as {side}.
+You are playing for you and your family's lives so it's important to play the best moves possible with the most robust reasoning."""
+
+MOVE_CONTEXT_PROMPT = """<position>
 {position}
 </position>
 
@@ -13,26 +21,27 @@ These are the recent moves you have already played and why you played them:
 </previous_moves>
 """
 
-ORCHESTRATION_USER_PROMPT = """You are deciding which move to play.
-<current_position>
-{position}
-</current_position>
+# the local tactical analysis, appended to the position for every call of the move
+TACTICS_PROMPT = """{position}
 
-These are the recent moves you have already played and why you played them:
-<previous_moves>
-{previous_moves}
-</previous_moves>
+Tactical facts about this position for the side to move, computed exactly:
+{tactics}"""
 
-These are your thoughts on the existing position and which move to play:
-<considered_moves>
-{considered_moves}
-</considered_moves>
+ORCHESTRATION_USER_PROMPT = """<position>
+FEN: {fen}
+</position>
 
+You are deciding which move to play.
 Decide whether you want to want to consider a new move or if you're ready to decide on a move.
+Consider a new move if you haven't already considered at least two moves.
 
-Consider a new move if you haven't already considered at least two moves."""
+These are your thoughts on the existing position and which move to play:
+<considered_moves>
+{considered_moves}
+</considered_moves>"""
 
-CONSIDER_NEW_MOVE_USER_PROMPT = """{base_move_prompt}
+CONSIDER_NEW_MOVE_USER_PROMPT = """{move_context}
+Given the position, choose the best, valid next move in standard algebraic notation.
 
 Here are other moves you already considered. DO NOT CHOOSE FROM THESE MOVES:
 <considered_moves>
@@ -41,7 +50,8 @@ Here are other moves you already considered. DO NOT CHOOSE FROM THESE MOVES:
 
 Move: """
 
-DECIDE_ON_MOVE_USER_PROMPT = """{base_move_prompt}
+DECIDE_ON_MOVE_USER_PROMPT = """{move_context}
+Given the position, choose the best, valid next move in standard algebraic notation.
 
 Here is your reasoning for why you were ready to decide on a move:
 <decision_reasoning>
@@ -55,8 +65,40 @@ Here are all of the moves to consider. ONLY CHOOSE FROM THESE MOVES:
 
 Move: """
 
-CONSIDER_COUNTER_MOVE_USER_PROMPT = """You are given a position and a move you are considering to play as black (original_move).
-Consider the best counter move by white and whether that makes original_move a good move.
+FAN_OUT_CANDIDATE_USER_PROMPT = """{move_context}
+Given the position, choose the best, valid next move in standard algebraic notation.
+
+You are one of {num_candidates} analysts exploring this position in parallel.
+Rank the candidate moves in your head from most to least promising \
+and analyse ONLY the move you rank number {candidate_rank}.
+
+Move: """
+
+SELECT_MOVE_USER_PROMPT = """{move_context}
+Given the position, find the best, valid next move in standard algebraic notation.
+First analyse at least {min_candidates} distinct candidate moves, \
+each with the counter moves by {opponent} it has to reckon with.
+Then choose the best of them as your move.
+
+Here are moves you already considered. Analyse other moves as candidates, but you may still choose one of these:
+<considered_moves>
+{considered_moves}
+</considered_moves>"""
+
+REPAIR_MOVE_USER_PROMPT = """{user_prompt}
+
+Your previous answer was '{invalid_move}', which is not a legal move in this position.
+These are the only legal moves, in standard algebraic notation:
+<legal_moves>
+{legal_moves}
+</legal_moves>
+
+Answer again and ONLY choose a move from the legal moves.
+
+Move: """
+
+CONSIDER_COUNTER_MOVE_USER_PROMPT = """You are given a position and a move you are considering to play as {side} (original_move).
+Consider the best counter move by {opponent} and whether that makes original_move a good move.
 Only consider moves that you haven't already considered.
 
 <position>
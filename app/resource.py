@@ -1,5 +1,17 @@
+from enum import Enum
+
 from pydantic import BaseModel, Field
 
+class AgentStrategy(Enum):
+    SEQUENTIAL = "sequential"
+    FAN_OUT = "fan_out"
+    SINGLE_CALL = "single_call"
+
+class PlayMode(Enum):
+    LLM = "llm"
+    ENGINE = "engine"
+    HYBRID = "hybrid"
+
 class MoveRequest(BaseModel):
     from_square: str = Field(alias="from")
     to_square: str = Field(alias="to")
@@ -7,7 +19,25 @@ class MoveRequest(BaseModel):
     class Config:
         validate_by_name = True
 
+class TimeControl(BaseModel):
+    initial_seconds: float = Field(gt=0)
+    increment_seconds: float = Field(default=0, ge=0)
+    moves_to_go: int | None = Field(
+        default=None, gt=0, description="Moves per time control period, after which the initial time is added again. "
+        "None for sudden death."
+    )
+
+class ClockState(BaseModel):
+    """Both clocks as of the last move; the clock of `running` has been ticking since."""
+    white_seconds: float
+    black_seconds: float
+    increment_seconds: float
+    running: str | None = Field(default=None, description="'white' or 'black', None before the first move.")
+
 class GameState(BaseModel):
+    version: int = Field(
+        default=0, description="Plies played, plus one once the game is lost on time. Changes whenever the state does."
+    )
     fen: str
     legal_moves: list[str]
     is_check: bool
@@ -15,3 +45,53 @@ class GameState(BaseModel):
     is_game_over: bool
     result: str | None = None
     ai_reasoning: str | None = None
+    clock: ClockState | None = None
+    lost_on_time: bool = False
+    agent_move_budget_seconds: float | None = Field(
+        default=None, description="Thinking time the agent was given for the move it just played."
+    )
+
+class GameStateDelta(BaseModel):
+    """What changed since the client's `since` version: the moves played and, if any, the changed flags."""
+    version: int
+    since: int
+    moves: list[str] = Field(description="UCI moves played after version `since`, oldest first.")
+    is_check: bool | None = None
+    is_checkmate: bool | None = None
+    is_game_over: bool | None = None
+    result: str | None = None
+    lost_on_time: bool | None = None
+
+class NewGameRequest(BaseModel):
+    strategy: AgentStrategy = AgentStrategy.SEQUENTIAL
+    mode: PlayMode = PlayMode.LLM
+    time_control: TimeControl | None = None
+    move_time_seconds: float | None = Field(
+        default=None,
+        gt=0,
+        description="Fixed thinking time of the agent per move, overriding the time control's budget.",
+    )
+    ponder: bool = Field(
+        default=False, description="Let the agent analyse White's likeliest replies while White thinks."
+    )
+
+class NewGameResponse(BaseModel):
+    game_id: str
+    strategy: AgentStrategy
+    mode: PlayMode
+    state: GameState
+    time_control: TimeControl | None = None
+    move_time_seconds: float | None = None
+    ponder: bool = False
+
+class AgentEventType(Enum):
+    DECISION = "decision"
+    CANDIDATE = "candidate"
+    REASONING_DELTA = "reasoning_delta"
+    MOVE = "move"
+    STATE = "state"
+    ERROR = "error"
+
+class AgentEvent(BaseModel):
+    type: AgentEventType
+    data: dict
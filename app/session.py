@@ -0,0 +1,525 @@
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import chess
+
+from app.agent import ChessAgent
+from app.cache import MoveCache
+from app.engine import Engine, create_engine_from_env
+from app.game_store import GameStore, PlyConflictError, PlyRecord, StoredGame, create_game_store_from_env
+from app.llm import LLMManager
+from app.llm_resource import RESPONSE_FORMATS, AnalysisLLMChessMove
+from app.move_provider import (
+    BookMoveProvider,
+    EngineMoveProvider,
+    HybridMoveProvider,
+    LLMMoveProvider,
+    MoveProvider,
+)
+from app.move_schema import MoveSchemaFactory
+from app.opening_book import OpeningBook
+from app.ponder import Ponderer
+from app.position_encoder import PositionEncoder
+from app.prompt_builder import PromptBuilder
+from app.resource import AgentStrategy, GameState, GameStateDelta, PlayMode, TimeControl
+from app.tactics import TacticalAnalyser
+from app.time_control import GameClock, TimeManager
+
+logger = logging.getLogger(__name__)
+
+
+class GameNotFoundError(KeyError):
+    """Raised when a game ID is unknown or its game has been evicted."""
+
+
+@dataclass(frozen=True)
+class StateSnapshot:
+    """A game's state at one version, with its JSON body and entity tag computed once."""
+    version: int
+    state: GameState
+    body: bytes
+    etag: str
+
+
+class GameSession:
+    """State of a single game: its board, clock, agent, how the agent's moves are chosen and a lock guarding them.
+
+    With a `store`, every move is persisted before it is played, along with the entries
+    it added to the agent's game memory, and so is every candidate the agent analyses. Store
+    calls run in worker threads, so that a store waiting for its file never blocks the event loop.
+    With `ponder`, the agent analyses White's likeliest replies while White thinks.
+    """
+
+    def __init__(
+        self,
+        game_id: str,
+        llm_manager: LLMManager,
+        strategy: AgentStrategy = AgentStrategy.SEQUENTIAL,
+        move_cache: MoveCache | None = None,
+        position_encoder: PositionEncoder | None = None,
+        prompt_builder: PromptBuilder | None = None,
+        mode: PlayMode = PlayMode.LLM,
+        engine: Engine | None = None,
+        opening_book: OpeningBook | None = None,
+        time_control: TimeControl | None = None,
+        move_time: float | None = None,
+        time_manager: TimeManager | None = None,
+        store: GameStore | None = None,
+        ponder: bool = False,
+        tactics: TacticalAnalyser | None = None,
+        move_schema: MoveSchemaFactory | None = None,
+    ):
+        self.game_id = game_id
+        self.mode = mode
+        self.board = chess.Board()
+        self.time_control = time_control
+        self.clock = GameClock(time_control) if time_control is not None else None
+        self.move_time = move_time
+        self.store = store
+        # set when another worker stored a ply this session didn't know about
+        self.stale = False
+        # `store.version()` when this session last caught up with the store
+        self.store_version: int | None = None
+        self.time_manager = time_manager if time_manager is not None else TimeManager()
+        # whether the side to move was in check after each ply, for the flags of older versions in deltas
+        self._check_history = [False]
+        self._snapshot: StateSnapshot | None = None
+        self.position_encoder = position_encoder if position_encoder is not None else PositionEncoder()
+        self.chess_agent = ChessAgent(
+            llm_manager=llm_manager,
+            strategy=strategy,
+            move_cache=move_cache,
+            prompt_builder=prompt_builder,
+            tactics=tactics,
+            move_schema=move_schema,
+        )
+        # game memory entries up to this index are stored already
+        self._stored_memory = 0
+        # analyses being written in the background
+        self._analysis_writes: set[asyncio.Task] = set()
+        if store is not None:
+            self.chess_agent.on_analysis = self._store_analysis
+        if ponder:
+            self.chess_agent.ponderer = Ponderer.from_env(self.chess_agent.ponder_position, engine)
+        self.move_provider = self._create_move_provider(mode, engine)
+        if opening_book is not None:
+            self.move_provider = BookMoveProvider(opening_book, self.move_provider, self.chess_agent)
+        # every read or write of board/agent state goes through this lock so that
+        # concurrent requests for the same game can't interleave
+        self.lock = asyncio.Lock()
+        self.last_access = time.monotonic()
+
+    def _create_move_provider(self, mode: PlayMode, engine: Engine | None) -> MoveProvider:
+        if mode == PlayMode.LLM:
+            return LLMMoveProvider(self.chess_agent)
+        if engine is None:
+            raise ValueError(f"Play mode {mode.value} needs an engine")
+        if mode == PlayMode.ENGINE:
+            return EngineMoveProvider(engine)
+        return HybridMoveProvider.from_env(self.chess_agent, engine)
+
+    def settings(self) -> dict:
+        return {
+            "strategy": self.chess_agent.strategy.value,
+            "mode": self.mode.value,
+            "time_control": self.time_control.model_dump() if self.time_control is not None else None,
+            "move_time": self.move_time,
+            "ponder": self.chess_agent.ponderer is not None,
+        }
+
+    async def push_move(self, move: chess.Move) -> None:
+        """Play `move`, storing it first; raises `PlyConflictError` if another worker stored this ply already."""
+        if self.clock is not None:
+            self.clock.press(self.board.turn)
+        memory = self.chess_agent.game_memory[self._stored_memory:]
+        if self.store is not None:
+            record = PlyRecord(
+                ply=len(self.board.move_stack),
+                uci=move.uci(),
+                memory=memory,
+                clock=self.clock.record() if self.clock is not None else None,
+            )
+            try:
+                await asyncio.to_thread(self.store.append_ply, self.game_id, record)
+            except PlyConflictError:
+                self.stale = True
+                raise
+        self._stored_memory += len(memory)
+        self._play(move)
+        self._update_pondering()
+
+    def _update_pondering(self) -> None:
+        ponderer = self.chess_agent.ponderer
+        if ponderer is None:
+            return
+        if self.board.turn == chess.BLACK:
+            ponderer.resolve(self.board)
+        elif not self.board.is_game_over():
+            ponderer.start(self.board, self.position_encoder, self.chess_agent.expected_replies)
+
+    def _play(self, move: chess.Move) -> None:
+        self.position_encoder.push(self.board, move)
+        self.board.push(move)
+        self._check_history.append(self.board.is_check())
+
+    def _store_analysis(self, analysis: AnalysisLLMChessMove) -> None:
+        # the agent doesn't wait for the write: an analysis lost in a crash is only asked for again
+        write = asyncio.create_task(asyncio.to_thread(
+            self.store.append_analysis, self.game_id, len(self.board.move_stack), analysis.model_dump()
+        ))
+        self._analysis_writes.add(write)
+        write.add_done_callback(self._analysis_written)
+
+    def _analysis_written(self, write: asyncio.Task) -> None:
+        self._analysis_writes.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            logger.warning("Storing an analysis of game %s failed: %s", self.game_id, write.exception())
+
+    def replay(self, plies: list[PlyRecord]) -> None:
+        """Play stored plies, e.g. those another worker stored, without storing them again."""
+        if not plies:
+            return
+        for record in plies:
+            self._play(chess.Move.from_uci(record.uci))
+            self.chess_agent.game_memory.extend(record.memory)
+        self._stored_memory = len(self.chess_agent.game_memory)
+        # whatever was analysed for the position before these plies is moot now
+        self.chess_agent.analysis_memory = []
+        if self.chess_agent.ponderer is not None:
+            self.chess_agent.ponderer.cancel()
+        last = plies[-1]
+        if self.clock is not None and last.clock is not None:
+            self.clock.restore(last.clock, len(self.board.move_stack), last.played_at)
+
+    def restore(self, stored: StoredGame) -> None:
+        """Rebuild the game from the store, resuming the analysis of a turn that was cut short, e.g. by a crash."""
+        self.replay(stored.plies)
+        self.chess_agent.analysis_memory = [
+            AnalysisLLMChessMove.model_validate(analysis) for analysis in stored.analysis
+        ]
+
+    def flagged(self) -> chess.Color | None:
+        """The side that lost on time, if the game wasn't over on the board first."""
+        if self.clock is None:
+            return None
+        flagged = self.clock.flagged(self.board.turn)
+        if flagged is None or self.board.is_game_over():
+            return None
+        return flagged
+
+    def is_game_over(self) -> bool:
+        return self.snapshot().state.is_game_over
+
+    @property
+    def version(self) -> int:
+        return len(self.board.move_stack) + (self.flagged() is not None)
+
+    def snapshot(self) -> StateSnapshot:
+        """The current state, rebuilt only when a move was played or a flag fell since the last call."""
+        version = self.version
+        if self._snapshot is None or self._snapshot.version != version:
+            state = self._build_state(version)
+            self._snapshot = StateSnapshot(
+                version=version, state=state, body=state.model_dump_json().encode(), etag=f'"{version}"'
+            )
+        return self._snapshot
+
+    def _build_state(self, version: int) -> GameState:
+        board = self.board
+        flagged = self.flagged()
+        # one outcome() covers checkmate, game over and the result
+        outcome = board.outcome() if flagged is None else None
+        if flagged is not None:
+            result = "0-1" if flagged == chess.WHITE else "1-0"
+        else:
+            result = outcome.result() if outcome is not None else None
+        return GameState(
+            version=version,
+            fen=board.fen(),
+            legal_moves=[] if flagged is not None else [move.uci() for move in board.legal_moves],
+            is_check=self._check_history[-1],
+            is_checkmate=outcome is not None and outcome.termination == chess.Termination.CHECKMATE,
+            is_game_over=result is not None,
+            result=result,
+            clock=self.clock.state(board.turn) if self.clock is not None else None,
+            lost_on_time=flagged is not None,
+        )
+
+    def delta(self, since: int) -> GameStateDelta:
+        """The moves played after version `since` and the flags that changed since then."""
+        current = self.snapshot().state
+        if not 0 <= since <= current.version:
+            raise ValueError(f"Unknown version {since}, the game is at version {current.version}")
+
+        plies = len(self.board.move_stack)
+        delta = GameStateDelta(
+            version=current.version,
+            since=since,
+            moves=[move.uci() for move in self.board.move_stack[since:]],
+        )
+        # moves were played after every older version, so the game wasn't over yet then
+        previous = {
+            "is_check": self._check_history[min(since, plies)],
+            "is_checkmate": False,
+            "is_game_over": False,
+            "result": None,
+            "lost_on_time": False,
+        }
+        for flag, value in previous.items():
+            if getattr(current, flag) != value:
+                setattr(delta, flag, getattr(current, flag))
+        return delta
+
+    def agent_move_budget(self, move_time: float | None = None) -> float | None:
+        """Thinking time for the agent's next move, or None for the agent's default.
+
+        A `move_time` requested for this move wins over the game's fixed move time, which
+        wins over a budget allocated from the clock; none of them may overrun the clock.
+        """
+        budget = move_time if move_time is not None else self.move_time
+        if self.clock is None:
+            return budget
+        if budget is None:
+            return self.time_manager.allocate(self.clock, self.board)
+        remaining = self.clock.remaining_for(self.board.turn, self.board.turn)
+        return min(budget, max(remaining - self.time_manager.safety_margin, 0.0))
+
+    def close(self) -> None:
+        """Stop the game's background work, e.g. when it is evicted."""
+        if self.chess_agent.ponderer is not None:
+            self.chess_agent.ponderer.cancel()
+
+    def encode_position(self) -> str:
+        return self.position_encoder.encode(self.board)
+
+    def touch(self) -> None:
+        self.last_access = time.monotonic()
+
+    def is_idle(self, idle_timeout: float, now: float) -> bool:
+        return now - self.last_access > idle_timeout
+
+
+class GameRegistry:
+    """Session store keyed by game ID.
+
+    Games that have not been accessed for `idle_timeout` seconds are evicted, and
+    once more than `max_games` games are live the least recently used one is dropped.
+    With a `GameStore` eviction only unloads a game: games are loaded from the store on
+    first access, and a loaded game catches up on the plies other workers stored before
+    each access where the store's version changed, so that any worker can serve any game.
+    Store calls run in worker threads, so that a busy store doesn't stall every game.
+    All games share one `LLMManager` and therefore one pooled HTTP client, one
+    `MoveCache` so that a position analysed in one game is reused by every other game,
+    one engine (process pool) for the engine and hybrid play modes, one opening book, and one
+    `TacticalAnalyser` and `MoveSchemaFactory`, whose summaries and schemas are cached by position.
+    """
+
+    def __init__(
+        self,
+        max_games: int = 10_000,
+        idle_timeout: float = 60 * 60,
+        llm_manager: LLMManager | None = None,
+        move_cache: MoveCache | None = None,
+        store: GameStore | None = None,
+    ):
+        self.max_games = max_games
+        self.idle_timeout = idle_timeout
+        self.llm_manager = llm_manager if llm_manager is not None else LLMManager()
+        self.move_cache = move_cache if move_cache is not None else MoveCache.from_env()
+        self.prompt_builder = PromptBuilder.from_env()
+        self.engine = create_engine_from_env()
+        self.opening_book = OpeningBook.from_env()
+        self.tactics = TacticalAnalyser.from_env()
+        self.move_schema = MoveSchemaFactory.from_env()
+        self.time_manager = TimeManager.from_env()
+        self.store = store if store is not None else create_game_store_from_env()
+        self._sessions: OrderedDict[str, GameSession] = OrderedDict()
+        # held while a game is loaded, so that concurrent requests for it load it once
+        self._load_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def warm_up(self) -> None:
+        """Prepare what the first games would otherwise wait for.
+
+        The LLM backend opens its connections and the engine starts its processes, and the
+        positions after each of White's first moves are analysed, so that the tactical
+        summaries and move schemas of every game's first agent turn are cached.
+        """
+        started = time.monotonic()
+        results = await asyncio.gather(
+            self.llm_manager.warm_up(RESPONSE_FORMATS), self.engine.warm_up(), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Warm-up step failed: %s", result)
+
+        for move in list(chess.Board().legal_moves):
+            board = chess.Board()
+            board.push(move)
+            if self.tactics is not None:
+                self.tactics.summarize(board)
+            if self.move_schema is not None:
+                for response_format in RESPONSE_FORMATS:
+                    self.move_schema.restrict(response_format, board)
+        logger.info("Warmed up in %.2fs", time.monotonic() - started)
+
+    async def create_game(
+        self,
+        strategy: AgentStrategy = AgentStrategy.SEQUENTIAL,
+        mode: PlayMode = PlayMode.LLM,
+        time_control: TimeControl | None = None,
+        move_time: float | None = None,
+        ponder: bool = False,
+    ) -> GameSession:
+        self.evict_idle()
+
+        session = self._new_session(uuid.uuid4().hex, strategy, mode, time_control, move_time, ponder)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.create_game, session.game_id, session.settings())
+        self._add_session(session)
+        return session
+
+    def _new_session(
+        self,
+        game_id: str,
+        strategy: AgentStrategy,
+        mode: PlayMode,
+        time_control: TimeControl | None,
+        move_time: float | None,
+        ponder: bool = False,
+    ) -> GameSession:
+        return GameSession(
+            game_id,
+            self.llm_manager,
+            strategy=strategy,
+            move_cache=self.move_cache,
+            position_encoder=PositionEncoder.from_env(),
+            prompt_builder=self.prompt_builder,
+            mode=mode,
+            engine=self.engine,
+            opening_book=self.opening_book,
+            time_control=time_control,
+            move_time=move_time,
+            time_manager=self.time_manager,
+            store=self.store,
+            ponder=ponder,
+            tactics=self.tactics,
+            move_schema=self.move_schema,
+        )
+
+    def _add_session(self, session: GameSession) -> None:
+        self._sessions[session.game_id] = session
+        excess = len(self._sessions) - self.max_games
+        if excess <= 0:
+            return
+        # like evict_idle, games in the middle of a turn are kept, even if that leaves the registry over its cap
+        evictable = itertools.islice(
+            (
+                game_id
+                for game_id, other in self._sessions.items()
+                if other is not session and not other.lock.locked()
+            ),
+            excess,
+        )
+        for evicted_id in list(evictable):
+            self._sessions.pop(evicted_id).close()
+            logger.info("Game cap of %d reached, evicted game %s", self.max_games, evicted_id)
+
+    async def _load_game(self, game_id: str) -> GameSession:
+        if self.store is None:
+            raise GameNotFoundError(game_id)
+        async with self._load_lock:
+            session = self._sessions.get(game_id)
+            if session is not None:
+                # loaded by a concurrent request meanwhile
+                return session
+            return await self._read_game(game_id)
+
+    async def _read_game(self, game_id: str) -> GameSession:
+        version = await asyncio.to_thread(self.store.version)
+        stored = await asyncio.to_thread(self.store.load_game, game_id)
+        if stored is None:
+            raise GameNotFoundError(game_id)
+
+        settings = stored.settings
+        session = self._new_session(
+            game_id,
+            strategy=AgentStrategy(settings["strategy"]),
+            mode=PlayMode(settings["mode"]),
+            time_control=TimeControl.model_validate(settings["time_control"]) if settings["time_control"] else None,
+            move_time=settings["move_time"],
+            ponder=settings.get("ponder", False),
+        )
+        session.restore(stored)
+        session.store_version = version
+        logger.info(
+            "Loaded game %s at ply %d with %d pending analyses", game_id, len(stored.plies), len(stored.analysis)
+        )
+        self._add_session(session)
+        return session
+
+    async def get_game(self, game_id: str) -> GameSession:
+        session = self._sessions.get(game_id)
+        if session is None or (session.stale and not session.lock.locked()):
+            if session is not None:
+                # unregistered first, so that a game deleted meanwhile doesn't leave it behind
+                del self._sessions[game_id]
+                session.close()
+            session = await self._load_game(game_id)
+        elif self.store is not None and not session.lock.locked():
+            # a turn in progress here is the only writer, otherwise another worker may have moved,
+            # which the store's version tells without reading the game, e.g. on every board poll;
+            # the lock keeps a move of this worker from interleaving with the catch-up
+            async with session.lock:
+                await self._catch_up(session)
+
+        session.touch()
+        self._sessions.move_to_end(game_id)
+        return session
+
+    async def _catch_up(self, session: GameSession) -> None:
+        """Replay the plies other workers stored since the session last caught up with the store."""
+        version = await asyncio.to_thread(self.store.version)
+        if version == session.store_version:
+            return
+        plies = await asyncio.to_thread(self.store.load_plies, session.game_id, len(session.board.move_stack))
+        if plies is None:
+            if self._sessions.get(session.game_id) is session:
+                del self._sessions[session.game_id]
+            session.close()
+            raise GameNotFoundError(session.game_id)
+        session.replay(plies)
+        session.store_version = version
+
+    async def delete_game(self, game_id: str) -> None:
+        session = self._sessions.pop(game_id, None)
+        if session is not None:
+            session.close()
+        loaded = session is not None
+        stored = self.store is not None and await asyncio.to_thread(self.store.delete_game, game_id)
+        if not (loaded or stored):
+            raise GameNotFoundError(game_id)
+
+    def evict_idle(self) -> int:
+        """Drop every game that has been idle for longer than `idle_timeout`."""
+        now = time.monotonic()
+        evicted = 0
+        # sessions are kept in access order, so the idle ones are at the front
+        while self._sessions:
+            game_id, session = next(iter(self._sessions.items()))
+            if not session.is_idle(self.idle_timeout, now) or session.lock.locked():
+                break
+            del self._sessions[game_id]
+            session.close()
+            evicted += 1
+
+        if evicted:
+            logger.info("Evicted %d idle games", evicted)
+        return evicted
@@ -7,6 +7,7 @@ $(document).ready(function() {
     // Game state
     let game = new Chess();
     let lastMove = null;
+    let gameId = null;
     
     // Board configuration
     const config = {
@@ -117,7 +118,7 @@ $(document).ready(function() {
     // Send player move to server
     async function sendPlayerMove(from, to) {
         try {
-            const response = await fetch('/move/player', {
+            const response = await fetch(`/games/${gameId}/move/player`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -163,13 +164,13 @@ $(document).ready(function() {
         }
     }
     
-    // Request AI move from server
+    // Request AI move from server, following its progress as server-sent events
     async function requestAiMove() {
         try {
-            const response = await fetch('/move/llm-agent', {
+            const response = await fetch(`/games/${gameId}/move/llm-agent/stream`, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Accept': 'text/event-stream'
                 }
             });
             
@@ -179,21 +180,59 @@ $(document).ready(function() {
                 throw new Error(`Server returned ${response.status}: ${errorText}`);
             }
             
-            const data = await response.json();
+            $gameStatus.text('AI is thinking...');
             
-            if (data.error) {
-                console.error(data.error);
-                $gameStatus.text(data.error);
-            } else {
-                // Update game with server response after AI's move
-                game.load(data.fen);
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+            let buffer = '';
+            
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
                 
-                // Update the last move to the AI's move
-                const history = game.history({ verbose: true });
-                if (history.length > 0) {
-                    const lastMoveObj = history[history.length - 1];
-                    lastMove = { from: lastMoveObj.from, to: lastMoveObj.to };
+                buffer += value;
+                // Events are separated by a blank line
+                let separator;
+                while ((separator = buffer.indexOf('\n\n')) !== -1) {
+                    handleAgentEvent(parseServerSentEvent(buffer.slice(0, separator)));
+                    buffer = buffer.slice(separator + 2);
                 }
+            }
+        } catch (error) {
+            console.error('Error requesting AI move from server:', error);
+            $gameStatus.text('Error getting AI response');
+        }
+    }
+    
+    // Parse one "event: ...\ndata: ..." block
+    function parseServerSentEvent(block) {
+        const event = { type: 'message', data: null };
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) {
+                event.type = line.slice('event: '.length);
+            } else if (line.startsWith('data: ')) {
+                event.data = JSON.parse(line.slice('data: '.length));
+            }
+        });
+        return event;
+    }
+    
+    // Update the UI for each step of the AI's turn
+    function handleAgentEvent(event) {
+        switch (event.type) {
+            case 'decision':
+                displayAIReasoning(event.data.reasoning);
+                break;
+            case 'candidate':
+                displayAIReasoning(`Considering ${event.data.move}: ${event.data.reasoning}`);
+                break;
+            case 'move':
+                // Save the AI's move for highlighting
+                lastMove = { from: event.data.uci.slice(0, 2), to: event.data.uci.slice(2, 4) };
+                displayAIReasoning(event.data.reasoning);
+                break;
+            case 'state':
+                // Update game with server response after AI's move
+                game.load(event.data.fen);
                 
                 // Update the board to show the current position
                 board.position(game.fen());
@@ -203,15 +242,11 @@ $(document).ready(function() {
                 
                 // Update game status after AI move
                 updateStatus();
-                
-                // Display AI reasoning if available
-                if (data.ai_reasoning) {
-                    displayAIReasoning(data.ai_reasoning);
-                }
-            }
-        } catch (error) {
-            console.error('Error requesting AI move from server:', error);
-            $gameStatus.text('Error getting AI response');
+                break;
+            case 'error':
+                console.error(event.data.detail);
+                $gameStatus.text(event.data.detail);
+                break;
         }
     }
     
@@ -248,15 +283,17 @@ $(document).ready(function() {
     // Initialize game status
     updateStatus();
     
-    // Make sure the UI is in sync with the server on page load
-    fetch('/board')
+    // Start a new server-side game on page load and sync the UI with it
+    fetch('/games', { method: 'POST' })
         .then(response => response.json())
         .then(data => {
-            game.load(data.fen());
-            board.position(data.fen());
+            gameId = data.game_id;
+            game.load(data.state.fen);
+            board.position(data.state.fen);
             updateStatus();
         })
         .catch(error => {
-            console.error('Error getting initial board state:', error);
+            console.error('Error creating a new game:', error);
+            $gameStatus.text('Error communicating with server');
         });
 });
\ No newline at end of file
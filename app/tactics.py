@@ -0,0 +1,354 @@
+"""Local tactical pre-analysis: facts about a position the LLM would otherwise have to find itself.
+
+Before the agent's turn, `TacticalAnalyser` lists the side to move's mates in one and two,
+checks and captures with their static exchange evaluation, the hanging pieces of both
+sides, pins against the kings and whether the opponent threatens mate. The facts are
+rendered as a few short lines that are added to the position in every prompt of the turn.
+
+All of it is read off one `AttackTable` per position, the attackers of every square by
+both colours, and summaries are cached by position, so analysing a position takes a few
+milliseconds and a transposition or repeated turn takes none. Mates in two are only
+searched after checks with few replies, and only for a fixed number of replies in all,
+which finds the forcing ones at a fraction of a full search and keeps the slowest positions
+under 10 ms.
+"""
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import chess
+
+from app.cache import position_key
+from app.engine import PIECE_VALUES
+
+DEFAULT_CACHE_SIZE = 10_000
+# listed per category, so that busy positions still give a short summary
+MAX_LISTED = 5
+# replies to a check beyond which no mate in two is searched after it
+MAX_MATE_REPLIES = 4
+# replies searched for a mate in one per position, which bounds the mate in two search
+MAX_MATE_SEARCH_REPLIES = 8
+# the king is never exchanged, it only captures last
+SEE_KING_VALUE = 20_000
+# score of a mating move in `rank_moves`, and minus that of a move allowing a mate in one
+MATE_SCORE = 100_000
+
+
+def _value(piece_type: chess.PieceType) -> int:
+    return SEE_KING_VALUE if piece_type == chess.KING else PIECE_VALUES[piece_type]
+
+
+class AttackTable:
+    """The attackers of every square by both colours, computed once per position."""
+
+    def __init__(self, board: chess.Board):
+        self.board = board
+        self._attackers = {
+            color: [board.attackers_mask(color, square) for square in chess.SQUARES] for color in chess.COLORS
+        }
+
+    def attackers(self, color: chess.Color, square: chess.Square) -> chess.Bitboard:
+        return self._attackers[color][square]
+
+    def static_exchange(self, square: chess.Square, color: chess.Color) -> int:
+        """Centipawns `color` wins by starting to capture on `square`, 0 if it can't or shouldn't."""
+        target = self.board.piece_type_at(square)
+        attackers = self.attackers(color, square)
+        if target is None or not attackers:
+            return 0
+        return self._exchange(square, _value(target), attackers, self.board.occupied, color)
+
+    def capture_value(self, move: chess.Move) -> int:
+        """Static exchange evaluation of a capture: the material it wins once the recaptures are over."""
+        board = self.board
+        occupied = board.occupied & ~chess.BB_SQUARES[move.from_square]
+        if board.is_en_passant(move):
+            captured = PIECE_VALUES[chess.PAWN]
+            occupied &= ~chess.BB_SQUARES[move.to_square + (-8 if board.turn == chess.WHITE else 8)]
+        else:
+            captured = _value(board.piece_type_at(move.to_square))
+        if move.promotion:
+            captured += PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN]
+            mover = move.promotion
+        else:
+            mover = board.piece_type_at(move.from_square)
+        replies = board.attackers_mask(not board.turn, move.to_square, occupied) & occupied
+        return captured - self._exchange(move.to_square, _value(mover), replies, occupied, not board.turn)
+
+    def _exchange(
+        self,
+        square: chess.Square,
+        target_value: int,
+        attackers: chess.Bitboard,
+        occupied: chess.Bitboard,
+        side: chess.Color,
+    ) -> int:
+        """The swap algorithm: what `side` wins capturing a piece worth `target_value` on `square`.
+
+        Both sides capture with their least valuable attacker, including those uncovered by
+        earlier captures, and either may stop when going on would lose material.
+        """
+        board = self.board
+        gains = []
+        while attackers:
+            from_square = min(chess.scan_forward(attackers), key=lambda s: _value(board.piece_type_at(s)))
+            capturer = _value(board.piece_type_at(from_square))
+            occupied &= ~chess.BB_SQUARES[from_square]
+            replies = board.attackers_mask(not side, square, occupied) & occupied
+            if capturer == SEE_KING_VALUE and replies:
+                break
+            gains.append(target_value)
+            target_value = capturer
+            side = not side
+            attackers = replies
+
+        result = 0
+        for gain in reversed(gains):
+            result = max(gain - result, 0)
+        return result
+
+
+def _describe(board: chess.Board, square: chess.Square) -> str:
+    """A piece as in SAN, e.g. "Nc6", or just the square for pawns."""
+    piece_type = board.piece_type_at(square)
+    letter = "" if piece_type == chess.PAWN else chess.piece_symbol(piece_type).upper()
+    return f"{letter}{chess.square_name(square)}"
+
+
+def _pinner(board: chess.Board, king: chess.Square, pinned: chess.Square) -> chess.Square:
+    """The piece pinning the one on `pinned` to the `king`: the nearest piece beyond it on their line."""
+    beyond = [
+        square
+        for square in chess.scan_forward(chess.ray(king, pinned) & board.occupied)
+        if chess.between(king, square) & chess.BB_SQUARES[pinned]
+    ]
+    return min(beyond, key=lambda square: chess.square_distance(pinned, square))
+
+
+def _allows_mate_in_one(board: chess.Board) -> bool:
+    for move in board.legal_moves:
+        if board.gives_check(move):
+            board.push(move)
+            mate = board.is_checkmate()
+            board.pop()
+            if mate:
+                return True
+    return False
+
+
+def rank_moves(board: chess.Board, moves: list[chess.Move]) -> list[chess.Move]:
+    """Legal `moves` of `board` from best to worst by a one-ply tactical score, equal ones in their given order.
+
+    A mate comes first and a move allowing a mate in one last. Any other move scores the
+    material it captures less the most the opponent then wins by capturing, as the static
+    exchange evaluation of every piece of the mover puts it.
+    """
+    board = board.copy(stack=False)
+
+    def score(move: chess.Move) -> int:
+        if board.is_en_passant(move):
+            gain = PIECE_VALUES[chess.PAWN]
+        else:
+            captured = board.piece_type_at(move.to_square)
+            gain = PIECE_VALUES[captured] if captured is not None else 0
+        if move.promotion:
+            gain += PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN]
+        mover = board.turn
+        board.push(move)
+        try:
+            if board.is_checkmate():
+                return MATE_SCORE
+            if _allows_mate_in_one(board):
+                return -MATE_SCORE
+            table = AttackTable(board)
+            loss = max(
+                (
+                    table.static_exchange(square, not mover)
+                    for square in chess.scan_forward(board.occupied_co[mover] & ~board.kings)
+                ),
+                default=0,
+            )
+            return gain - loss
+        finally:
+            board.pop()
+
+    return sorted(moves, key=score, reverse=True)
+
+
+@dataclass
+class TacticalSummary:
+    """Tactical facts of a position for its side to move, in SAN and centipawns."""
+    turn: chess.Color
+    mates_in_one: list[str] = field(default_factory=list)
+    mates_in_two: list[str] = field(default_factory=list)
+    mate_threats: list[str] = field(default_factory=list)
+    hanging: list[str] = field(default_factory=list)
+    opponent_hanging: list[str] = field(default_factory=list)
+    captures: list[tuple[str, int]] = field(default_factory=list)
+    checks: list[str] = field(default_factory=list)
+    pins: list[str] = field(default_factory=list)
+
+    def render(self) -> str:
+        lines = []
+        if self.mates_in_one:
+            lines.append(f"Mate in one: {', '.join(self.mates_in_one)}")
+        if self.mates_in_two:
+            lines.append(f"Mate in two starting with: {', '.join(self.mates_in_two)}")
+        if self.mate_threats:
+            lines.append(f"Opponent threatens mate with: {', '.join(self.mate_threats)}")
+        if self.hanging:
+            lines.append(f"Your pieces en prise: {', '.join(self.hanging)}")
+        if self.opponent_hanging:
+            lines.append(f"Opponent's pieces en prise: {', '.join(self.opponent_hanging)}")
+        if self.captures:
+            lines.append(
+                "Captures (material won after the exchanges): "
+                + ", ".join(f"{san} {value / 100:+g}" for san, value in self.captures)
+            )
+        if self.checks:
+            lines.append(f"Checks: {', '.join(self.checks)}")
+        if self.pins:
+            lines.append(f"Pins: {', '.join(self.pins)}")
+        return "\n".join(lines) if lines else "No immediate tactics."
+
+
+class TacticalAnalyser:
+    """Computes `TacticalSummary`s, keeping the last `cache_size` of them by position."""
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._summaries: OrderedDict[str, TacticalSummary] = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "TacticalAnalyser | None":
+        """None with TACTICS_ENABLED=0."""
+        if os.getenv("TACTICS_ENABLED", "1") == "0":
+            return None
+        return cls(cache_size=int(os.getenv("TACTICS_CACHE_SIZE", DEFAULT_CACHE_SIZE)))
+
+    def summarize(self, board: chess.Board) -> TacticalSummary:
+        key = position_key(board)
+        summary = self._summaries.get(key)
+        if summary is not None:
+            self._summaries.move_to_end(key)
+            return summary
+
+        summary = self._analyse(board)
+        self._summaries[key] = summary
+        while len(self._summaries) > self.cache_size:
+            self._summaries.popitem(last=False)
+        return summary
+
+    def _analyse(self, board: chess.Board) -> TacticalSummary:
+        board = board.copy(stack=False)
+        table = AttackTable(board)
+        turn = board.turn
+        summary = TacticalSummary(turn=turn)
+
+        captures = []
+        checks = []
+        for move in board.legal_moves:
+            if board.is_capture(move):
+                captures.append((board.san(move), table.capture_value(move)))
+            if board.gives_check(move):
+                checks.append(move)
+        summary.captures = sorted(captures, key=lambda capture: capture[1], reverse=True)[:MAX_LISTED]
+        summary.mates_in_one = [board.san(move) for move in checks if self._is_mate(board, move)]
+        summary.checks = [board.san(move) for move in checks if not board.is_capture(move)][:MAX_LISTED]
+
+        if not summary.mates_in_one:
+            summary.mates_in_two = self._mates_in_two(board, checks)
+        if not board.is_check():
+            summary.mate_threats = self._mate_threats(board)[:MAX_LISTED]
+
+        summary.hanging = self._hanging(board, table, turn)[:MAX_LISTED]
+        summary.opponent_hanging = self._hanging(board, table, not turn)[:MAX_LISTED]
+        summary.pins = self._pins(board)[:MAX_LISTED]
+        return summary
+
+    @staticmethod
+    def _is_mate(board: chess.Board, move: chess.Move) -> bool:
+        board.push(move)
+        try:
+            return board.is_checkmate()
+        finally:
+            board.pop()
+
+    def _mates_in_one(self, board: chess.Board, first_only: bool = False) -> list[chess.Move]:
+        mates = []
+        for move in board.legal_moves:
+            if board.gives_check(move) and self._is_mate(board, move):
+                mates.append(move)
+                if first_only:
+                    break
+        return mates
+
+    def _mates_in_two(self, board: chess.Board, checks: list[chess.Move]) -> list[str]:
+        """Checks after which every reply allows a mate in one.
+
+        Only checks with at most MAX_MATE_REPLIES replies are searched, those with the fewest
+        replies first, and the search stops after MAX_MATE_SEARCH_REPLIES replies in all, which
+        bounds the cost of busy positions while still covering the forcing mates that matter
+        in practice.
+        """
+        forcing = []
+        for move in checks:
+            board.push(move)
+            replies = list(board.legal_moves)
+            board.pop()
+            if 0 < len(replies) <= MAX_MATE_REPLIES:
+                forcing.append((move, replies))
+        forcing.sort(key=lambda check: len(check[1]))
+
+        mates = []
+        budget = MAX_MATE_SEARCH_REPLIES
+        for move, replies in forcing:
+            if len(replies) > budget:
+                break
+            budget -= len(replies)
+            board.push(move)
+            forced = True
+            for reply in replies:
+                board.push(reply)
+                forced = bool(self._mates_in_one(board, first_only=True))
+                board.pop()
+                if not forced:
+                    break
+            board.pop()
+            if forced:
+                mates.append(board.san(move))
+                if len(mates) == MAX_LISTED:
+                    break
+        return mates
+
+    def _mate_threats(self, board: chess.Board) -> list[str]:
+        """The opponent's mates in one if the side to move passed."""
+        board.push(chess.Move.null())
+        try:
+            return [board.san(move) for move in self._mates_in_one(board)]
+        finally:
+            board.pop()
+
+    @staticmethod
+    def _hanging(board: chess.Board, table: AttackTable, color: chess.Color) -> list[str]:
+        """Pieces of `color` the opponent wins material by capturing, with what it wins."""
+        hanging = []
+        for square in chess.scan_forward(board.occupied_co[color] & ~board.kings):
+            gain = table.static_exchange(square, not color)
+            if gain > 0:
+                hanging.append((gain, f"{_describe(board, square)} (-{gain / 100:g})"))
+        hanging.sort(key=lambda entry: entry[0], reverse=True)
+        return [description for _, description in hanging]
+
+    @staticmethod
+    def _pins(board: chess.Board) -> list[str]:
+        pins = []
+        for color in (board.turn, not board.turn):
+            king = board.king(color)
+            for square in chess.scan_forward(board.occupied_co[color] & ~board.kings):
+                if not board.is_pinned(color, square):
+                    continue
+                pins.append(
+                    f"{_describe(board, square)} pinned to its king by {_describe(board, _pinner(board, king, square))}"
+                )
+        return pins
@@ -0,0 +1,137 @@
+"""Chess clocks and the policy that turns the agent's remaining time into a budget per move."""
+import os
+import time
+
+import chess
+
+from app.resource import ClockState, TimeControl
+
+DEFAULT_MOVES_TO_GO = 40
+MIN_MOVES_TO_GO = 15
+DEFAULT_MIN_BUDGET = 1.0
+DEFAULT_MAX_CLOCK_FRACTION = 0.25
+# kept back from every budget for the HTTP round trip and bookkeeping around the agent's turn
+DEFAULT_SAFETY_MARGIN = 0.5
+# share of the increment spent on top of the even split of the remaining time
+INCREMENT_SHARE = 0.8
+
+
+class GameClock:
+    """Remaining time of both sides under a `TimeControl`.
+
+    Clocks start running with White's first move, so the time before it is free. The
+    increment is added after every move made in time, and with `moves_to_go` each side
+    gets the initial time again after every `moves_to_go` of its moves.
+    """
+
+    def __init__(self, time_control: TimeControl):
+        self.time_control = time_control
+        self.remaining = {chess.WHITE: time_control.initial_seconds, chess.BLACK: time_control.initial_seconds}
+        self.moves_made = {chess.WHITE: 0, chess.BLACK: 0}
+        self._turn_started: float | None = None
+
+    def remaining_for(self, color: chess.Color, turn: chess.Color) -> float:
+        """Time left of `color` with `turn` to move, counting the move currently being thought about."""
+        remaining = self.remaining[color]
+        if color == turn and self._turn_started is not None:
+            remaining -= time.monotonic() - self._turn_started
+        return max(remaining, 0.0)
+
+    def press(self, color: chess.Color) -> None:
+        """Stop `color`'s clock after its move and start the opponent's."""
+        now = time.monotonic()
+        if self._turn_started is not None:
+            self.remaining[color] -= now - self._turn_started
+        self.moves_made[color] += 1
+        if self.remaining[color] > 0:
+            self.remaining[color] += self.time_control.increment_seconds
+            moves_to_go = self.time_control.moves_to_go
+            if moves_to_go and self.moves_made[color] % moves_to_go == 0:
+                self.remaining[color] += self.time_control.initial_seconds
+        self._turn_started = now
+
+    def record(self) -> tuple[float, float]:
+        """White's and Black's remaining time as of the last move, for storage."""
+        return self.remaining[chess.WHITE], self.remaining[chess.BLACK]
+
+    def restore(self, remaining: tuple[float, float], plies: int, played_at: float | None) -> None:
+        """Set the clocks to a stored `record` taken after `plies` plies.
+
+        `played_at` is the wall time of the last ply.
+        """
+        self.remaining = {chess.WHITE: remaining[0], chess.BLACK: remaining[1]}
+        self.moves_made = {chess.WHITE: (plies + 1) // 2, chess.BLACK: plies // 2}
+        if played_at is not None:
+            # the monotonic clocks of different processes don't compare, the wall clock does
+            self._turn_started = time.monotonic() - max(time.time() - played_at, 0.0)
+
+    def flagged(self, turn: chess.Color) -> chess.Color | None:
+        """The side that has run out of time, if any."""
+        for color in (turn, not turn):
+            if self.remaining_for(color, turn) <= 0:
+                return color
+        return None
+
+    def moves_to_go(self, color: chess.Color) -> int | None:
+        """Moves left of `color` until the next time control, None in sudden death."""
+        moves_to_go = self.time_control.moves_to_go
+        if not moves_to_go:
+            return None
+        return moves_to_go - self.moves_made[color] % moves_to_go
+
+    def state(self, turn: chess.Color) -> ClockState:
+        """The clocks as of the last move, so that the state only changes with a move or a flag fall."""
+        flagged = self.flagged(turn)
+        return ClockState(
+            white_seconds=0.0 if flagged == chess.WHITE else round(max(self.remaining[chess.WHITE], 0.0), 3),
+            black_seconds=0.0 if flagged == chess.BLACK else round(max(self.remaining[chess.BLACK], 0.0), 3),
+            increment_seconds=self.time_control.increment_seconds,
+            running=chess.COLOR_NAMES[turn] if self._turn_started is not None and flagged is None else None,
+        )
+
+
+def mobility_complexity(board: chess.Board) -> float:
+    """Cheap 0-1 complexity estimate from the number of legal moves, for when no engine lines are at hand."""
+    return min(board.legal_moves.count() / 40, 1.0)
+
+
+class TimeManager:
+    """Splits the remaining clock time into a budget for the next move.
+
+    The base budget is an even share of the remaining time over the moves still to play
+    (the moves to the next time control, or an estimate in sudden death) plus most of the
+    increment. It is halved in simple positions and grows up to 1.5 times in complex ones,
+    and is clamped between `min_budget` and `max_clock_fraction` of the remaining time,
+    less `safety_margin` (or half, when the budget is that short).
+    """
+
+    def __init__(
+        self,
+        min_budget: float = DEFAULT_MIN_BUDGET,
+        max_clock_fraction: float = DEFAULT_MAX_CLOCK_FRACTION,
+        safety_margin: float = DEFAULT_SAFETY_MARGIN,
+    ):
+        self.min_budget = min_budget
+        self.max_clock_fraction = max_clock_fraction
+        self.safety_margin = safety_margin
+
+    @classmethod
+    def from_env(cls) -> "TimeManager":
+        return cls(
+            min_budget=float(os.getenv("TIME_MIN_MOVE_BUDGET_SECONDS", DEFAULT_MIN_BUDGET)),
+            max_clock_fraction=float(os.getenv("TIME_MAX_CLOCK_FRACTION", DEFAULT_MAX_CLOCK_FRACTION)),
+            safety_margin=float(os.getenv("TIME_SAFETY_MARGIN_SECONDS", DEFAULT_SAFETY_MARGIN)),
+        )
+
+    def allocate(self, clock: GameClock, board: chess.Board, complexity: float | None = None) -> float:
+        color = board.turn
+        remaining = clock.remaining_for(color, board.turn)
+        moves_to_go = clock.moves_to_go(color)
+        if moves_to_go is None:
+            moves_to_go = max(DEFAULT_MOVES_TO_GO - board.fullmove_number // 2, MIN_MOVES_TO_GO)
+        if complexity is None:
+            complexity = mobility_complexity(board)
+
+        budget = (remaining / moves_to_go + clock.time_control.increment_seconds * INCREMENT_SHARE) * (0.5 + complexity)
+        budget = min(max(budget, self.min_budget), remaining * self.max_clock_fraction)
+        return max(budget - self.safety_margin, budget / 2)
@@ -0,0 +1,411 @@
+"""Sampled, non-blocking tracing of agent turns to Langfuse.
+
+Tracing is off until an entry point calls `configure_tracing()`, which reads TRACING_MODE
+(`langfuse` or `off`; by default tracing is on when LANGFUSE_PUBLIC_KEY is set). While it is
+off, an observed call costs a few extra function calls and `tracer.update_span` returns
+immediately.
+
+When it is on:
+
+- Head sampling: the outermost observed call (one agent turn) is traced with probability
+  TRACING_SAMPLE_RATE, and every span below it follows that decision.
+- Spans are recorded in memory and handed to a bounded queue when they end. A background
+  thread, started with the first span, sends them to the Langfuse ingestion API in batches
+  on a client created with the first batch, so that importing this module stays cheap.
+  When the queue is full, spans are dropped according to TRACING_DROP_POLICY (`newest` or
+  `oldest`) instead of slowing the game down, and counted in
+  `chess_tracing_spans_total{status="dropped"}`.
+- Metadata values are capped at TRACING_MAX_PAYLOAD_CHARS characters and lists at their
+  last TRACING_MAX_LIST_ITEMS items, and `MemorySnapshot` lets callers send only the
+  entries appended to a memory since the previous traced snapshot.
+"""
+import dataclasses
+import functools
+import inspect
+import logging
+import os
+import queue
+import random
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+
+from pydantic import BaseModel
+
+from app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_MAX_PAYLOAD_CHARS = 4_000
+DEFAULT_MAX_LIST_ITEMS = 20
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_LANGFUSE_HOST = "https://cloud.langfuse.com"
+EXPORT_TIMEOUT = 10
+
+TRACING_SPANS = REGISTRY.counter(
+    "chess_tracing_spans_total", "Finished spans by what happened to them (queued, dropped, exported, failed)",
+    ("status",),
+)
+
+
+class TracingMode(str, Enum):
+    OFF = "off"
+    LANGFUSE = "langfuse"
+
+
+class DropPolicy(str, Enum):
+    NEWEST = "newest"
+    OLDEST = "oldest"
+
+
+def _new_id(bits: int) -> str:
+    # not uuid4: os.urandom can cost milliseconds per call, and ids don't need to be unguessable
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    trace_id: str
+    parent_id: str | None
+    id: str = field(default_factory=lambda: _new_id(64))
+    start_time: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    end_time: datetime | None = None
+    metadata: dict = field(default_factory=dict)
+    error: str | None = None
+
+
+# the span of the running call; NOT_SAMPLED marks a turn that head sampling skipped
+NOT_SAMPLED = SpanRecord(name="not-sampled", trace_id="", parent_id=None)
+_current_span: ContextVar[SpanRecord | None] = ContextVar("current_span", default=None)
+
+
+def cap_payload(value, max_chars: int = DEFAULT_MAX_PAYLOAD_CHARS, max_items: int = DEFAULT_MAX_LIST_ITEMS):
+    """A JSON-friendly copy of `value` with long strings truncated and long lists cut to their tail."""
+    if isinstance(value, BaseModel):
+        value = value.model_dump(mode="json")
+    elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+        value = dataclasses.asdict(value)
+    elif isinstance(value, Enum):
+        value = value.value
+
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return value[:max_chars] + f"... [{len(value) - max_chars} more chars]"
+    if isinstance(value, dict):
+        return {str(key): cap_payload(item, max_chars, max_items) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [cap_payload(item, max_chars, max_items) for item in value[-max_items:]]
+        if len(value) > max_items:
+            items.insert(0, f"... [{len(value) - max_items} earlier items]")
+        return items
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return cap_payload(str(value), max_chars, max_items)
+
+
+class MemorySnapshot:
+    """Remembers how much of each append-only memory was already traced.
+
+    `delta` returns only the entries added since the previous call, plus the memory's size,
+    so that spans stay small however long the game gets. A memory that shrank (e.g. was
+    cleared after a move) is sent again from the start.
+    """
+
+    def __init__(self):
+        self._sent: dict[str, int] = {}
+
+    def delta(self, **memories: list) -> dict:
+        snapshot = {}
+        for name, items in memories.items():
+            sent = self._sent.get(name, 0)
+            if len(items) < sent:
+                sent = 0
+            self._sent[name] = len(items)
+            snapshot[f"{name}_new"] = items[sent:]
+            snapshot[f"{name}_size"] = len(items)
+        return snapshot
+
+
+class Tracer:
+    enabled = False
+
+    def observe(self, name: str | None = None):
+        def decorator(function):
+            return function
+        return decorator
+
+    def is_recording(self) -> bool:
+        return False
+
+    def update_span(self, **metadata) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+    def _start_span(self, name: str) -> SpanRecord | None:
+        return None
+
+    def _end_span(self, span: SpanRecord) -> None:
+        pass
+
+    def _wrap(self, function, span_name: str):
+        """`function`, recorded as a span named `span_name` whenever `_start_span` returns one."""
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                span = self._start_span(span_name)
+                if span is None:
+                    return await function(*args, **kwargs)
+                token = _current_span.set(span)
+                try:
+                    return await function(*args, **kwargs)
+                except BaseException as e:
+                    span.error = repr(e)
+                    raise
+                finally:
+                    _current_span.reset(token)
+                    self._end_span(span)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            span = self._start_span(span_name)
+            if span is None:
+                return function(*args, **kwargs)
+            token = _current_span.set(span)
+            try:
+                return function(*args, **kwargs)
+            except BaseException as e:
+                span.error = repr(e)
+                raise
+            finally:
+                _current_span.reset(token)
+                self._end_span(span)
+        return wrapper
+
+
+class LangfuseTracer(Tracer):
+    enabled = True
+
+    def __init__(
+        self,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        drop_policy: DropPolicy = DropPolicy.NEWEST,
+        max_payload_chars: int = DEFAULT_MAX_PAYLOAD_CHARS,
+        max_list_items: int = DEFAULT_MAX_LIST_ITEMS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.sample_rate = sample_rate
+        self.drop_policy = drop_policy
+        self.max_payload_chars = max_payload_chars
+        self.max_list_items = max_list_items
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue[SpanRecord] = queue.Queue(maxsize=queue_size)
+        self._client = None
+        self._stopped = threading.Event()
+        self._exporter: threading.Thread | None = None
+        self._exporter_lock = threading.Lock()
+
+    def observe(self, name: str | None = None):
+        def decorator(function):
+            return self._wrap(function, name or function.__name__)
+        return decorator
+
+    def _start_span(self, name: str) -> SpanRecord | None:
+        """A new span under the current one, or None when this turn is not traced."""
+        parent = _current_span.get()
+        if parent is NOT_SAMPLED:
+            return None
+        if parent is None:
+            if random.random() >= self.sample_rate:
+                # not recorded, but marks the children of this call as not sampled either
+                return NOT_SAMPLED
+            return SpanRecord(name=name, trace_id=_new_id(128), parent_id=None)
+        return SpanRecord(name=name, trace_id=parent.trace_id, parent_id=parent.id)
+
+    def _end_span(self, span: SpanRecord) -> None:
+        if span is NOT_SAMPLED:
+            return
+        span.end_time = datetime.now(timezone.utc)
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            if self.drop_policy == DropPolicy.OLDEST:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.put_nowait(span)
+                except (queue.Empty, queue.Full):
+                    pass
+            TRACING_SPANS.inc(status="dropped")
+            return
+        TRACING_SPANS.inc(status="queued")
+        if self._exporter is None:
+            self._start_exporter()
+
+    def _start_exporter(self) -> None:
+        with self._exporter_lock:
+            if self._exporter is None and not self._stopped.is_set():
+                self._exporter = threading.Thread(target=self._export_loop, name="tracing-exporter", daemon=True)
+                self._exporter.start()
+
+    def is_recording(self) -> bool:
+        span = _current_span.get()
+        return span is not None and span is not NOT_SAMPLED
+
+    def update_span(self, **metadata) -> None:
+        span = _current_span.get()
+        if span is None or span is NOT_SAMPLED:
+            return
+        span.metadata.update(cap_payload(metadata, self.max_payload_chars, self.max_list_items))
+
+    def _export_loop(self) -> None:
+        while not self._stopped.is_set() or not self._queue.empty():
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._export(batch)
+
+    def _export(self, spans: list[SpanRecord]) -> None:
+        # imported here so that running with tracing off never loads the Langfuse SDK
+        from langfuse import Langfuse
+        from langfuse.api import (
+            CreateSpanBody,
+            IngestionEvent_SpanCreate,
+            IngestionEvent_TraceCreate,
+            TraceBody,
+        )
+
+        events = []
+        for span in spans:
+            timestamp = span.end_time.isoformat()
+            if span.parent_id is None:
+                events.append(IngestionEvent_TraceCreate(
+                    id=_new_id(128),
+                    timestamp=timestamp,
+                    body=TraceBody(id=span.trace_id, name=span.name, timestamp=span.start_time),
+                ))
+            events.append(IngestionEvent_SpanCreate(
+                id=_new_id(128),
+                timestamp=timestamp,
+                body=CreateSpanBody(
+                    id=span.id,
+                    traceId=span.trace_id,
+                    parentObservationId=span.parent_id,
+                    name=span.name,
+                    startTime=span.start_time,
+                    endTime=span.end_time,
+                    metadata=span.metadata,
+                    level="ERROR" if span.error else None,
+                    statusMessage=span.error,
+                ),
+            ))
+
+        try:
+            if self._client is None:
+                # spans are batched here, so the client's own OpenTelemetry export is turned off
+                # and only its public REST API is used
+                self._client = Langfuse(
+                    host=os.getenv("LANGFUSE_HOST", DEFAULT_LANGFUSE_HOST),
+                    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
+                    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
+                    timeout=EXPORT_TIMEOUT,
+                    tracing_enabled=False,
+                )
+            self._client.api.ingestion.batch(batch=events)
+        except Exception as e:
+            TRACING_SPANS.inc(len(spans), status="failed")
+            logger.warning("Could not export %d spans to Langfuse: %s", len(spans), e)
+            return
+        TRACING_SPANS.inc(len(spans), status="exported")
+
+    def shutdown(self) -> None:
+        """Export what is still queued and stop the background thread."""
+        with self._exporter_lock:
+            self._stopped.set()
+        if self._exporter is not None:
+            self._exporter.join(timeout=self.flush_interval + 5)
+        if self._client is not None:
+            self._client.shutdown()
+
+
+class DeferredTracer(Tracer):
+    """Forwards to the tracer that `configure_tracing` installed, and is off until then.
+
+    Modules decorate their functions with the module-level `tracer` when they are imported,
+    before the entry point has loaded its configuration, so whether a call is traced is only
+    decided when it runs.
+    """
+
+    def __init__(self):
+        self.target: Tracer = Tracer()
+
+    @property
+    def enabled(self) -> bool:
+        return self.target.enabled
+
+    def observe(self, name: str | None = None):
+        def decorator(function):
+            return self._wrap(function, name or function.__name__)
+        return decorator
+
+    def is_recording(self) -> bool:
+        return self.target.is_recording()
+
+    def update_span(self, **metadata) -> None:
+        self.target.update_span(**metadata)
+
+    def shutdown(self) -> None:
+        self.target.shutdown()
+
+    def _start_span(self, name: str) -> SpanRecord | None:
+        return self.target._start_span(name)
+
+    def _end_span(self, span: SpanRecord) -> None:
+        self.target._end_span(span)
+
+
+def create_tracer_from_env() -> Tracer:
+    default_mode = TracingMode.LANGFUSE if os.getenv("LANGFUSE_PUBLIC_KEY") else TracingMode.OFF
+    mode = TracingMode(os.getenv("TRACING_MODE", default_mode.value))
+    if mode == TracingMode.OFF:
+        return Tracer()
+    return LangfuseTracer(
+        sample_rate=float(os.getenv("TRACING_SAMPLE_RATE", DEFAULT_SAMPLE_RATE)),
+        queue_size=int(os.getenv("TRACING_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+        drop_policy=DropPolicy(os.getenv("TRACING_DROP_POLICY", DropPolicy.NEWEST.value)),
+        max_payload_chars=int(os.getenv("TRACING_MAX_PAYLOAD_CHARS", DEFAULT_MAX_PAYLOAD_CHARS)),
+        max_list_items=int(os.getenv("TRACING_MAX_LIST_ITEMS", DEFAULT_MAX_LIST_ITEMS)),
+        batch_size=int(os.getenv("TRACING_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+        flush_interval=float(os.getenv("TRACING_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)),
+    )
+
+
+tracer = DeferredTracer()
+
+
+def configure_tracing(target: Tracer | None = None) -> Tracer:
+    """Install `target`, or the tracer the environment asks for, behind the module-level `tracer`.
+
+    Entry points call this once they have loaded their environment; the tracer it replaces
+    is shut down.
+    """
+    previous = tracer.target
+    tracer.target = target if target is not None else create_tracer_from_env()
+    previous.shutdown()
+    return tracer.target
@@ -0,0 +1,95 @@
+"""Compare move latency, LLM calls and legality of the agent strategies.
+
+The sequential orchestration loop, fan-out exploration and the single-call selection are
+run against the synthetic backend with a fixed round-trip time, so the numbers reflect how
+many serial round trips each strategy needs rather than model quality. With
+--illegal-move-rate the backend answers that share of moves with an illegal one, and the
+legal column shows the share of turns that still ended in a legal move. --move-schema
+requests moves with schemas restricted to the legal ones (top K of them with --top-k), as
+MOVE_SCHEMA=legal does, which the synthetic backend honours like structured outputs would.
+
+Usage: python -m benchmarks.bench_agent_strategies [--rtt 0.5] [--moves 10] [--candidates 3] [--illegal-move-rate 0.2]
+       [--move-schema] [--top-k 8]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import chess
+from dotenv import load_dotenv
+
+from app.agent import AgentMoveError, ChessAgent
+from app.chess_helper import convert_board_to_pgn
+from app.llm import LLMManager
+from app.llm_backend import LatencyDistribution, SyntheticBackend
+from app.move_schema import MoveSchemaFactory
+from app.resource import AgentStrategy
+
+async def benchmark_strategy(
+    strategy: AgentStrategy,
+    rtt: float,
+    moves: int,
+    candidates: int,
+    illegal_move_rate: float,
+    move_schema: MoveSchemaFactory | None = None,
+) -> tuple[float, float, float]:
+    llm_manager = LLMManager(backend=SyntheticBackend(
+        latency=LatencyDistribution(str(rtt)), illegal_move_rate=illegal_move_rate, seed=0
+    ))
+    agent = ChessAgent(llm_manager=llm_manager, strategy=strategy, move_schema=move_schema)
+    agent.max_moves_to_consider = candidates
+
+    rng = random.Random(42)
+    board = chess.Board()
+    elapsed = 0.0
+    legal_moves = 0
+    for _ in range(moves):
+        # white plays a random move, the agent answers as black
+        board.push(rng.choice(list(board.legal_moves)))
+        if board.is_game_over():
+            board = chess.Board()
+            continue
+
+        start = time.perf_counter()
+        try:
+            move, _ = await agent.make_valid_move(board=board, position=convert_board_to_pgn(board))
+            legal_moves += 1
+        except (chess.IllegalMoveError, AgentMoveError):
+            # the turn failed, keep the game going with a random move
+            agent.analysis_memory = []
+            move = rng.choice(list(board.legal_moves))
+        elapsed += time.perf_counter() - start
+        board.push(move)
+        if board.is_game_over():
+            board = chess.Board()
+
+    return elapsed / moves, agent.usage.calls / moves, legal_moves / moves
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt", type=float, default=0.5, help="simulated LLM round-trip time in seconds")
+    parser.add_argument("--moves", type=int, default=10, help="agent moves to play per strategy")
+    parser.add_argument("--candidates", type=int, default=3, help="max_moves_to_consider for every strategy")
+    parser.add_argument("--illegal-move-rate", type=float, default=0.0, help="share of illegal synthetic moves")
+    parser.add_argument("--move-schema", action="store_true", help="restrict moves to the legal ones in the schema")
+    parser.add_argument("--top-k", type=int, default=0, help="with --move-schema, only admit the K most forcing moves")
+    args = parser.parse_args()
+    load_dotenv("secrets.env")
+
+    print(f"{'strategy':<12} {'s/move':>8} {'calls/move':>11} {'legal':>7}")
+    for strategy in AgentStrategy:
+        seconds_per_move, calls_per_move, legal_rate = await benchmark_strategy(
+            strategy,
+            args.rtt,
+            args.moves,
+            args.candidates,
+            args.illegal_move_rate,
+            MoveSchemaFactory(top_k=args.top_k or None) if args.move_schema else None,
+        )
+        print(f"{strategy.value:<12} {seconds_per_move:>8.2f} {calls_per_move:>11.1f} {legal_rate:>6.0%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
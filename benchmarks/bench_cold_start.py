@@ -0,0 +1,88 @@
+"""Measure how long a fresh worker takes to import the app and to serve its first board.
+
+Each run starts the server in a new process, as an autoscaled worker would, creates a game
+as soon as the server accepts connections and reports the time from spawning the process
+to the first successful `/games/{id}/board` response. The import time of `app.main` is
+measured separately in fresh interpreters. The server runs with the synthetic LLM backend
+unless --backend says otherwise, and --no-warm-up sets STARTUP_WARM_UP=0 to compare with
+a server that skips the lifespan warm-up.
+
+Usage: python -m benchmarks.bench_cold_start [--runs 5] [--backend synthetic] [--no-warm-up]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+POLL_INTERVAL = 0.01
+STARTUP_TIMEOUT = 60.0
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def import_seconds(env: dict[str, str]) -> float:
+    output = subprocess.check_output(
+        [sys.executable, "-c", "import time; start = time.perf_counter(); import app.main; "
+         "print(time.perf_counter() - start)"],
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    return float(output.decode().split()[-1])
+
+
+def first_board_seconds(env: dict[str, str]) -> float:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=STARTUP_TIMEOUT) as client:
+            while time.perf_counter() - start < STARTUP_TIMEOUT:
+                if server.poll() is not None:
+                    raise RuntimeError(f"The server exited with status {server.returncode}")
+                try:
+                    game_id = client.post("/games").raise_for_status().json()["game_id"]
+                    client.get(f"/games/{game_id}/board").raise_for_status()
+                    return time.perf_counter() - start
+                except httpx.TransportError:
+                    time.sleep(POLL_INTERVAL)
+        raise TimeoutError(f"No board within {STARTUP_TIMEOUT:.0f}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def report(name: str, seconds: list[float]) -> None:
+    print(f"{name:<14} {statistics.mean(seconds):>8.3f} {min(seconds):>8.3f} {max(seconds):>8.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to time per measurement")
+    parser.add_argument("--backend", default="synthetic", help="LLM_BACKEND of the server")
+    parser.add_argument("--no-warm-up", action="store_true", help="skip the lifespan warm-up")
+    args = parser.parse_args()
+
+    env = dict(os.environ, LLM_BACKEND=args.backend, STARTUP_WARM_UP="0" if args.no_warm_up else "1")
+    print(f"{args.runs} runs, {args.backend} backend, warm-up {'off' if args.no_warm_up else 'on'}")
+    print(f"{'measurement':<14} {'mean s':>8} {'min s':>8} {'max s':>8}")
+    report("import", [import_seconds(env) for _ in range(args.runs)])
+    report("first board", [first_board_seconds(env) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
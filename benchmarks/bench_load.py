@@ -0,0 +1,99 @@
+"""Load-test the full /games/{id}/move/llm-agent path with many concurrent games.
+
+Every game plays random White moves through /move/player and asks the agent for Black's
+answer through /move/llm-agent, so the numbers cover routing, sessions, prompt building,
+validation and the LLMManager semaphore. The LLM itself is the synthetic backend, so no
+network access or API key is needed and latency comes from LLM_SYNTHETIC_LATENCY.
+
+By default the app runs in-process behind httpx's ASGI transport. With --url the same
+load is sent to a running server instead, which should be started with LLM_BACKEND=synthetic.
+
+Usage: python -m benchmarks.bench_load [--games 1000] [--moves 5] [--latency lognormal:0.8:0.5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import time
+
+import httpx
+
+
+async def play_game(client: httpx.AsyncClient, moves: int, rng: random.Random, latencies: list[float]) -> int:
+    response = await client.post("/games", json={})
+    response.raise_for_status()
+    game = response.json()
+    game_id, state = game["game_id"], game["state"]
+    agent_moves = 0
+
+    for _ in range(moves):
+        # the player endpoint takes from/to squares only, so promotions are left out
+        white_moves = [move for move in state["legal_moves"] if len(move) == 4]
+        if state["is_game_over"] or not white_moves:
+            break
+        move = rng.choice(white_moves)
+        response = await client.post(f"/games/{game_id}/move/player", json={"from": move[:2], "to": move[2:]})
+        response.raise_for_status()
+        if response.json()["is_game_over"]:
+            break
+
+        start = time.perf_counter()
+        response = await client.post(f"/games/{game_id}/move/llm-agent")
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        state = response.json()
+        agent_moves += 1
+
+    await client.delete(f"/games/{game_id}")
+    return agent_moves
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000, help="games played concurrently")
+    parser.add_argument("--moves", type=int, default=5, help="agent moves per game")
+    parser.add_argument("--latency", default="lognormal:0.8:0.5", help="synthetic LLM latency distribution")
+    parser.add_argument("--max-concurrent-requests", type=int, default=None,
+                        help="LLM_MAX_CONCURRENT_REQUESTS of the in-process app")
+    parser.add_argument("--url", help="load-test a running server instead of an in-process app")
+    args = parser.parse_args()
+
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        os.environ["LLM_BACKEND"] = "synthetic"
+        os.environ["LLM_SYNTHETIC_LATENCY"] = args.latency
+        if args.max_concurrent_requests is not None:
+            os.environ["LLM_MAX_CONCURRENT_REQUESTS"] = str(args.max_concurrent_requests)
+        # imported late so that the registry picks up the synthetic backend
+        from app.main import app
+        logging.getLogger().setLevel(logging.WARNING)
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+
+    limits = httpx.Limits(max_connections=args.games, max_keepalive_connections=args.games)
+    latencies: list[float] = []
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=None) as client:
+        start = time.perf_counter()
+        agent_moves = await asyncio.gather(
+            *(play_game(client, args.moves, random.Random(game), latencies) for game in range(args.games))
+        )
+        elapsed = time.perf_counter() - start
+
+    total_moves = sum(agent_moves)
+    print(f"{args.games} concurrent games, {total_moves} agent moves in {elapsed:.1f}s "
+          f"({total_moves / elapsed:.1f} moves/s)")
+    if latencies:
+        print(f"agent move latency: mean {statistics.mean(latencies):.2f}s, p50 {percentile(latencies, 0.5):.2f}s, "
+              f"p95 {percentile(latencies, 0.95):.2f}s, p99 {percentile(latencies, 0.99):.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""Compare chess_helper.convert_board_to_pgn with the incremental PositionEncoder.
+
+Each measurement replays a game of the given length and builds the position prompt on
+every ply, as the agent does on its turns: the old function rebuilds the whole PGN each
+time while the encoder only records the latest move. Prompt sizes at the final ply are
+reported in characters and in estimated tokens (about 4 characters each).
+
+Usage: python -m benchmarks.bench_position_encoding [--repeat 20]
+"""
+import argparse
+import logging
+import random
+import time
+
+import chess
+
+from app.chess_helper import convert_board_to_pgn
+from app.position_encoder import PositionEncoder, PositionFormat
+
+PLIES = (20, 80, 200)
+
+
+def random_game(plies: int, seed: int = 0) -> list[chess.Move]:
+    rng = random.Random(seed)
+    while True:
+        board = chess.Board()
+        moves = []
+        while len(moves) < plies and not board.is_game_over():
+            move = rng.choice(list(board.legal_moves))
+            moves.append(move)
+            board.push(move)
+        if len(moves) == plies:
+            return moves
+
+
+def replay_with_pgn(moves: list[chess.Move]) -> str:
+    board = chess.Board()
+    prompt = ""
+    for move in moves:
+        board.push(move)
+        prompt = convert_board_to_pgn(board)
+    return prompt
+
+
+def replay_with_encoder(moves: list[chess.Move], position_format: PositionFormat) -> str:
+    board = chess.Board()
+    encoder = PositionEncoder(position_format=position_format)
+    prompt = ""
+    for move in moves:
+        encoder.push(board, move)
+        board.push(move)
+        prompt = encoder.encode(board)
+    return prompt
+
+
+def measure(replay, repeat: int) -> tuple[float, str]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        prompt = replay()
+    return (time.perf_counter() - start) / repeat, prompt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="times each game is replayed")
+    args = parser.parse_args()
+
+    # the old function logs at DEBUG, keep logging out of both measurements
+    logging.getLogger("app.chess_helper").setLevel(logging.INFO)
+
+    print(f"{'plies':>5} {'encoding':<20} {'us/ply':>8} {'chars':>6} {'~tokens':>8}")
+    for plies in PLIES:
+        moves = random_game(plies)
+        rows = [("convert_board_to_pgn", measure(lambda: replay_with_pgn(moves), args.repeat))]
+        for position_format in PositionFormat:
+            rows.append((
+                position_format.value,
+                measure(lambda: replay_with_encoder(moves, position_format), args.repeat),
+            ))
+
+        for name, (seconds, prompt) in rows:
+            print(f"{plies:>5} {name:<20} {seconds / plies * 1e6:>8.1f} {len(prompt):>6} {len(prompt) // 4:>8}")
+
+
+if __name__ == "__main__":
+    main()
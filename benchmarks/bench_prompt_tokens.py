@@ -0,0 +1,241 @@
+"""Compare per-move input tokens of the original prompt templates with the PromptBuilder layout.
+
+A typical sequential move is six calls: decide_on_action, consider_new_move,
+decide_on_action, consider_new_move, decide_on_action, decide_on_move. For each call the
+benchmark counts the estimated input tokens and the part of them that repeats a prefix
+already sent earlier in the same move, which is what provider-side prompt caching can
+reuse (OpenAI only caches prefixes of 1024 tokens or more, so short prompts see no benefit).
+
+With --live the same prompts are sent to the API and the measured latency and the
+reported input/cached token counts are printed instead of estimates. This needs
+OPENAI_API_KEY and costs money.
+
+Usage: python -m benchmarks.bench_prompt_tokens [--budget 3000] [--live]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import chess
+from dotenv import load_dotenv
+
+from app.llm import LLMManager, LLMUsage
+from app.llm_resource import AnalysisLLMChessMove, BaseLLMChessMove, Decision
+from app.position_encoder import PositionEncoder
+from app.prompt_builder import PromptBuilder, estimate_tokens
+from app.prompts import (
+    CONSIDER_NEW_MOVE_USER_PROMPT,
+    DECIDE_ON_MOVE_USER_PROMPT,
+    ORCHESTRATION_USER_PROMPT,
+)
+
+# the templates as they were before the PromptBuilder, kept here as the baseline
+LEGACY_SYSTEM_PROMPT = (
+    "You are a grandmaster chess player playing a chess game.\n"
+    "You are playing for you and your family's lives so it's important to play the best moves possible "
+    "with the most robust reasoning."
+)
+
+LEGACY_BASE_MOVE_PROMPT = """Given the position, choose the best, valid next move in standard algebraic notation.
+
+<position>
+{position}
+</position>
+
+These are the recent moves you have already played and why you played them:
+<previous_moves>
+{previous_moves}
+</previous_moves>
+"""
+
+LEGACY_ORCHESTRATION_USER_PROMPT = """You are deciding which move to play.
+<current_position>
+{position}
+</current_position>
+
+These are the recent moves you have already played and why you played them:
+<previous_moves>
+{previous_moves}
+</previous_moves>
+
+These are your thoughts on the existing position and which move to play:
+<considered_moves>
+{considered_moves}
+</considered_moves>
+
+Decide whether you want to want to consider a new move or if you're ready to decide on a move.
+
+Consider a new move if you haven't already considered at least two moves."""
+
+LEGACY_CONSIDER_NEW_MOVE_USER_PROMPT = """{base_move_prompt}
+
+Here are other moves you already considered. DO NOT CHOOSE FROM THESE MOVES:
+<considered_moves>
+{considered_moves}
+</considered_moves>
+
+Move: """
+
+LEGACY_DECIDE_ON_MOVE_USER_PROMPT = """{base_move_prompt}
+
+Here is your reasoning for why you were ready to decide on a move:
+<decision_reasoning>
+{decision_reasoning}
+</decision_reasoning>
+
+Here are all of the moves to consider. ONLY CHOOSE FROM THESE MOVES:
+<considered_moves>
+{considered_moves}
+</considered_moves>
+
+Move: """
+
+REASONING = (
+    "The move develops a piece toward the centre and keeps the king safe. "
+    "White's most forcing reply is a pawn break on the queenside, which I can meet by recapturing. "
+    "After the exchanges the position stays balanced with slightly better piece activity for black."
+)
+DECISION_REASONING = "I have considered two candidate moves and compared their counter moves."
+CALL_SEQUENCE = ("decide_on_action", "consider_new_move", "decide_on_action",
+                 "consider_new_move", "decide_on_action", "decide_on_move")
+RESPONSE_FORMATS = {
+    "decide_on_action": Decision,
+    "consider_new_move": AnalysisLLMChessMove,
+    "decide_on_move": BaseLLMChessMove,
+}
+
+
+def position_after(plies: int) -> tuple[chess.Board, str]:
+    rng = random.Random(plies)
+    while True:
+        board = chess.Board()
+        encoder = PositionEncoder()
+        for _ in range(plies):
+            if board.is_game_over():
+                break
+            move = rng.choice(list(board.legal_moves))
+            encoder.push(board, move)
+            board.push(move)
+        if len(board.move_stack) == plies and board.turn == chess.BLACK:
+            return board, encoder.encode(board)
+        plies += 1
+
+
+def analyses_for(board: chess.Board, count: int) -> list[AnalysisLLMChessMove]:
+    moves = [board.san(move) for move in list(board.legal_moves)[:count]]
+    return [AnalysisLLMChessMove(move=move, reasoning=REASONING, counter_moves=[]) for move in moves]
+
+
+def legacy_prompts(position: str, game_memory: list[str], board: chess.Board) -> list[tuple[str, str, str]]:
+    previous_moves = "\n".join(game_memory[-3:])
+    base_move_prompt = LEGACY_BASE_MOVE_PROMPT.format(position=position, previous_moves=previous_moves)
+    prompts = []
+    for index, stage in enumerate(CALL_SEQUENCE):
+        analyses = analyses_for(board, index // 2)
+        considered = "\n".join(f"{a.move}: {a.reasoning}" for a in analyses) or "No moves have been considered yet."
+        if stage == "decide_on_action":
+            user_prompt = LEGACY_ORCHESTRATION_USER_PROMPT.format(
+                position=position, previous_moves=previous_moves, considered_moves=considered
+            )
+        elif stage == "consider_new_move":
+            user_prompt = LEGACY_CONSIDER_NEW_MOVE_USER_PROMPT.format(
+                base_move_prompt=base_move_prompt, considered_moves=considered
+            )
+        else:
+            user_prompt = LEGACY_DECIDE_ON_MOVE_USER_PROMPT.format(
+                base_move_prompt=base_move_prompt, considered_moves=considered, decision_reasoning=DECISION_REASONING
+            )
+        prompts.append((stage, LEGACY_SYSTEM_PROMPT, user_prompt))
+    return prompts
+
+
+def builder_prompts(
+    builder: PromptBuilder, position: str, game_memory: list[str], board: chess.Board
+) -> list[tuple[str, str, str]]:
+    stage_prompts = {
+        "decide_on_action": ORCHESTRATION_USER_PROMPT,
+        "consider_new_move": CONSIDER_NEW_MOVE_USER_PROMPT,
+        "decide_on_move": DECIDE_ON_MOVE_USER_PROMPT,
+    }
+    prompts = []
+    for index, stage in enumerate(CALL_SEQUENCE):
+        prompt = builder.build(
+            stage_prompts[stage],
+            position=position,
+            game_memory=game_memory,
+            analysis_memory=analyses_for(board, index // 2),
+            decision_reasoning=DECISION_REASONING,
+            fen=board.fen(),
+        )
+        prompts.append((stage, prompt.system_prompt, prompt.user_prompt))
+    return prompts
+
+
+def estimate(prompts: list[tuple[str, str, str]]) -> tuple[int, int]:
+    """Total estimated input tokens and how many of them repeat an earlier prefix of the move."""
+    total = 0
+    reusable = 0
+    sent: list[str] = []
+    for _, system_prompt, user_prompt in prompts:
+        full_prompt = system_prompt + "\n" + user_prompt
+        total += estimate_tokens(full_prompt)
+        if sent:
+            prefix = max(len(os.path.commonprefix([full_prompt, earlier])) for earlier in sent)
+            reusable += prefix // 4
+        sent.append(full_prompt)
+    return total, reusable
+
+
+async def measure_live(llm_manager: LLMManager, prompts: list[tuple[str, str, str]]) -> tuple[float, LLMUsage]:
+    usage = LLMUsage()
+    start = time.perf_counter()
+    for stage, system_prompt, user_prompt in prompts:
+        await llm_manager.call_llm(
+            model="gpt-4o",
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            response_format=RESPONSE_FORMATS[stage],
+            usage=usage,
+        )
+    return time.perf_counter() - start, usage
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=3000, help="per-call input token budget of the builder")
+    parser.add_argument("--live", action="store_true", help="send the prompts to the OpenAI API")
+    args = parser.parse_args()
+    load_dotenv("secrets.env")
+
+    builder = PromptBuilder(max_input_tokens=args.budget)
+    llm_manager = LLMManager() if args.live else None
+
+    if args.live:
+        print(f"{'plies':>5} {'templates':<9} {'s/move':>7} {'input':>7} {'cached':>7} {'output':>7}")
+    else:
+        print(f"{'plies':>5} {'templates':<9} {'~input/move':>12} {'~reusable':>10} {'~uncached':>10}")
+
+    for plies in (20, 80, 200):
+        board, position = position_after(plies)
+        game_memory = [f"{board.san(move)}: {REASONING}" for move in list(board.legal_moves)[:5]]
+
+        for name, prompts in (
+            ("legacy", legacy_prompts(position, game_memory, board)),
+            ("builder", builder_prompts(builder, position, game_memory, board)),
+        ):
+            if args.live:
+                seconds, usage = await measure_live(llm_manager, prompts)
+                print(f"{plies:>5} {name:<9} {seconds:>7.2f} {usage.input_tokens:>7} "
+                      f"{usage.cached_input_tokens:>7} {usage.output_tokens:>7}")
+            else:
+                total, reusable = estimate(prompts)
+                print(f"{plies:>5} {name:<9} {total:>12} {reusable:>10} {total - reusable:>10}")
+
+    if llm_manager is not None:
+        await llm_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
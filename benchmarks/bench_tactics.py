@@ -0,0 +1,98 @@
+"""Time the local tactical analysis over a corpus of positions.
+
+The corpus is every position of a number of seeded random games, which are rich in
+hanging pieces, checks and mates, plus the positions of a file of FENs if given. Each
+position is analysed cold (attack table and summary computed) and again from the
+analyser's cache, as a repeated turn or a transposition would be. The rendered summaries
+are reported in estimated tokens, the cost they add to every prompt of a turn.
+
+Every position is timed as the best of --repeats runs, which keeps scheduler and garbage
+collector pauses out of the maximum, and the benchmark fails when the slowest cold analysis
+takes longer than --budget-ms.
+
+Usage: python -m benchmarks.bench_tactics [--games 50] [--fens positions.txt] [--repeats 3] [--budget-ms 10]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+import chess
+
+from app.prompt_builder import estimate_tokens
+from app.tactics import AttackTable, TacticalAnalyser
+
+
+def corpus(games: int, seed: int = 0) -> list[chess.Board]:
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(games):
+        board = chess.Board()
+        while not board.is_game_over() and len(board.move_stack) < 120:
+            board.push(rng.choice(list(board.legal_moves)))
+            boards.append(board.copy(stack=False))
+    return boards
+
+
+def timings(function, boards: list[chess.Board], repeats: int = 1) -> list[float]:
+    seconds = []
+    for board in boards:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function(board)
+            best = min(best, time.perf_counter() - start)
+        seconds.append(best)
+    return seconds
+
+
+def report(name: str, seconds: list[float]) -> None:
+    ordered = sorted(seconds)
+    print(
+        f"{name:<14} {statistics.mean(ordered) * 1e3:>8.3f} {ordered[len(ordered) // 2] * 1e3:>8.3f}"
+        f" {ordered[int(len(ordered) * 0.95)] * 1e3:>8.3f} {ordered[-1] * 1e3:>8.3f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=50, help="random games whose positions make up the corpus")
+    parser.add_argument("--fens", help="file with one FEN per line to add to the corpus")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per position, of which the fastest counts")
+    parser.add_argument("--budget-ms", type=float, default=10.0, help="fail when a cold analysis takes longer")
+    args = parser.parse_args()
+
+    boards = corpus(args.games)
+    if args.fens:
+        with open(args.fens) as file:
+            boards.extend(chess.Board(line.strip()) for line in file if line.strip())
+
+    # with no room in its cache, every call analyses the position afresh
+    cold = timings(TacticalAnalyser(cache_size=0).summarize, boards, args.repeats)
+    analyser = TacticalAnalyser(cache_size=len(boards))
+    summaries = [analyser.summarize(board) for board in boards]
+    cached = timings(analyser.summarize, boards, args.repeats)
+
+    print(f"{len(boards)} positions")
+    print(f"{'stage':<14} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    report("attack table", timings(AttackTable, boards, args.repeats))
+    report("analysis", cold)
+    report("cached", cached)
+
+    tokens = [estimate_tokens(summary.render()) for summary in summaries]
+    print(f"summary ~tokens: mean {statistics.mean(tokens):.1f}, max {max(tokens)}")
+    print(
+        f"positions with a mate in one {sum(bool(s.mates_in_one) for s in summaries)},"
+        f" mate in two {sum(bool(s.mates_in_two) for s in summaries)},"
+        f" pieces en prise {sum(bool(s.hanging or s.opponent_hanging) for s in summaries)},"
+        f" pins {sum(bool(s.pins) for s in summaries)}"
+    )
+
+    slowest = max(cold) * 1e3
+    if slowest > args.budget_ms:
+        sys.exit(f"slowest analysis took {slowest:.3f} ms, over the budget of {args.budget_ms:g} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Measure the per-move overhead of tracing: off, on with head sampling, and on for every move.
+
+Each configuration runs in its own subprocess, which configures tracing from its environment.
+The LLM is the synthetic backend with no latency, which leaves the agent's own work (prompt
+building, validation, tracing) as the only cost. Spans are exported to an
+unreachable Langfuse host, so the export thread keeps failing in the background as it would
+during an outage, and the move times show that the game itself never waits for it.
+
+The relative overhead is inflated on purpose: against real LLM round trips of a second or
+more, the added milliseconds per move are what matters.
+
+Usage: python -m benchmarks.bench_tracing [--moves 1000] [--warmup-moves 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+CONFIGURATIONS = (
+    ("off", {"TRACING_MODE": "off"}),
+    ("sampled 10%", {"TRACING_MODE": "langfuse", "TRACING_SAMPLE_RATE": "0.1"}),
+    ("every move", {"TRACING_MODE": "langfuse", "TRACING_SAMPLE_RATE": "1"}),
+)
+
+
+async def measure(moves: int, warmup_moves: int) -> dict:
+    import chess
+    import logging
+
+    from app.agent import ChessAgent
+    from app.llm import LLMManager
+    from app.llm_backend import SyntheticBackend
+    from app.position_encoder import PositionEncoder
+    from app.tracing import configure_tracing
+
+    logging.getLogger().setLevel(logging.ERROR)
+    tracer = configure_tracing()
+    rng = random.Random(0)
+    agent = ChessAgent(llm_manager=LLMManager(backend=SyntheticBackend(seed=0)))
+    board = chess.Board()
+    encoder = PositionEncoder()
+
+    async def play(count: int) -> float:
+        nonlocal board, encoder
+        elapsed = 0.0
+        for _ in range(count):
+            if board.is_game_over():
+                board, encoder = chess.Board(), PositionEncoder()
+            white_move = rng.choice(list(board.legal_moves))
+            encoder.push(board, white_move)
+            board.push(white_move)
+            if board.is_game_over():
+                continue
+
+            start = time.perf_counter()
+            move, _ = await agent.make_valid_move(board=board, position=encoder.encode(board))
+            elapsed += time.perf_counter() - start
+            encoder.push(board, move)
+            board.push(move)
+        return elapsed
+
+    # the first export loads the Langfuse SDK in the background; keep that one-off cost out of the numbers
+    await play(warmup_moves)
+    await asyncio.sleep(2)
+
+    elapsed = await play(moves)
+    tracer.shutdown()
+    return {"ms_per_move": elapsed * 1000 / moves}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--moves", type=int, default=1000, help="agent moves per configuration")
+    parser.add_argument("--warmup-moves", type=int, default=20, help="agent moves played before measuring")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args.moves, args.warmup_moves))))
+        return
+
+    print(f"{'tracing':<12} {'ms/move':>8} {'+ms/move':>9} {'overhead':>9}")
+    baseline = None
+    for name, env in CONFIGURATIONS:
+        child_env = {
+            **os.environ,
+            "LANGFUSE_PUBLIC_KEY": "pk-bench",
+            "LANGFUSE_SECRET_KEY": "sk-bench",
+            "LANGFUSE_HOST": "http://127.0.0.1:9",
+            "LLM_LOG_SAMPLE_RATE": "0",
+            **env,
+        }
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_tracing", "--child",
+             "--moves", str(args.moves), "--warmup-moves", str(args.warmup_moves)],
+            env=child_env, capture_output=True, text=True, check=True,
+        ).stdout
+        ms_per_move = json.loads(output.strip().splitlines()[-1])["ms_per_move"]
+        baseline = baseline if baseline is not None else ms_per_move
+        print(f"{name:<12} {ms_per_move:>8.3f} {ms_per_move - baseline:>+9.3f} {ms_per_move / baseline - 1:>+9.1%}")
+
+
+if __name__ == "__main__":
+    main()
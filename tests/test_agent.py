@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+
+import chess
+
+from app.agent import ChessAgent
+from app.llm import LLMManager
+from app.llm_backend import SyntheticBackend
+from app.llm_backend import LLMBackend
+from app.llm_resource import RESPONSE_FORMATS, AnalysisLLMChessMove
+from app.position_encoder import PositionEncoder
+from app.resource import AgentStrategy
+
+
+class RecordingBackend(SyntheticBackend):
+    """Synthetic answers, keeping the prompts and formats of every call."""
+
+    def __init__(self):
+        super().__init__(seed=0)
+        self.calls = []
+
+    async def complete(self, model, system_prompt, user_prompt, response_format, temperature=1):
+        self.calls.append((system_prompt, user_prompt, response_format))
+        return await super().complete(model, system_prompt, user_prompt, response_format, temperature)
+
+
+def schema_text(response_format) -> str:
+    return str(response_format.model_json_schema())
+
+
+class AgentSideTest(unittest.IsolatedAsyncioTestCase):
+    async def play(self, board: chess.Board, color: chess.Color, strategy: AgentStrategy) -> RecordingBackend:
+        backend = RecordingBackend()
+        agent = ChessAgent(llm_manager=LLMManager(backend=backend), strategy=strategy, color=color)
+        await agent.make_valid_move(board=board, position=PositionEncoder().encode(board))
+        await agent.llm_manager.close()
+        return backend
+
+    async def test_white_agent_is_told_it_plays_white(self):
+        for strategy in AgentStrategy:
+            backend = await self.play(chess.Board(), chess.WHITE, strategy)
+            for system_prompt, _, response_format in backend.calls:
+                self.assertIn("as white", system_prompt)
+                if "move" in response_format.model_fields:
+                    schema = schema_text(response_format)
+                    self.assertIn("White to play.", schema)
+                    self.assertNotIn("Black to play.", schema)
+                    self.assertNotIn("by white", schema)
+
+    async def test_black_agent_keeps_the_original_formats(self):
+        board = chess.Board()
+        board.push_san("e4")
+        backend = await self.play(board, chess.BLACK, AgentStrategy.SINGLE_CALL)
+        for system_prompt, user_prompt, response_format in backend.calls:
+            self.assertIn("as black", system_prompt)
+            self.assertIn(response_format, RESPONSE_FORMATS)
+            self.assertIn("counter moves by white", user_prompt)
+
+
+class StalledBackend(LLMBackend):
+    name = "stalled"
+
+    async def complete(self, model, system_prompt, user_prompt, response_format, temperature=1):
+        await asyncio.Event().wait()
+
+
+class TurnBudgetTest(unittest.IsolatedAsyncioTestCase):
+    async def test_out_of_time_the_top_ranked_candidate_is_played(self):
+        # after 1. e4 e5 2. Nf3, the queen sortie analysed first loses the queen to the knight
+        board = chess.Board("rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2")
+        agent = ChessAgent(llm_manager=LLMManager(backend=StalledBackend()))
+        agent.analysis_memory = [
+            AnalysisLLMChessMove(move=move, reasoning=f"{move} analysed", counter_moves=[]) for move in ("Qg5", "Nc6")
+        ]
+
+        position = PositionEncoder().encode(board)
+        move, reasoning = await agent.make_valid_move(board=board, position=position, budget=0.05)
+        await agent.llm_manager.close()
+
+        self.assertEqual(board.san(move), "Nc6")
+        self.assertEqual(reasoning, "Nc6 analysed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+from fastapi.testclient import TestClient
+
+from app.game_store import MemoryGameStore
+from app.llm import LLMManager
+from app.llm_backend import SyntheticBackend
+from app.main import app, get_game_registry
+from app.session import GameRegistry
+
+
+class CountingGameStore(MemoryGameStore):
+    def __init__(self):
+        super().__init__()
+        self.ply_loads = 0
+
+    def load_plies(self, game_id, since):
+        self.ply_loads += 1
+        return super().load_plies(game_id, since)
+
+
+def create_registry(store=None) -> GameRegistry:
+    return GameRegistry(llm_manager=LLMManager(backend=SyntheticBackend(seed=0)), store=store)
+
+
+class BoardEndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = create_registry()
+        app.dependency_overrides[get_game_registry] = lambda: self.registry
+        self.client = TestClient(app)
+        self.game_id = self.client.post("/games").json()["game_id"]
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+
+    def play(self, from_square: str, to_square: str) -> None:
+        response = self.client.post(f"/games/{self.game_id}/move/player", json={"from": from_square, "to": to_square})
+        self.assertEqual(response.status_code, 200)
+
+    def test_board_is_not_modified_until_a_move_is_played(self):
+        response = self.client.get(f"/games/{self.game_id}/board")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertEqual(response.json()["version"], 0)
+
+        response = self.client.get(f"/games/{self.game_id}/board", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f"/games/{self.game_id}/board", headers={"If-None-Match": f"W/{etag}"})
+        self.assertEqual(response.status_code, 304)
+
+        self.play("e2", "e4")
+        response = self.client.get(f"/games/{self.game_id}/board", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json()["version"], 1)
+
+    def test_delta_lists_the_moves_since_a_version(self):
+        self.play("e2", "e4")
+        response = self.client.get(f"/games/{self.game_id}/board/delta", params={"since": 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"version": 1, "since": 0, "moves": ["e2e4"]})
+
+        response = self.client.get(f"/games/{self.game_id}/board/delta", params={"since": 1})
+        self.assertEqual(response.status_code, 304)
+
+    def test_delta_reports_changed_flags(self):
+        for from_square, to_square in [("f2", "f3"), ("e7", "e5"), ("g2", "g4"), ("d8", "h4")]:
+            self.play(from_square, to_square)
+        delta = self.client.get(f"/games/{self.game_id}/board/delta", params={"since": 2}).json()
+        self.assertEqual(delta["moves"], ["g2g4", "d8h4"])
+        self.assertTrue(delta["is_checkmate"])
+        self.assertTrue(delta["is_game_over"])
+        self.assertEqual(delta["result"], "0-1")
+
+    def test_delta_from_an_unknown_version_is_rejected(self):
+        response = self.client.get(f"/games/{self.game_id}/board/delta", params={"since": 5})
+        self.assertEqual(response.status_code, 400)
+
+
+class StoreCatchUpTest(unittest.IsolatedAsyncioTestCase):
+    async def test_polls_only_read_the_store_after_another_worker_stored_a_ply(self):
+        store = CountingGameStore()
+        worker, other_worker = create_registry(store), create_registry(store)
+        game_id = (await worker.create_game()).game_id
+        await other_worker.get_game(game_id)
+
+        await worker.get_game(game_id)
+        loads = store.ply_loads
+        for _ in range(3):
+            await worker.get_game(game_id)
+        self.assertEqual(store.ply_loads, loads)
+
+        other_session = await other_worker.get_game(game_id)
+        await other_session.push_move(other_session.board.parse_san("e4"))
+        loads = store.ply_loads
+        self.assertEqual((await worker.get_game(game_id)).board.fen(), other_session.board.fen())
+        self.assertEqual(store.ply_loads, loads + 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+import chess
+
+from app.chess_helper import normalize_move
+
+AFTER_E4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+# Black to move with both castling moves available
+CASTLING = "r3k2r/pppq1ppp/2npbn2/4p3/4P3/2NPBN2/PPPQ1PPP/R3K2R b KQkq - 0 1"
+
+
+class NormalizeMoveTest(unittest.TestCase):
+    def assertNormalizes(self, fen: str, raw_move: str, uci: str) -> None:
+        self.assertEqual(normalize_move(chess.Board(fen), raw_move), chess.Move.from_uci(uci), raw_move)
+
+    def test_san_is_parsed_as_is(self):
+        self.assertNormalizes(AFTER_E4, "Nf6", "g8f6")
+
+    def test_move_numbers_are_dropped(self):
+        for raw_move in ["1... e5", "1...e5", "1. e5"]:
+            self.assertNormalizes(AFTER_E4, raw_move, "e7e5")
+
+    def test_annotations_and_trailing_text_are_dropped(self):
+        for raw_move in ["e5!?", "e5+", "e5.", "'e5'", "e5 to fight for the centre"]:
+            self.assertNormalizes(AFTER_E4, raw_move, "e7e5")
+
+    def test_castling_with_zeros(self):
+        self.assertNormalizes(CASTLING, "0-0", "e8g8")
+        self.assertNormalizes(CASTLING, "0-0-0", "e8c8")
+
+    def test_uci(self):
+        self.assertNormalizes(AFTER_E4, "e7e5", "e7e5")
+        self.assertNormalizes(AFTER_E4, "G8F6", "g8f6")
+
+    def test_lowercase_piece_letter(self):
+        self.assertNormalizes(AFTER_E4, "nf6", "g8f6")
+
+    def test_unrepairable_moves(self):
+        board = chess.Board(AFTER_E4)
+        for raw_move in ["", "   ", "e4", "Nf3", "e2e4", "resign"]:
+            self.assertIsNone(normalize_move(board, raw_move), raw_move)
+
+
+if __name__ == "__main__":
+    unittest.main()
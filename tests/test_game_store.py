@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from app.game_store import MemoryGameStore, PlyConflictError, PlyRecord, SqliteGameStore
+
+
+class GameStoreContract:
+    """Tests every `GameStore` passes; `create_stores` returns a store and one sharing its games."""
+
+    def create_stores(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store, self.other_store = self.create_stores()
+        self.store.create_game("game", {"strategy": "sequential"})
+
+    def test_plies_are_loaded_in_order(self):
+        self.store.append_ply("game", PlyRecord(ply=0, uci="e2e4", memory=["1. e4"], clock=(60.0, 60.0)))
+        self.store.append_ply("game", PlyRecord(ply=1, uci="e7e5"))
+        game = self.other_store.load_game("game")
+        self.assertEqual(game.settings, {"strategy": "sequential"})
+        self.assertEqual([record.uci for record in game.plies], ["e2e4", "e7e5"])
+        self.assertEqual(game.plies[0].clock, (60.0, 60.0))
+        self.assertEqual([record.uci for record in self.other_store.load_plies("game", since=1)], ["e7e5"])
+
+    def test_storing_a_stored_ply_again_conflicts(self):
+        self.store.append_ply("game", PlyRecord(ply=0, uci="e2e4"))
+        with self.assertRaises(PlyConflictError):
+            self.other_store.append_ply("game", PlyRecord(ply=0, uci="d2d4"))
+        self.assertEqual([record.uci for record in self.store.load_game("game").plies], ["e2e4"])
+
+    def test_only_the_analysis_of_the_turn_in_progress_is_loaded(self):
+        self.store.append_analysis("game", 0, {"move": "e4"})
+        self.store.append_ply("game", PlyRecord(ply=0, uci="e2e4"))
+        self.store.append_analysis("game", 1, {"move": "e5"})
+        self.assertEqual(self.other_store.load_game("game").analysis, [{"move": "e5"}])
+
+    def test_deleted_games_are_gone(self):
+        self.assertTrue(self.store.delete_game("game"))
+        self.assertIsNone(self.other_store.load_game("game"))
+        self.assertIsNone(self.other_store.load_plies("game", since=0))
+        self.assertFalse(self.store.delete_game("game"))
+
+    def test_version_changes_when_another_worker_writes(self):
+        version = self.other_store.version()
+        self.assertEqual(self.other_store.version(), version)
+        self.store.append_ply("game", PlyRecord(ply=0, uci="e2e4"))
+        self.assertNotEqual(self.other_store.version(), version)
+
+
+class MemoryGameStoreTest(GameStoreContract, unittest.TestCase):
+    def create_stores(self):
+        store = MemoryGameStore()
+        return store, store
+
+
+class SqliteGameStoreTest(GameStoreContract, unittest.TestCase):
+    def create_stores(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "games.sqlite")
+        # two connections to one file, as two workers on a host have
+        stores = SqliteGameStore(path), SqliteGameStore(path)
+        for store in stores:
+            self.addCleanup(store.close)
+        return stores
+
+
+if __name__ == "__main__":
+    unittest.main()
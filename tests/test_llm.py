@@ -0,0 +1,55 @@
+import unittest
+
+from app.llm import LLMManager, LLMUsage
+from app.llm_backend import LLMBackend, LLMResponse, SyntheticBackend, text_format_param
+from app.llm_resource import AnalysisLLMChessMove, BaseLLMChessMove
+
+PROMPT = "FEN: rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+class BilledBackend(LLMBackend):
+    name = "billed"
+
+    async def complete(self, model, system_prompt, user_prompt, response_format, temperature=1):
+        return LLMResponse(
+            parsed=BaseLLMChessMove(move="e5", reasoning="test"),
+            input_tokens=1_000_000,
+            output_tokens=100_000,
+            billed=True,
+        )
+
+
+class LLMCostTest(unittest.IsolatedAsyncioTestCase):
+    async def call(self, backend: LLMBackend) -> LLMUsage:
+        usage = LLMUsage()
+        manager = LLMManager(backend=backend)
+        await manager.call_llm("gpt-4o", "system", PROMPT, BaseLLMChessMove, usage=usage, stage="consider_new_move")
+        await manager.close()
+        return usage
+
+    async def test_api_calls_are_charged_at_list_prices(self):
+        usage = await self.call(BilledBackend())
+        self.assertEqual(usage.calls, 1)
+        self.assertAlmostEqual(usage.cost_usd, 2.50 + 1.00)
+
+    async def test_synthetic_calls_cost_nothing(self):
+        usage = await self.call(SyntheticBackend(seed=0))
+        self.assertEqual(usage.calls, 1)
+        self.assertGreater(usage.input_tokens, 0)
+        self.assertEqual(usage.cost_usd, 0.0)
+
+
+class TextFormatTest(unittest.TestCase):
+    def test_strict_json_schema_named_after_the_format(self):
+        text_format = text_format_param(AnalysisLLMChessMove)
+        self.assertEqual(text_format["type"], "json_schema")
+        self.assertTrue(text_format["strict"])
+        self.assertEqual(text_format["name"], "AnalysisLLMChessMove")
+        schema = text_format["schema"]
+        self.assertFalse(schema["additionalProperties"])
+        self.assertEqual(schema["required"], ["move", "reasoning", "counter_moves"])
+        self.assertFalse(schema["$defs"]["CounterMove"]["additionalProperties"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import asyncio
+import random
+import unittest
+
+import httpx
+import openai
+
+from app.llm import LLMManager
+from app.llm_backend import LLMBackend, LLMResponse
+from app.llm_resilience import (
+    LLM_HEDGES,
+    LLM_RETRIES,
+    LLMTimeoutError,
+    LLMUnavailableError,
+    ResiliencePolicy,
+    failure_reason,
+    is_retryable,
+)
+from app.llm_resource import BaseLLMChessMove
+
+# a step of `ScriptedBackend` that never answers
+HANG = "hang"
+
+
+def status_error(status_code: int) -> openai.APIStatusError:
+    response = httpx.Response(status_code, request=httpx.Request("POST", "https://api.openai.com/v1/responses"))
+    return openai.APIStatusError(f"status {status_code}", response=response, body=None)
+
+
+class ScriptedBackend(LLMBackend):
+    """Answers call n with step n of its script: an error to raise, HANG, or else a move."""
+
+    name = "scripted"
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.models: list[str] = []
+        self.cancelled = 0
+
+    async def complete(self, model, system_prompt, user_prompt, response_format, temperature=1):
+        self.models.append(model)
+        call = len(self.models)
+        step = self.script.pop(0) if self.script else None
+        if isinstance(step, BaseException):
+            raise step
+        if step == HANG:
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return LLMResponse(parsed=BaseLLMChessMove(move="e5", reasoning=f"call {call}"))
+
+
+def policy(**overrides) -> ResiliencePolicy:
+    settings = dict(
+        default_deadline=5.0,
+        attempt_timeout=5.0,
+        max_retries=2,
+        backoff_base=0.001,
+        backoff_max=0.001,
+        hedge_percentile=0,
+        fallback_models={"gpt-4o": ("gpt-4o-mini",)},
+    )
+    return ResiliencePolicy(**{**settings, **overrides})
+
+
+class RetryableTest(unittest.TestCase):
+    def test_transient_errors_are_retryable(self):
+        for error in (
+            httpx.ConnectError("refused"),
+            TimeoutError(),
+            ConnectionResetError(),
+            status_error(408),
+            status_error(429),
+            status_error(500),
+            status_error(503),
+        ):
+            with self.subTest(error=repr(error)):
+                self.assertTrue(is_retryable(error))
+
+    def test_request_errors_are_not_retryable(self):
+        for error in (status_error(400), status_error(401), status_error(404), ValueError("bad move")):
+            with self.subTest(error=repr(error)):
+                self.assertFalse(is_retryable(error))
+
+    def test_failure_reasons(self):
+        self.assertEqual(failure_reason(TimeoutError()), "timeout")
+        self.assertEqual(failure_reason(status_error(429)), "429")
+        self.assertEqual(failure_reason(httpx.ConnectError("refused")), "ConnectError")
+
+    def test_backoff_is_jittered_below_an_exponential_cap(self):
+        random.seed(0)
+        backoff = policy(backoff_base=0.5, backoff_max=8.0).backoff
+        for attempt, cap in ((0, 0.5), (1, 1.0), (3, 4.0), (10, 8.0)):
+            delays = [backoff(attempt) for _ in range(200)]
+            self.assertTrue(all(0 <= delay <= cap for delay in delays))
+            self.assertGreater(max(delays), cap / 2)
+
+
+class CallLLMTest(unittest.IsolatedAsyncioTestCase):
+    async def call(self, backend: ScriptedBackend, stage: str | None = None, **overrides) -> BaseLLMChessMove:
+        manager = LLMManager(backend=backend, log_sample_rate=0, policy=policy(**overrides))
+        try:
+            return await manager.call_llm("gpt-4o", "system", "user", BaseLLMChessMove, stage=stage)
+        finally:
+            await manager.close()
+
+    async def test_retryable_errors_are_retried(self):
+        retries = LLM_RETRIES.value(model="gpt-4o", reason="503")
+        backend = ScriptedBackend(status_error(503), status_error(503))
+        answer = await self.call(backend)
+        self.assertEqual(answer.reasoning, "call 3")
+        self.assertEqual(backend.models, ["gpt-4o"] * 3)
+        self.assertEqual(LLM_RETRIES.value(model="gpt-4o", reason="503") - retries, 2)
+
+    async def test_other_errors_are_raised_at_once(self):
+        backend = ScriptedBackend(status_error(400))
+        with self.assertRaises(openai.APIStatusError):
+            await self.call(backend)
+        self.assertEqual(backend.models, ["gpt-4o"])
+
+    async def test_fallback_model_answers_once_retries_are_used_up(self):
+        backend = ScriptedBackend(*[status_error(500)] * 3)
+        answer = await self.call(backend)
+        self.assertEqual(answer.reasoning, "call 4")
+        self.assertEqual(backend.models, ["gpt-4o"] * 3 + ["gpt-4o-mini"])
+
+    async def test_unavailable_once_every_model_failed(self):
+        backend = ScriptedBackend(*[status_error(429)] * 6)
+        with self.assertRaises(LLMUnavailableError) as raised:
+            await self.call(backend)
+        self.assertEqual(backend.models, ["gpt-4o"] * 3 + ["gpt-4o-mini"] * 3)
+        self.assertEqual(raised.exception.__cause__.status_code, 429)
+
+    async def test_stage_deadline_ends_the_call(self):
+        backend = ScriptedBackend(HANG, HANG)
+        with self.assertRaises(LLMTimeoutError):
+            await self.call(backend, stage="decide_on_move", stage_deadlines={"decide_on_move": 0.05})
+        self.assertEqual(backend.models, ["gpt-4o"])
+        self.assertEqual(backend.cancelled, 1)
+
+
+class HedgeTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.backend = ScriptedBackend(HANG)
+        self.manager = LLMManager(
+            backend=self.backend, log_sample_rate=0, policy=policy(hedge_percentile=0.5, hedge_min_samples=1)
+        )
+        self.manager.latencies.record("gpt-4o", BaseLLMChessMove.__name__, 0.01)
+
+    async def asyncTearDown(self):
+        await self.manager.close()
+
+    async def test_hedge_answers_for_a_slow_primary(self):
+        wins = LLM_HEDGES.value(model="gpt-4o", winner="hedge")
+        answer = await self.manager.call_llm("gpt-4o", "system", "user", BaseLLMChessMove)
+        # let the cancellation of the primary reach the backend
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        self.assertEqual(answer.reasoning, "call 2")
+        self.assertEqual(LLM_HEDGES.value(model="gpt-4o", winner="hedge") - wins, 1)
+        # the primary is cancelled once the hedge has won
+        self.assertEqual(self.backend.cancelled, 1)
+
+    async def test_no_hedge_for_a_fast_primary(self):
+        self.backend.script = []
+        answer = await self.manager.call_llm("gpt-4o", "system", "user", BaseLLMChessMove)
+        self.assertEqual(answer.reasoning, "call 1")
+        self.assertEqual(self.backend.models, ["gpt-4o"])
+
+
+if __name__ == "__main__":
+    unittest.main()
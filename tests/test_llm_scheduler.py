@@ -0,0 +1,156 @@
+import asyncio
+import unittest
+
+import chess
+
+from app.llm_backend import LLMBackend, LLMResponse
+from app.llm_resource import BaseLLMChessMove
+from app.llm_scheduler import LLMScheduler, RateLimiter
+from app.move_schema import MoveSchemaFactory
+
+
+class GatedBackend(LLMBackend):
+    """Holds every call until `release` is set, recording the calls and those cancelled meanwhile."""
+
+    name = "gated"
+
+    def __init__(self):
+        self.calls: list[tuple[str, type]] = []
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def complete(self, model, system_prompt, user_prompt, response_format, temperature=1):
+        self.calls.append((user_prompt, response_format))
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return LLMResponse(parsed=BaseLLMChessMove(move="e5", reasoning=user_prompt), input_tokens=10, output_tokens=5)
+
+
+async def run_pending_tasks() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class LLMSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.backend = GatedBackend()
+        self.scheduler = LLMScheduler(self.backend, max_concurrent_requests=4, batch_window=0)
+
+    def submit(self, prompt: str = "prompt", response_format: type = BaseLLMChessMove, hedge: bool = False):
+        return asyncio.ensure_future(
+            self.scheduler.submit("gpt-4o", "system", prompt, response_format, hedge=hedge)
+        )
+
+    async def test_identical_calls_share_one_backend_call(self):
+        first, second = self.submit(), self.submit()
+        await run_pending_tasks()
+        self.backend.release.set()
+        (first_response, first_coalesced), (second_response, second_coalesced) = await asyncio.gather(first, second)
+
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertIs(first_response, second_response)
+        self.assertEqual((first_coalesced, second_coalesced), (False, True))
+
+    async def test_different_prompts_are_not_coalesced(self):
+        calls = [self.submit("first"), self.submit("second")]
+        await run_pending_tasks()
+        self.backend.release.set()
+        await asyncio.gather(*calls)
+        self.assertEqual(len(self.backend.calls), 2)
+
+    async def test_hedges_are_only_coalesced_with_each_other(self):
+        calls = [self.submit(), self.submit(hedge=True), self.submit(hedge=True)]
+        await run_pending_tasks()
+        self.backend.release.set()
+        results = await asyncio.gather(*calls)
+
+        self.assertEqual(len(self.backend.calls), 2)
+        self.assertEqual([coalesced for _, coalesced in results], [False, False, True])
+
+    async def test_calls_restricted_to_other_moves_are_not_coalesced(self):
+        board = chess.Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1")
+        factory = MoveSchemaFactory()
+        formats = [
+            factory.restrict(BaseLLMChessMove, board, ["e5"]),
+            factory.restrict(BaseLLMChessMove, board, ["d5"]),
+            BaseLLMChessMove,
+        ]
+        calls = [self.submit(response_format=response_format) for response_format in formats]
+        await run_pending_tasks()
+        self.backend.release.set()
+        results = await asyncio.gather(*calls)
+
+        self.assertEqual([response_format for _, response_format in self.backend.calls], formats)
+        self.assertFalse(any(coalesced for _, coalesced in results))
+
+    async def test_call_is_cancelled_when_its_last_waiter_leaves(self):
+        first, second = self.submit(), self.submit()
+        await run_pending_tasks()
+
+        first.cancel()
+        await run_pending_tasks()
+        self.assertEqual(self.backend.cancelled, 0)
+
+        second.cancel()
+        await run_pending_tasks()
+        self.assertEqual(self.backend.cancelled, 1)
+        with self.assertRaises(asyncio.CancelledError):
+            await second
+
+        # the cancelled call is no longer in flight, so the next identical one goes out again
+        third = self.submit()
+        await run_pending_tasks()
+        self.backend.release.set()
+        _, coalesced = await third
+        self.assertFalse(coalesced)
+        self.assertEqual(len(self.backend.calls), 2)
+
+    async def test_call_cancelled_before_dispatch_never_reaches_the_backend(self):
+        self.scheduler.batch_window = 10
+        call = self.submit()
+        await run_pending_tasks()
+        call.cancel()
+        await run_pending_tasks()
+
+        self.scheduler._flush()
+        await run_pending_tasks()
+        self.assertEqual(self.backend.calls, [])
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waiting_callers_are_served_in_arrival_order(self):
+        limiter = RateLimiter(tokens_per_minute=60_000)
+        await limiter.acquire(60_000)
+        served = []
+
+        async def acquire(name: str, tokens: int) -> None:
+            await limiter.acquire(tokens)
+            served.append(name)
+
+        # the small request would fit first, but arrived after the large one
+        await asyncio.gather(acquire("large", 100), acquire("small", 10))
+        self.assertEqual(served, ["large", "small"])
+
+    async def test_settle_gives_back_unused_tokens_up_to_the_limit(self):
+        limiter = RateLimiter(tokens_per_minute=1_000)
+        await limiter.acquire(300)
+        self.assertAlmostEqual(limiter._tokens, 700, delta=1)
+
+        limiter.settle(estimated_tokens=300, actual_tokens=100)
+        self.assertAlmostEqual(limiter._tokens, 900, delta=1)
+        limiter.settle(estimated_tokens=300, actual_tokens=600)
+        self.assertAlmostEqual(limiter._tokens, 600, delta=1)
+        limiter.settle(estimated_tokens=1_000, actual_tokens=0)
+        self.assertEqual(limiter._tokens, 1_000)
+
+    async def test_unlimited_limiter_never_waits(self):
+        limiter = RateLimiter()
+        self.assertFalse(limiter.limited)
+        await asyncio.wait_for(limiter.acquire(10**9), timeout=0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
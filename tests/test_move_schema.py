@@ -0,0 +1,88 @@
+import unittest
+from typing import get_args
+
+import chess
+from pydantic import ValidationError
+
+from app.llm_resource import BaseLLMChessMove, Decision, MoveSelection, for_side, move_restriction
+from app.move_schema import MoveSchemaFactory, order_moves
+
+AFTER_E4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+# Black mates with Qh4#
+FOOLS_MATE = "rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2"
+
+
+def analysis(move: str) -> dict:
+    return {"move": move, "reasoning": "test", "counter_moves": [{"counter_move": "Nf3", "reasoning": "test"}]}
+
+
+class RestrictedModelTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = MoveSchemaFactory()
+        self.board = chess.Board(AFTER_E4)
+
+    def test_restricted_model_rejects_moves_it_does_not_list(self):
+        model = self.factory.restrict(BaseLLMChessMove, self.board, ["e5", "c5"])
+        self.assertEqual(model.__name__, "BaseLLMChessMove")
+        self.assertEqual(model.model_validate({"move": "c5", "reasoning": "test"}).move, "c5")
+        for move in ("d5", "e4", "Qxf7"):
+            with self.subTest(move=move), self.assertRaises(ValidationError):
+                model.model_validate({"move": move, "reasoning": "test"})
+
+    def test_legal_moves_by_default(self):
+        model = self.factory.restrict(BaseLLMChessMove, self.board)
+        self.assertEqual(model.model_validate({"move": "Nf6", "reasoning": "test"}).move, "Nf6")
+        with self.assertRaises(ValidationError):
+            model.model_validate({"move": "Ke7", "reasoning": "test"})
+
+    def test_candidates_of_a_selection_are_restricted_as_well(self):
+        model = self.factory.restrict(MoveSelection, self.board, ["e5", "c5"])
+        selection = {"candidates": [analysis("e5"), analysis("c5")], "move": "e5", "reasoning": "test"}
+        self.assertEqual(model.model_validate(selection).move, "e5")
+        with self.assertRaises(ValidationError):
+            model.model_validate({**selection, "candidates": [analysis("e5"), analysis("d5")]})
+
+    def test_white_formats_keep_their_side(self):
+        board = chess.Board()
+        model = self.factory.restrict(for_side(MoveSelection, chess.WHITE), board, ["e4", "d4"])
+        (candidate,) = get_args(model.model_fields["candidates"].annotation)
+        self.assertIn("White", candidate.model_fields["move"].description)
+
+    def test_formats_without_a_move_are_unchanged(self):
+        self.assertIs(self.factory.restrict(Decision, self.board), Decision)
+
+    def test_restriction_digest_differs_per_move_set(self):
+        first = self.factory.restrict(BaseLLMChessMove, self.board, ["e5", "c5"])
+        second = self.factory.restrict(BaseLLMChessMove, self.board, ["e5", "d5"])
+        same = MoveSchemaFactory().restrict(BaseLLMChessMove, self.board, ["e5", "c5"])
+        self.assertIsNone(move_restriction(BaseLLMChessMove))
+        self.assertNotEqual(move_restriction(first), move_restriction(second))
+        self.assertEqual(move_restriction(first), move_restriction(same))
+
+    def test_models_are_cached_per_position(self):
+        model = self.factory.restrict(BaseLLMChessMove, self.board)
+        self.assertIs(self.factory.restrict(BaseLLMChessMove, chess.Board(AFTER_E4)), model)
+        self.assertIsNot(self.factory.restrict(BaseLLMChessMove, chess.Board()), model)
+        self.assertIsNot(self.factory.restrict(BaseLLMChessMove, self.board, ["e5"]), model)
+
+    def test_cache_keeps_the_most_recent_positions(self):
+        factory = MoveSchemaFactory(cache_size=1)
+        model = factory.restrict(BaseLLMChessMove, self.board)
+        factory.restrict(BaseLLMChessMove, chess.Board())
+        self.assertIsNot(factory.restrict(BaseLLMChessMove, self.board), model)
+
+
+class TopKTest(unittest.TestCase):
+    def test_mate_is_ordered_first(self):
+        board = chess.Board(FOOLS_MATE)
+        self.assertEqual(board.san(order_moves(board)[0]), "Qh4#")
+
+    def test_top_k_admits_only_the_most_forcing_moves(self):
+        model = MoveSchemaFactory(top_k=1).restrict(BaseLLMChessMove, chess.Board(FOOLS_MATE))
+        self.assertEqual(model.model_validate({"move": "Qh4#", "reasoning": "test"}).move, "Qh4#")
+        with self.assertRaises(ValidationError):
+            model.model_validate({"move": "e6", "reasoning": "test"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from app.llm_resource import AnalysisLLMChessMove
+from app.prompt_builder import PromptBuilder
+from app.prompts import CONSIDER_NEW_MOVE_USER_PROMPT
+
+POSITION = "FEN: rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+REASONING = "It fights for the centre. " + "It also keeps every option open for the pieces behind it. " * 10
+GAME_MEMORY = [f"{move}: {REASONING}" for move in ("e5", "Nc6", "Nf6")]
+ANALYSES = [AnalysisLLMChessMove(move=move, reasoning=REASONING, counter_moves=[]) for move in ("e5", "c5", "d5")]
+
+
+def build(max_input_tokens: int):
+    builder = PromptBuilder(max_input_tokens=max_input_tokens)
+    return builder.build(
+        CONSIDER_NEW_MOVE_USER_PROMPT, position=POSITION, game_memory=GAME_MEMORY, analysis_memory=ANALYSES
+    )
+
+
+def move_context(user_prompt: str) -> str:
+    return user_prompt[:user_prompt.index("</previous_moves>")]
+
+
+class PromptBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.full = build(max_input_tokens=100_000)
+
+    def test_prompts_within_budget_are_untouched(self):
+        self.assertFalse(self.full.trimmed)
+        self.assertEqual(self.full.user_prompt.count(REASONING), 6)
+
+    def test_analyses_are_trimmed_before_the_shared_move_context(self):
+        # older analyses shortened to their first sentence
+        prompt = build(max_input_tokens=self.full.estimated_tokens - 200)
+        self.assertTrue(prompt.trimmed)
+        self.assertEqual(move_context(prompt.user_prompt), move_context(self.full.user_prompt))
+        self.assertIn("e5: It fights for the centre.\n", prompt.user_prompt)
+        self.assertIn(f"d5: {REASONING}", prompt.user_prompt)
+
+        # then bare moves, still before any previous move is dropped
+        prompt = build(max_input_tokens=self.full.estimated_tokens - 400)
+        self.assertEqual(move_context(prompt.user_prompt), move_context(self.full.user_prompt))
+        self.assertIn("<considered_moves>\ne5\nc5\nd5\n</considered_moves>", prompt.user_prompt)
+
+    def test_previous_moves_are_dropped_last_oldest_first(self):
+        prompt = build(max_input_tokens=self.full.estimated_tokens - 550)
+        self.assertTrue(prompt.trimmed)
+        self.assertLessEqual(prompt.estimated_tokens, self.full.estimated_tokens - 550)
+        self.assertNotIn("e5: It", move_context(prompt.user_prompt))
+        self.assertIn("Nc6: It", move_context(prompt.user_prompt))
+        self.assertIn("Nf6: It", move_context(prompt.user_prompt))
+
+if __name__ == "__main__":
+    unittest.main()
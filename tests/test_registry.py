@@ -0,0 +1,97 @@
+import threading
+import unittest
+
+import chess
+
+from app.game_store import MemoryGameStore, PlyConflictError
+from app.llm import LLMManager
+from app.llm_backend import SyntheticBackend
+from app.session import GameNotFoundError, GameRegistry
+
+
+class GameRegistryTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = GameRegistry(max_games=2, llm_manager=LLMManager(backend=SyntheticBackend(seed=0)))
+
+    async def test_cap_evicts_the_least_recently_used_game(self):
+        first, second = await self.registry.create_game(), await self.registry.create_game()
+        await self.registry.get_game(first.game_id)
+        third = await self.registry.create_game()
+        with self.assertRaises(GameNotFoundError):
+            await self.registry.get_game(second.game_id)
+        self.assertIs(await self.registry.get_game(first.game_id), first)
+        self.assertIs(await self.registry.get_game(third.game_id), third)
+
+    async def test_cap_keeps_games_in_the_middle_of_a_turn(self):
+        first, second = await self.registry.create_game(), await self.registry.create_game()
+        async with first.lock:
+            third = await self.registry.create_game()
+            self.assertIs(await self.registry.get_game(first.game_id), first)
+            with self.assertRaises(GameNotFoundError):
+                await self.registry.get_game(second.game_id)
+
+            async with third.lock:
+                # every other game is busy: the new one is added over the cap
+                fourth = await self.registry.create_game()
+            self.assertEqual(len(self.registry), 3)
+            self.assertIs(await self.registry.get_game(fourth.game_id), fourth)
+
+
+STORE_METHODS = {"create_game", "load_game", "load_plies", "append_ply", "append_analysis", "delete_game", "version"}
+
+
+class OffLoopGameStore(MemoryGameStore):
+    """Fails every call made on the event loop's thread."""
+
+    def __getattribute__(self, name):
+        method = super().__getattribute__(name)
+        if name not in STORE_METHODS:
+            return method
+
+        def off_loop(*args):
+            if threading.current_thread() is threading.main_thread():
+                raise AssertionError(f"{name} called on the event loop")
+            return method(*args)
+
+        return off_loop
+
+
+class StoreThreadingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_store_calls_run_off_the_event_loop(self):
+        store = OffLoopGameStore()
+        worker, other_worker = (
+            GameRegistry(llm_manager=LLMManager(backend=SyntheticBackend(seed=0)), store=store) for _ in range(2)
+        )
+        session = await worker.create_game()
+        await session.push_move(chess.Move.from_uci("e2e4"))
+
+        other_session = await other_worker.get_game(session.game_id)
+        self.assertEqual(other_session.board.fen(), session.board.fen())
+        await other_session.push_move(chess.Move.from_uci("e7e5"))
+        self.assertEqual((await worker.get_game(session.game_id)).board.fen(), other_session.board.fen())
+
+        await worker.delete_game(session.game_id)
+        with self.assertRaises(GameNotFoundError):
+            await other_worker.get_game(session.game_id)
+
+
+    async def test_a_stale_game_deleted_by_another_worker_is_unloaded(self):
+        store = MemoryGameStore()
+        worker, other_worker = (
+            GameRegistry(llm_manager=LLMManager(backend=SyntheticBackend(seed=0)), store=store) for _ in range(2)
+        )
+        session = await worker.create_game()
+        other_session = await other_worker.get_game(session.game_id)
+        await other_session.push_move(chess.Move.from_uci("e2e4"))
+        with self.assertRaises(PlyConflictError):
+            await session.push_move(chess.Move.from_uci("d2d4"))
+        self.assertTrue(session.stale)
+
+        await other_worker.delete_game(session.game_id)
+        with self.assertRaises(GameNotFoundError):
+            await worker.get_game(session.game_id)
+        self.assertEqual(len(worker), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import chess
+
+from app.llm import LLMManager
+from app.llm_backend import SyntheticBackend
+from app.main import stream_llm_agent_move
+from app.move_provider import MoveProvider
+from app.session import GameRegistry
+
+
+class StalledMoveProvider(MoveProvider):
+    """Thinks until it is cancelled, like an LLM call that never returns."""
+
+    name = "stalled"
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def choose_move(self, board, position, budget=None):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+class DisconnectedRequest:
+    async def is_disconnected(self) -> bool:
+        return True
+
+
+class StreamDisconnectTest(unittest.IsolatedAsyncioTestCase):
+    async def test_disconnect_without_events_cancels_the_turn_before_releasing_the_game(self):
+        registry = GameRegistry(llm_manager=LLMManager(backend=SyntheticBackend(seed=0)))
+        session = await registry.create_game()
+        await session.push_move(chess.Move.from_uci("e2e4"))
+        session.move_provider = provider = StalledMoveProvider()
+
+        with mock.patch("app.main.DISCONNECT_POLL_SECONDS", 0.01):
+            response = await stream_llm_agent_move(request=DisconnectedRequest(), move_time=None, session=session)
+            events = [event async for event in response.body_iterator]
+
+        self.assertEqual(events, [])
+        self.assertTrue(provider.cancelled)
+        self.assertFalse(session.lock.locked())
+        self.assertEqual(session.board.fen(), "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1")
+
+
+if __name__ == "__main__":
+    unittest.main()
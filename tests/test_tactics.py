@@ -0,0 +1,113 @@
+import unittest
+
+import chess
+
+from app.tactics import AttackTable, TacticalAnalyser, rank_moves
+
+
+def capture_values(fen: str) -> dict[str, int]:
+    board = chess.Board(fen)
+    table = AttackTable(board)
+    return {board.san(move): table.capture_value(move) for move in board.legal_moves if board.is_capture(move)}
+
+
+def ranked(fen: str, moves: list[str]) -> list[str]:
+    board = chess.Board(fen)
+    return [board.san(move) for move in rank_moves(board, [board.parse_san(move) for move in moves])]
+
+
+def is_mate_in_two(board: chess.Board, move: chess.Move) -> bool:
+    """Brute force: after `move`, every reply allows a mate in one."""
+    board = board.copy()
+    board.push(move)
+    if board.is_game_over():
+        return False
+    for reply in list(board.legal_moves):
+        board.push(reply)
+        mates = False
+        for mate in list(board.legal_moves):
+            board.push(mate)
+            mates = board.is_checkmate()
+            board.pop()
+            if mates:
+                break
+        board.pop()
+        if not mates:
+            return False
+    return True
+
+
+class StaticExchangeTest(unittest.TestCase):
+    def test_undefended_capture_wins_the_piece(self):
+        self.assertEqual(capture_values("4k3/8/8/3p4/8/8/8/3QK3 w - - 0 1"), {"Qxd5": 100})
+
+    def test_defended_pawn_costs_the_rook(self):
+        self.assertEqual(capture_values("4k3/8/4p3/3p4/8/8/8/3RK3 w - - 0 1"), {"Rxd5": -400})
+
+    def test_xray_attacker_joins_the_exchange(self):
+        self.assertEqual(capture_values("3rk3/8/8/3p4/8/8/3R4/3RK3 w - - 0 1"), {"Rxd5": 100})
+
+    def test_en_passant(self):
+        self.assertEqual(capture_values("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1"), {"exd6": 100})
+
+
+class TacticalAnalyserTest(unittest.TestCase):
+    def setUp(self):
+        self.analyser = TacticalAnalyser()
+
+    def test_mate_in_one(self):
+        summary = self.analyser.summarize(chess.Board("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1"))
+        self.assertEqual(summary.mates_in_one, ["Ra8#"])
+        self.assertEqual(summary.mates_in_two, [])
+
+    def test_mate_in_two(self):
+        board = chess.Board("2r4r/2p1b1k1/2PQP1p1/6P1/b5Pp/p6N/6KR/8 w - - 1 52")
+        summary = self.analyser.summarize(board)
+        self.assertEqual(summary.mates_in_one, [])
+        self.assertEqual(summary.mates_in_two, ["Qxe7+"])
+        for san in summary.mates_in_two:
+            self.assertTrue(is_mate_in_two(board, board.parse_san(san)))
+
+    def test_mate_threat(self):
+        summary = self.analyser.summarize(chess.Board("6k1/5ppp/8/8/8/8/5PPP/R5K1 b - - 0 1"))
+        self.assertEqual(summary.mate_threats, ["Ra8#"])
+
+    def test_hanging_pieces(self):
+        summary = self.analyser.summarize(chess.Board("4k3/8/8/3p4/8/8/8/3QK3 w - - 0 1"))
+        self.assertEqual(summary.opponent_hanging, ["d5 (-1)"])
+        self.assertEqual(summary.hanging, [])
+
+    def test_pinner_is_the_nearest_piece_beyond_the_pinned_one(self):
+        summary = self.analyser.summarize(chess.Board("4R3/8/8/4n3/4k3/8/4p3/4Q1K1 b - - 0 1"))
+        self.assertEqual(summary.pins, ["e2 pinned to its king by Qe1", "Ne5 pinned to its king by Re8"])
+
+    def test_pin_along_a_rank(self):
+        summary = self.analyser.summarize(chess.Board("4k3/8/8/8/8/8/8/rN2K3 w - - 0 1"))
+        self.assertEqual(summary.pins, ["Nb1 pinned to its king by Ra1"])
+
+    def test_summaries_are_cached_by_position(self):
+        board = chess.Board()
+        self.assertIs(self.analyser.summarize(board), self.analyser.summarize(board.copy()))
+
+
+class RankMovesTest(unittest.TestCase):
+    def test_mates_come_first(self):
+        fen = "rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2"
+        self.assertEqual(ranked(fen, ["Nc6", "Qh4#"]), ["Qh4#", "Nc6"])
+
+    def test_moves_allowing_a_mate_come_last(self):
+        self.assertEqual(ranked("6k1/5ppp/8/8/8/8/5PPP/R5K1 b - - 0 1", ["Kh8", "h6"]), ["h6", "Kh8"])
+
+    def test_material_won_and_lost(self):
+        self.assertEqual(ranked("4k3/8/8/3p4/8/8/8/3QK3 w - - 0 1", ["Qd2", "Qxd5"]), ["Qxd5", "Qd2"])
+        self.assertEqual(ranked("4k3/8/4p3/3p4/8/8/8/3RK3 w - - 0 1", ["Rxd5", "Rd2"]), ["Rd2", "Rxd5"])
+        # the queen is lost to the knight
+        fen = "rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2"
+        self.assertEqual(ranked(fen, ["Qg5", "Nc6"]), ["Nc6", "Qg5"])
+
+    def test_equal_moves_keep_their_order(self):
+        self.assertEqual(ranked(chess.STARTING_FEN, ["e4", "d4", "Nf3"]), ["e4", "d4", "Nf3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import chess
+
+from app.resource import TimeControl
+from app.time_control import GameClock, TimeManager
+
+AFTER_E4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+def allocate(
+    time_control: TimeControl, fen: str = AFTER_E4, remaining: float | None = None, complexity: float = 0.5
+) -> float:
+    """The budget with the clocks stopped, so that no time passes while it is computed."""
+    clock = GameClock(time_control)
+    if remaining is not None:
+        clock.remaining[chess.BLACK] = remaining
+    return TimeManager().allocate(clock, chess.Board(fen), complexity=complexity)
+
+
+class TimeManagerTest(unittest.TestCase):
+    def test_sudden_death_splits_the_time_over_an_estimate_of_the_moves_left(self):
+        # 300s over 40 moves, less the safety margin
+        self.assertAlmostEqual(allocate(TimeControl(initial_seconds=300)), 7.0)
+
+    def test_the_estimate_shrinks_as_the_game_goes_on(self):
+        late = "4k3/8/8/8/8/8/8/4K3 b - - 0 60"
+        self.assertAlmostEqual(allocate(TimeControl(initial_seconds=300), fen=late), 300 / 15 - 0.5)
+
+    def test_moves_to_the_next_time_control(self):
+        self.assertAlmostEqual(allocate(TimeControl(initial_seconds=60, moves_to_go=10)), 5.5)
+
+    def test_most_of_the_increment_is_spent(self):
+        self.assertAlmostEqual(allocate(TimeControl(initial_seconds=300, increment_seconds=2)), 7.5 + 1.6 - 0.5)
+
+    def test_complexity_scales_the_budget(self):
+        time_control = TimeControl(initial_seconds=300)
+        self.assertAlmostEqual(allocate(time_control, complexity=0.0), 7.5 * 0.5 - 0.5)
+        self.assertAlmostEqual(allocate(time_control, complexity=1.0), 7.5 * 1.5 - 0.5)
+
+    def test_budget_is_capped_by_a_fraction_of_the_remaining_time(self):
+        time_control = TimeControl(initial_seconds=300, increment_seconds=30)
+        self.assertAlmostEqual(allocate(time_control, remaining=40, complexity=1.0), 40 * 0.25 - 0.5)
+
+    def test_short_budgets_keep_half_instead_of_the_safety_margin(self):
+        # the 1s minimum is capped to a quarter of the 2s left
+        self.assertAlmostEqual(allocate(TimeControl(initial_seconds=300), remaining=2), 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from app.tracing import TRACING_SPANS, DeferredTracer, DropPolicy, LangfuseTracer, Tracer, configure_tracing, tracer
+
+
+class SpanQueueTest(unittest.TestCase):
+    def trace_turns(self, drop_policy: DropPolicy, turns: int) -> list[str]:
+        """Names of the spans left in a queue of two after `turns` traced turns."""
+        langfuse = LangfuseTracer(queue_size=2, drop_policy=drop_policy)
+        for turn in range(turns):
+            langfuse.observe(f"turn-{turn}")(lambda: None)()
+        queued = []
+        while not langfuse._queue.empty():
+            queued.append(langfuse._queue.get_nowait().name)
+        return queued
+
+    def setUp(self):
+        # nothing leaves the queue, so what it keeps is what a stalled exporter would see
+        patcher = mock.patch.object(LangfuseTracer, "_start_exporter")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dropped = TRACING_SPANS.value(status="dropped")
+
+    def test_newest_policy_drops_the_span_that_does_not_fit(self):
+        self.assertEqual(self.trace_turns(DropPolicy.NEWEST, turns=5), ["turn-0", "turn-1"])
+        self.assertEqual(TRACING_SPANS.value(status="dropped") - self.dropped, 3)
+
+    def test_oldest_policy_makes_room_for_the_new_span(self):
+        self.assertEqual(self.trace_turns(DropPolicy.OLDEST, turns=5), ["turn-3", "turn-4"])
+        self.assertEqual(TRACING_SPANS.value(status="dropped") - self.dropped, 3)
+
+    def test_nothing_is_dropped_below_the_bound(self):
+        self.assertEqual(self.trace_turns(DropPolicy.NEWEST, turns=2), ["turn-0", "turn-1"])
+        self.assertEqual(TRACING_SPANS.value(status="dropped") - self.dropped, 0)
+
+
+class ConfigureTracingTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(LangfuseTracer, "_start_exporter")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tracing_is_off_until_configured(self):
+        deferred = DeferredTracer()
+        self.assertFalse(deferred.enabled)
+        self.assertFalse(deferred.observe()(deferred.is_recording)())
+
+    def test_functions_decorated_before_configuring_are_traced(self):
+        configure_tracing(Tracer())
+        self.addCleanup(configure_tracing, Tracer())
+        observed = tracer.observe("turn")(tracer.is_recording)
+        self.assertFalse(observed())
+
+        langfuse = LangfuseTracer()
+        self.assertIs(configure_tracing(langfuse), langfuse)
+        self.assertTrue(tracer.enabled)
+        self.assertTrue(observed())
+        self.assertEqual(langfuse._queue.get_nowait().name, "turn")
+
+
+if __name__ == "__main__":
+    unittest.main()